@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    Accumulation and defuzzification for a whole batch of inputs at once.
+
+    For each consequent, the term activations for the batch are an array
+    of shape (batch, terms).  Cutting each term at its activation gives a
+    (batch, terms, universe) array; taking the maximum over the terms
+    gives a (batch, universe) array; then each defuzzification method here
+    works on all the rows in one go.  As in skfuzzy, the consequent's
+    accumulation method has already been used to combine the rules for
+    each term (into its activation), so it isn't used again here.
+
+    Unlike skfuzzy, we don't add the points where each term crosses its
+    activation level to the universe (these differ from row to row), so the
+    answers are those for the membership functions sampled at the universe
+    points: close to skfuzzy's for a reasonably fine universe.
+    A row with nothing in its output set (no rule fired) defuzzifies to NaN.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Cut and defuzzify at most this many (rows x terms x universe) points at
+# once, so the tensor for a large batch stays a reasonable size (32MiB):
+_MAX_TENSOR_POINTS = 2 ** 22
+
+
+def chunk_rows(num_terms, num_points, max_points=_MAX_TENSOR_POINTS):
+    '''How many rows to do at once, for terms over a universe this size'''
+    return max(1, max_points // max(1, num_terms * num_points))
+
+
+def activation_tensor(term_mfs, weights):
+    '''
+        Cut each term (a list of membership arrays) at its activation, for
+        each row of the (batch, terms) weights, giving an array of shape
+        (batch, terms, universe).
+    '''
+    term_mfs = np.stack(term_mfs)
+    return np.fmin(term_mfs[np.newaxis, :, :], weights[:, :, np.newaxis])
+
+
+def accumulate(tensor):
+    '''
+        Combine the cut terms in the (batch, terms, universe) tensor by
+        taking their maximum, as skfuzzy does when defuzzifying.
+    '''
+    return np.max(tensor, axis=1)
+
+
+def _segments(universe, mfs):
+    '''The x-width and the y-values at each end of every line segment'''
+    return np.diff(universe), mfs[:, :-1], mfs[:, 1:]
+
+
+def _segment_areas(universe, mfs):
+    '''The area under each segment, for each row: (batch, points-1)'''
+    dx, y1, y2 = _segments(universe, mfs)
+    return 0.5 * dx * (y1 + y2)
+
+
+def centroid(universe, mfs):
+    '''The centroid of each row, treating each as piecewise linear'''
+    dx, y1, y2 = _segments(universe, mfs)
+    x1, x2 = universe[:-1], universe[1:]
+    moments = dx * (y1 * (2 * x1 + x2) + y2 * (x1 + 2 * x2)) / 6
+    areas = 0.5 * dx * (y1 + y2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return moments.sum(axis=1) / areas.sum(axis=1)
+
+
+def bisector(universe, mfs):
+    '''The point that divides the area of each row in two'''
+    areas = _segment_areas(universe, mfs)
+    accum = np.cumsum(areas, axis=1)
+    half = accum[:, -1] / 2
+    index = np.argmax(accum >= half[:, np.newaxis], axis=1)
+    rows = np.arange(len(mfs))
+    # Now find how far into the segment we need to go for the rest:
+    rest = half - (accum[rows, index] - areas[rows, index])
+    x1, dx = universe[index], np.diff(universe)[index]
+    y1, y2 = mfs[rows, index], mfs[rows, index + 1]
+    slope = (y2 - y1) / dx
+    # Solve y1*t + slope*t^2/2 = rest, in a form that's OK if slope is 0:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        root = np.sqrt(np.fmax(y1 * y1 + 2 * slope * rest, 0))
+        dist = 2 * rest / (y1 + root)
+        return np.where(half > 0, x1 + dist, np.nan)
+
+
+def _at_max(mfs):
+    '''Where each row is at its maximum (and that max is nonzero)'''
+    row_max = np.max(mfs, axis=1, keepdims=True)
+    return (mfs == row_max) & (row_max > 0)
+
+
+def mom(universe, mfs):
+    '''The mean of the universe points where each row is at its maximum'''
+    at_max = _at_max(mfs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (at_max * universe).sum(axis=1) / at_max.sum(axis=1)
+
+
+def som(universe, mfs):
+    '''The smallest universe point where each row is at its maximum'''
+    at_max = _at_max(mfs)
+    return np.where(at_max.any(axis=1),
+                    universe[np.argmax(at_max, axis=1)], np.nan)
+
+
+def lom(universe, mfs):
+    '''The largest universe point where each row is at its maximum'''
+    at_max = _at_max(mfs)[:, ::-1]
+    return np.where(at_max.any(axis=1),
+                    universe[::-1][np.argmax(at_max, axis=1)], np.nan)
+
+
+# Keyed by the skfuzzy method names:
+_BATCH_DEFUZZ = OrderedDict([
+    ('centroid', centroid),
+    ('bisector', bisector),
+    ('mom',      mom),
+    ('som',      som),
+    ('lom',      lom),
+])
+
+
+def defuzz(universe, mfs, method):
+    '''Defuzzify each row of the (batch, universe) membership values'''
+    mfs = np.atleast_2d(mfs).astype(np.float64)
+    return _BATCH_DEFUZZ[method](np.asarray(universe, dtype=np.float64), mfs)
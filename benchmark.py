@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''
+    Time the controllers in the Examples directory (or any FCL files):
+    how long each takes to parse, to build its control system, and to
+    simulate the inputs from its FLD file at several batch sizes.
+
+    For each batch size, the FLD inputs are repeated as needed to make
+    up the batches, which are run with simulate_batch; we report the rows
+    per second, the p50 and p99 latency per row, and the peak memory
+    allocated while running a batch (measured separately, since tracing
+    slows things).  A row's latency is the time until its results are
+    back, i.e. the time for its whole batch; for a batch size of 1 this
+    is just the time for a single-row call.  Each size is run at least
+    _MIN_BATCHES times, so that there are enough samples for the p99.
+
+        results = run_benchmarks(['Examples'], sizes=(1, 100))
+        save_baseline(results, 'baseline.json')
+        ...
+        for regression in compare(results, load_baseline('baseline.json')):
+            print(regression)
+
+    From the command line, give a baseline file and some FCL files or
+    directories (Examples by default); the results are compared with the
+    baseline if it exists (exiting with status 1 on any regression), or
+    saved as the baseline if it doesn't.
+'''
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import tracemalloc
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData, _FCL_SUFFIX
+
+_DEFAULT_SIZES = (1, 10, 100, 1000)   # Rows per batch
+_MIN_BATCHES = 100   # Run at least this many batches of each size ...
+_MIN_ROWS = 200      # ... and at least this many rows in total
+_PARSE_REPEATS = 3   # Take the best of this many parses (and builds)
+
+# Flag a change bigger than this fraction of the baseline ...
+_DEFAULT_THRESHOLD = 0.2
+# ... unless it's a time difference smaller than this (seconds):
+_TIME_SLACK = 5e-5
+
+# What we compare for each batch size (only rows_per_sec is better bigger):
+_METRICS = ('rows_per_sec', 'p50_ms', 'p99_ms', 'peak_bytes')
+
+
+def find_fcl_files(paths):
+    '''The FCL files given, or in the given directories (and subdirs)'''
+    fclfiles = []
+    for path in paths:
+        if not os.path.isdir(path):
+            fclfiles.append(path)
+            continue
+        for dirpath, _, files in sorted(os.walk(path)):
+            fclfiles.extend(os.path.join(dirpath, filename)
+                            for filename in sorted(files)
+                            if filename.endswith(_FCL_SUFFIX))
+    return fclfiles
+
+
+def _best_time(func, repeats):
+    '''The shortest time for the function, and its result from that run'''
+    best = None
+    for _ in range(repeats):
+        start = default_timer()
+        result = func()
+        secs = default_timer() - start
+        if best is None or secs < best[0]:
+            best = (secs, result)
+    return best
+
+
+def _batches(input_data, size, num_batches):
+    '''Batches of the given size, going round the input rows as needed'''
+    num_rows = input_data.num_tests
+    for num in range(num_batches):
+        batch = TestData(input_data.names, size)
+        batch.value = input_data.value[
+            np.arange(num * size, (num + 1) * size) % num_rows]
+        yield batch
+
+
+def bench_size(harness, input_data, size, min_rows=_MIN_ROWS,
+               min_batches=_MIN_BATCHES):
+    '''Time the harness on batches of the given size; return the stats'''
+    num_batches = max(min_batches, -(-min_rows // size))
+    batch_secs = []  # The latency for every row in the batch
+    for batch in _batches(input_data, size, num_batches):
+        start = default_timer()
+        harness.simulate_batch(batch)
+        batch_secs.append(default_timer() - start)
+    total = sum(batch_secs)
+    # Now the memory, for one batch:
+    batch = next(_batches(input_data, size, 1))
+    tracemalloc.start()
+    try:
+        harness.simulate_batch(batch)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return OrderedDict([
+        ('rows_per_sec', size * num_batches / total if total else 0.0),
+        ('p50_ms', 1000 * float(np.percentile(batch_secs, 50))),
+        ('p99_ms', 1000 * float(np.percentile(batch_secs, 99))),
+        ('peak_bytes', int(peak))])
+
+
+def bench_controller(fclfile, sizes=_DEFAULT_SIZES, engine='sampled',
+                     min_rows=_MIN_ROWS, min_batches=_MIN_BATCHES):
+    '''Time parsing, building and simulating one controller'''
+    harness = SimulationHarness(engine=engine)
+    parse_secs, parser = _best_time(
+        lambda: FCLParser().read_fcl_file(fclfile), _PARSE_REPEATS)
+    build_secs, _ = _best_time(lambda: harness.use_parser(parser),
+                               _PARSE_REPEATS)
+    input_data, _, _ = harness.read_fld_file(
+        harness.make_fld_filename(fclfile))
+    result = OrderedDict([('parse_ms', 1000 * parse_secs),
+                          ('build_ms', 1000 * build_secs),
+                          ('fld_rows', input_data.num_tests),
+                          ('sizes', OrderedDict())])
+    for size in sizes:
+        result['sizes'][str(size)] = bench_size(harness, input_data, size,
+                                                min_rows, min_batches)
+    return result
+
+
+def run_benchmarks(paths=('Examples',), sizes=_DEFAULT_SIZES,
+                   engine='sampled', min_rows=_MIN_ROWS,
+                   min_batches=_MIN_BATCHES, verbose=False):
+    '''
+        Benchmark every controller (with an FLD file) in the given paths;
+        return a dict from FCL file to its results.
+    '''
+    results = OrderedDict()
+    for fclfile in find_fcl_files(paths):
+        if not os.path.isfile(SimulationHarness().make_fld_filename(fclfile)):
+            continue
+        results[fclfile] = bench_controller(fclfile, sizes, engine, min_rows,
+                                            min_batches)
+        if verbose:
+            print(format_result(fclfile, results[fclfile]))
+    return results
+
+
+def format_result(fclfile, result):
+    '''A few lines of text for one controller's results'''
+    lines = ['{}: parse {:.2f}ms, build {:.2f}ms'.format(
+        fclfile, result['parse_ms'], result['build_ms'])]
+    for size, stats in result['sizes'].items():
+        lines.append('{:>8} rows/batch: {:10.1f} rows/s, p50 {:.3f}ms, '
+                     'p99 {:.3f}ms, peak {:.1f}KiB'.format(
+                         size, stats['rows_per_sec'], stats['p50_ms'],
+                         stats['p99_ms'], stats['peak_bytes'] / 1024))
+    return '\n'.join(lines)
+
+
+def save_baseline(results, filename):
+    '''Save the results as JSON, to compare later runs with'''
+    with open(filename, 'w') as fileh:
+        json.dump(results, fileh, indent=2)
+
+
+def load_baseline(filename):
+    '''Read results saved by save_baseline'''
+    with open(filename) as fileh:
+        return json.load(fileh, object_pairs_hook=OrderedDict)
+
+
+def _worse(metric, base, got, threshold):
+    '''Is the new value worse than the baseline by more than threshold?'''
+    if metric == 'rows_per_sec':
+        return got < base * (1 - threshold)
+    if metric.endswith('_ms') and (got - base) / 1000 < _TIME_SLACK:
+        return False
+    return got > base * (1 + threshold)
+
+
+def compare(results, baseline, threshold=_DEFAULT_THRESHOLD):
+    '''
+        Compare the results with the baseline, for the controllers and
+        batch sizes in both; return a list of the regressions, each
+        (FCL file, batch size or None, metric, baseline value, new value).
+    '''
+    regressions = []
+    for fclfile, result in results.items():
+        if fclfile not in baseline:
+            continue
+        base = baseline[fclfile]
+        for metric in ('parse_ms', 'build_ms'):
+            if _worse(metric, base[metric], result[metric], threshold):
+                regressions.append((fclfile, None, metric, base[metric],
+                                    result[metric]))
+        for size, stats in result['sizes'].items():
+            if size not in base['sizes']:
+                continue
+            for metric in _METRICS:
+                base_value = base['sizes'][size][metric]
+                if _worse(metric, base_value, stats[metric], threshold):
+                    regressions.append((fclfile, int(size), metric,
+                                        base_value, stats[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: {} baseline.json [fcl-file-or-dir ...]'
+              .format(sys.argv[0]))
+        sys.exit(1)
+    _RESULTS = run_benchmarks(sys.argv[2:] or ['Examples'], verbose=True)
+    if not os.path.isfile(sys.argv[1]):
+        save_baseline(_RESULTS, sys.argv[1])
+        print('Saved baseline to', sys.argv[1])
+        sys.exit(0)
+    _REGRESSIONS = compare(_RESULTS, load_baseline(sys.argv[1]))
+    for _FCLFILE, _SIZE, _METRIC, _BASE, _GOT in _REGRESSIONS:
+        print('REGRESSION {} {}: {} was {:.4g}, now {:.4g}'.format(
+            _FCLFILE, '' if _SIZE is None else '({} rows/batch)'.format(_SIZE),
+            _METRIC, _BASE, _GOT))
+    sys.exit(1 if _REGRESSIONS else 0)
@@ -21,18 +21,39 @@ def singletonmf(x, xpt):
     return mf
 
 
-def pointsetmf(x, pointset, method='linear'):
-    '''Interpolate from a point-set using the chosen interpolation method'''
+def extend_pointset(pointset, x_min, x_max):
+    '''
+        Sort the point-set, and extend it to cover the range [x_min, x_max].
+        Lead on left from y=0, and trail on right from the last y value.
+    '''
     # Make sure we're in ascending order first:
     pointset = sorted(pointset, key=lambda p: p[0])
-    x_min, x_max = x[0], x[-1]
     # Lead on left from y=0, unless otherwise specified:
     if pointset[0][0] > x_min:
         pointset = [(x_min, 0)] + pointset
     # Trail on right from last given y value
     if pointset[-1][0] < x_max:
         pointset = pointset + [(x_max, pointset[-1][1])]
-    px, py = [p[0] for p in pointset], [p[1] for p in pointset]
+    return pointset
+
+
+def pointset_arrays(pointset):
+    '''Return the x and y values of the point-set, in ascending x order'''
+    points = np.asarray(pointset, dtype=np.float64).reshape(-1, 2)
+    order = np.argsort(points[:, 0], kind='mergesort')  # Stable, like sorted
+    return points[order, 0], points[order, 1]
+
+
+# Interpolators are cached by their points, so a term is only set up once:
+_INTERPOLATORS = {}
+_MAX_CACHED_INTERPOLATORS = 1024
+
+
+def pointset_interpolator(px, py, method='linear'):
+    '''Return a function that interpolates the given (sorted) points'''
+    key = (method, tuple(px), tuple(py))
+    if key in _INTERPOLATORS:
+        return _INTERPOLATORS[key]
     if method == 'linear':
         f = interp.interp1d(px, py)
     elif method == 'lagrange':
@@ -41,6 +62,18 @@ def pointsetmf(x, pointset, method='linear'):
         f = interp.make_interp_spline(px, py)
     elif method == 'cubic':
         f = interp.CubicSpline(px, py, bc_type='natural')
+    if len(_INTERPOLATORS) >= _MAX_CACHED_INTERPOLATORS:
+        _INTERPOLATORS.clear()
+    _INTERPOLATORS[key] = f
+    return f
+
+
+def pointsetmf(x, pointset, method='linear'):
+    '''Interpolate from a point-set using the chosen interpolation method'''
+    px, py = pointset_arrays(extend_pointset(pointset, x[0], x[-1]))
+    if method == 'linear':  # No need for an interpolator object here
+        return np.clip(np.interp(x, px, py), 0, 1)
+    f = pointset_interpolator(px, py, method)
     # Sometimes interpoliation can go outside the bounds:
     return np.clip(f(x), 0, 1)
 
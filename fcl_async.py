@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''
+    An asyncio front end for the SimulationHarness, so that running a
+    controller doesn't block the event loop.
+
+    Calls to simulate (a TestData of inputs) or simulate_one (a dict of
+    inputs) that are waiting at the same time are put together into one
+    batch, which is run by the harness's simulate_batch on an executor
+    (by default, the loop's own thread pool).  A batch is run once it has
+    max_batch rows, or max_wait seconds after its first call arrived.
+    A batch never has more than max_batch rows: any calls that don't fit
+    are left for the next batch, and a call with more rows than that is
+    split up.  Only one batch runs at a time; the next one fills up
+    meanwhile.
+
+        harness = SimulationHarness(engine='batch')
+        harness.read_fcl_file('tipper.fcl')
+        sim = AsyncSimulator(harness)
+        outputs = await sim.simulate_one({'food': 3, 'service': 7})
+'''
+
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+
+from simulate import TestData
+
+# Defaults for collecting calls into batches:
+_MAX_BATCH = 1024    # rows
+_MAX_WAIT = 0.002    # seconds
+
+
+class AsyncSimulator(object):
+    '''
+        Awaitable simulations using a (loaded) SimulationHarness.
+    '''
+    def __init__(self, harness, max_batch=_MAX_BATCH, max_wait=_MAX_WAIT,
+                 executor=None):
+        assert harness.control_system is not None,\
+            'Read an FCL file into the harness first'
+        self.harness = harness
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self.batches = 0     # How many batches we've run
+        self._pending = []   # (input_data, future) waiting for the next batch
+        self._pending_rows = 0
+        self._full = None    # Event: the next batch is full
+        self._flusher = None  # Task that will run the next batch
+        self._running = None  # Lock: held while a batch is running
+
+    @property
+    def input_names(self):
+        return list(self.harness.antecedents.keys())
+
+    async def simulate(self, input_data):
+        '''
+            Run the rows of a TestData of inputs (in any column order),
+            returning TestData for the outputs and rules, as for
+            SimulationHarness.simulate.
+        '''
+        missing = set(self.input_names) - set(input_data.names)
+        if missing:
+            raise ValueError('No value for input(s) {}'
+                             .format(sorted(missing)))
+        if input_data.num_tests > self.max_batch:  # Too big for one batch
+            parts = await asyncio.gather(*[
+                self.simulate(_rows(input_data, start, start + self.max_batch))
+                for start in range(0, input_data.num_tests, self.max_batch)])
+            return (_join([output_data for output_data, _ in parts]),
+                    _join([rule_data for _, rule_data in parts]))
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((input_data, future))
+        self._pending_rows += input_data.num_tests
+        self._start_flusher()
+        return await future
+
+    async def simulate_one(self, input_dict):
+        '''Run one set of inputs; return a dict of outputs (NaN if none)'''
+        input_data = TestData(input_dict.keys(), 1)
+        input_data.value[0] = list(input_dict.values())
+        output_data, _ = await self.simulate(input_data)
+        return OrderedDict(zip(output_data.names, output_data.value[0]))
+
+    def _start_flusher(self):
+        '''Make sure there's a task to run the pending calls'''
+        if self._flusher is None:
+            self._full = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(
+                self._run_when_ready())
+        if self._pending_rows >= self.max_batch:
+            self._full.set()
+
+    def _take_batch(self):
+        '''Take the first pending calls, up to max_batch rows in all'''
+        rows, count = 0, 0
+        for input_data, _ in self._pending:
+            if rows + input_data.num_tests > self.max_batch:
+                break
+            rows += input_data.num_tests
+            count += 1
+        batch, self._pending = self._pending[:count], self._pending[count:]
+        self._pending_rows -= rows
+        return batch
+
+    async def _run_when_ready(self):
+        '''Wait until the batch is full or late, then run it'''
+        try:
+            await asyncio.wait_for(self._full.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        batch = self._take_batch()
+        self._flusher = None
+        if self._pending:  # These have waited already, so don't wait again
+            self._start_flusher()
+            self._full.set()
+        if self._running is None:
+            self._running = asyncio.Lock()
+        async with self._running:
+            await self._run_batch(batch)
+
+    def _combine(self, batch):
+        '''Put the inputs for all the calls into one TestData'''
+        names = self.input_names
+        values = [data.value[:, [data.names.index(name) for name in names]]
+                  for data, _ in batch]
+        combined = TestData(names, 0)
+        combined.value = np.vstack(values)
+        return combined
+
+    async def _run_batch(self, batch):
+        '''Run the batch on the executor, then give each call its rows'''
+        loop = asyncio.get_running_loop()
+        self.batches += 1
+        try:
+            output_data, rule_data = await loop.run_in_executor(
+                self.executor, self.harness.simulate_batch,
+                self._combine(batch))
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        start = 0
+        for input_data, future in batch:
+            stop = start + input_data.num_tests
+            if not future.done():  # i.e. not cancelled
+                future.set_result((_rows(output_data, start, stop),
+                                   _rows(rule_data, start, stop)))
+            start = stop
+
+
+def _rows(data, start, stop):
+    '''The rows [start:stop] of a TestData, with their messages'''
+    part = TestData(data.names, 0)
+    part.value = data.value[start:stop]
+    part.message = {row - start: msg for row, msg in data.message.items()
+                    if start <= row < stop}
+    return part
+
+
+def _join(parts):
+    '''Put the rows of several TestData back together, with their messages'''
+    whole = TestData(parts[0].names, 0)
+    whole.value = np.vstack([part.value for part in parts])
+    start = 0
+    for part in parts:
+        whole.message.update((start + row, msg)
+                             for row, msg in part.message.items())
+        start += part.num_tests
+    return whole
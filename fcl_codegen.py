@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+'''
+    Generate a standalone Python module from a parsed FCL file, so that a
+    controller can be deployed with nothing but numpy: no skfuzzy,
+    networkx or parser.  The module has the universes and membership
+    functions baked in as constant arrays, and one vectorised function:
+        evaluate(inputs, rules=False) -> OrderedDict of outputs
+    taking a dict mapping input names to values (or arrays of values).
+
+    The generated code does what the skfuzzy simulation (the 'sampled'
+    engine) does, step by step: clip and fuzzify the inputs, fire the rules
+    in the control system's order (with the same norms for each AND/OR as
+    skfuzzy would use, and the same hedges), accumulate the activations with
+    each output's accumulation method, and then defuzzify (a TSK output is
+    weighted by each rule's activation instead; see tsk.py).  As in skfuzzy,
+    the points where each term crosses its activation are added to the
+    output universe for each row before the terms are cut and combined.
+    The norm, accumulation and hedge functions (and the helper functions
+    below) are copied into the module from their source.
+
+        parser = FCLParser().read_fcl_file('tipper.fcl')
+        write_module(parser, 'tipper_fis.py')
+        ...
+        import tipper_fis
+        tipper_fis.evaluate({'food': [3, 4], 'service': [7, 8]})['tip']
+
+    An output where no rule fired (or all fired with strength 0) is NaN,
+    whatever the method (where skfuzzy would still give the MOM/SOM/LOM
+    of the whole universe), as for the 'exact', 'batch' and 'sparse'
+    engines.
+'''
+
+from __future__ import print_function
+
+import inspect
+import os
+import re
+import sys
+import textwrap
+from collections import OrderedDict
+
+import numpy as np
+
+import skfuzzy.control as ctrl
+import skfuzzy.control.term as fuzzterm
+
+import tsk
+import weighted
+from fcl_parser import FCLParser
+from hedges import HedgedClause
+
+_CHUNK_ROWS = 256   # Rows per pass in the generated evaluate
+_LINE_WIDTH = 79
+
+
+# ######################################################### #
+# ### Helpers that are copied into the generated module ### #
+# ######################################################### #
+
+def _fuzzify(x, universe, mfs):
+    '''Clip the inputs to the universe, and find their term memberships'''
+    x = np.fmax(np.fmin(x, universe.max()), universe.min())
+    return x, [np.interp(x, universe, mf) for mf in mfs]
+
+
+def _output_set(universe, mfs, levels):
+    '''
+        Cut the terms (rows of mfs) at their levels, one per term per row,
+        and combine them (with max), as skfuzzy does: the points where each
+        term crosses its level are added to the universe for that row.
+        Returns the points and memberships, both of shape (rows, points);
+        the points are sorted, padded at the end with the last point.
+    '''
+    levels = np.stack(np.broadcast_arrays(*levels), axis=1)  # (rows, terms)
+    cut = levels[:, :, np.newaxis]
+    above = np.where(cut == 0, mfs > cut, mfs >= cut)
+    row, term, i = np.nonzero(above[:, :, 1:] != above[:, :, :-1])
+    crossings = (universe[i] + (levels[row, term] - mfs[term, i])
+                 * (universe[i + 1] - universe[i])
+                 / (mfs[term, i + 1] - mfs[term, i]))
+    counts = np.bincount(row, minlength=len(levels))
+    extra = np.full((len(levels), counts.max() if len(row) else 0), np.nan)
+    extra[row, np.arange(len(row)) - np.repeat(np.cumsum(counts) - counts,
+                                               counts)] = crossings
+    points = np.sort(np.hstack([np.broadcast_to(universe, (len(levels),
+                                                           len(universe))),
+                                extra]), axis=1)
+    points = np.where(np.isnan(points), universe.max(), points)
+    memberships = np.zeros(points.shape)
+    for mf, level in zip(mfs, levels.T):
+        np.maximum(memberships, np.minimum(level[:, np.newaxis],
+                                           np.interp(points, universe, mf)),
+                   out=memberships)
+    return points, memberships
+
+
+def _centroid(points, memberships):
+    '''The centroid of each row, treating each as piecewise linear'''
+    dx = np.diff(points, axis=1)
+    x1, x2 = points[:, :-1], points[:, 1:]
+    y1, y2 = memberships[:, :-1], memberships[:, 1:]
+    moments = dx * (y1 * (2 * x1 + x2) + y2 * (x1 + 2 * x2)) / 6
+    areas = 0.5 * dx * (y1 + y2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(memberships.sum(axis=1) > 0,
+                        moments.sum(axis=1) / areas.sum(axis=1), np.nan)
+
+
+def _bisector(points, memberships):
+    '''The point that divides the area of each row in two'''
+    dxs = np.diff(points, axis=1)
+    areas = 0.5 * dxs * (memberships[:, :-1] + memberships[:, 1:])
+    accum = np.cumsum(areas, axis=1)
+    half = accum[:, -1] / 2
+    index = np.argmax(accum >= half[:, np.newaxis], axis=1)
+    rows = np.arange(len(points))
+    rest = half - (accum[rows, index] - areas[rows, index])
+    x1, dx = points[rows, index], dxs[rows, index]
+    y1, y2 = memberships[rows, index], memberships[rows, index + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (y2 - y1) / dx
+        root = np.sqrt(np.fmax(y1 * y1 + 2 * slope * rest, 0))
+        return np.where(half > 0, x1 + 2 * rest / (y1 + root), np.nan)
+
+
+def _at_max(points, memberships):
+    '''
+        Where each row is at its maximum (counting repeated points once);
+        nowhere, for a row that is all zero.
+    '''
+    distinct = np.ones(points.shape, dtype=bool)
+    distinct[:, 1:] = points[:, 1:] > points[:, :-1]
+    row_max = memberships.max(axis=1, keepdims=True)
+    return (memberships == row_max) & distinct & (row_max > 0)
+
+
+def _mom(points, memberships):
+    '''The mean of the points where each row is at its maximum'''
+    at_max = _at_max(points, memberships)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (at_max * points).sum(axis=1) / at_max.sum(axis=1)
+
+
+def _som(points, memberships):
+    '''The smallest point where each row is at its maximum'''
+    at_max = _at_max(points, memberships)
+    return np.where(at_max.any(axis=1),
+                    np.where(at_max, points, np.inf).min(axis=1), np.nan)
+
+
+def _lom(points, memberships):
+    '''The largest point where each row is at its maximum'''
+    at_max = _at_max(points, memberships)
+    return np.where(at_max.any(axis=1),
+                    np.where(at_max, points, -np.inf).max(axis=1), np.nan)
+
+
+def _weighted_sum(weights, positions):
+    '''The sum of the term positions weighted by their activations'''
+    total = (weights * positions).sum(axis=1)
+    return np.where((weights > 0).any(axis=1), total, np.nan)
+
+
+def _weighted_average(weights, positions):
+    '''As for _weighted_sum, but divided by the total weight'''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _weighted_sum(weights, positions) / weights.sum(axis=1)
+
+
+# Keyed by the skfuzzy (or our own) method names:
+_DEFUZZ_HELPERS = OrderedDict([
+    ('centroid', _centroid),
+    ('bisector', _bisector),
+    ('mom',      _mom),
+    ('som',      _som),
+    ('lom',      _lom),
+    ('wtaver',   _weighted_average),
+    ('wtsum',    _weighted_sum),
+])
+
+_ALL_HELPERS = [_fuzzify, _output_set, _centroid, _bisector, _at_max, _mom,
+                _som, _lom, _weighted_sum, _weighted_average]
+
+
+# ############################ #
+# ### The module generator ### #
+# ############################ #
+
+def _list_source(values, indent):
+    '''The source for a list of numbers, given exactly, wrapped to fit'''
+    items = ', '.join(repr(float(v)) for v in values)
+    lines = textwrap.wrap(items, _LINE_WIDTH - indent - 1,
+                          break_long_words=False, break_on_hyphens=False)
+    return '[' + ('\n' + ' ' * (indent + 1)).join(lines) + ']'
+
+
+def _array_source(values):
+    '''The source for a 1-D or 2-D numpy array'''
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return 'np.array(\n    {})'.format(_list_source(values, 4))
+    rows = ',\n     '.join(_list_source(row, 5) for row in values)
+    return 'np.array(\n    [{}])'.format(rows)
+
+
+def _identifier(name):
+    '''A (lower-case) Python identifier based on a variable name'''
+    return re.sub(r'\W', '_', name).lower()
+
+
+class _ModuleWriter(object):
+    '''
+        Put together the source of the generated module, remembering the
+        functions that have to be copied into it.
+    '''
+    def __init__(self, parser, source_name=None):
+        self.parser = parser
+        self.source_name = source_name
+        self.control_system = ctrl.ControlSystem(parser.all_rules.values())
+        self.inputs = list(parser.antecedents)
+        self.outputs = list(parser.consequents)
+        assert self.inputs, 'The controller has no inputs'
+        self.functions = OrderedDict()  # Name: source
+        self.var_ids = OrderedDict()    # Variable label: identifier
+        for var in self.inputs + self.outputs:
+            ident = _identifier(var.label)
+            assert ident not in self.var_ids.values(),\
+                'Variable names "{}" clash'.format(var.label)
+            self.var_ids[var.label] = ident
+        self.accumulated = set()  # (variable, term) pairs with a value
+        self.rule_terms = OrderedDict((var.label, []) for var in self.outputs
+                                      if tsk.has_function_terms(var))
+
+    def add_function(self, func):
+        '''Copy a function into the module; return the name to call it'''
+        if isinstance(func, np.ufunc) and getattr(np, func.__name__, None) \
+                is func:
+            return 'np.{}'.format(func.__name__)
+        if isinstance(func, np.vectorize):
+            name = func.pyfunc.__name__
+            source = '{}\n\n{} = np.vectorize({})'.format(
+                self._source(func.pyfunc), name, name)
+        else:
+            name = func.__name__
+            source = self._source(func)
+        assert self.functions.get(name, source) == source,\
+            'Two different functions called "{}"'.format(name)
+        self.functions[name] = source
+        return name
+
+    @staticmethod
+    def _source(func):
+        '''The source code for a (module-level) function'''
+        assert func.__name__ != '<lambda>',\
+            'Can\'t copy a lambda into the generated module'
+        return textwrap.dedent(inspect.getsource(func)).strip()
+
+    def term_ref(self, term):
+        '''The expression for a term's membership (or accumulated) value'''
+        var = term.parent
+        index = list(var.terms.values()).index(term)
+        if isinstance(var, ctrl.Consequent):
+            assert (var.label, index) in self.accumulated,\
+                'Term "{}" is used before any rule sets it'\
+                .format(term.full_label)
+            return 'acc_{}[{}]'.format(self.var_ids[var.label], index)
+        return 'mu_{}[{}]'.format(self.var_ids[var.label], index)
+
+    def clause(self, clause, agg_methods):
+        '''
+            The expression for (part of) an antecedent, where each AND/OR
+            uses the rule's norms (agg_methods), as skfuzzy does.
+        '''
+        if isinstance(clause, fuzzterm.Term):
+            return self.term_ref(clause)
+        if isinstance(clause, HedgedClause):
+            expr = self.clause(clause.term1, agg_methods)
+            for kind, arg in clause.hedge_func.steps:
+                if kind == 'power':
+                    expr = 'np.power({}, {!r})'.format(expr, arg)
+                elif kind == 'not':
+                    expr = '(1. - {})'.format(expr)
+                else:
+                    expr = '{}({})'.format(self.add_function(arg), expr)
+            return expr
+        if clause.kind == 'not':
+            return '(1. - {})'.format(self.clause(clause.term1, agg_methods))
+        func = agg_methods.and_func if clause.kind == 'and' \
+            else agg_methods.or_func
+        return '{}({}, {})'.format(self.add_function(func),
+                                   self.clause(clause.term1, agg_methods),
+                                   self.clause(clause.term2, agg_methods))
+
+    def rule_lines(self, rule):
+        '''The code to fire one rule and accumulate its activations'''
+        consequents = [str(c.term.full_label) for c in rule.consequent]
+        lines = ['# {}: IF {} THEN {}'.format(rule.label, rule.antecedent,
+                                              ', '.join(consequents)),
+                 'firing = ' + self.clause(rule.antecedent,
+                                           rule._aggregation_methods)]
+        for num, wterm in enumerate(rule.consequent):
+            assert isinstance(wterm.weight, (int, float)),\
+                'Rule weight "{}" must be a number'.format(wterm.weight)
+            activation = 'firing' if wterm.weight == 1 \
+                else 'firing * {!r}'.format(float(wterm.weight))
+            if num == 0:
+                lines.append('rule_activation[{!r}] = {}'
+                             .format(rule.label, activation))
+            var = wterm.term.parent
+            index = list(var.terms.values()).index(wterm.term)
+            if var.label in self.rule_terms:  # TSK: weighted per rule
+                self.rule_terms[var.label].append(index)
+                lines.append('rules_{}.append({})'.format(
+                    self.var_ids[var.label], activation))
+            target = 'acc_{}[{}]'.format(self.var_ids[var.label], index)
+            if (var.label, index) in self.accumulated:
+                accu = self.add_function(var.accumulation_method)
+                activation = '{}({}, {})'.format(accu, activation, target)
+            self.accumulated.add((var.label, index))
+            lines.append('{} = {}'.format(target, activation))
+        return lines
+
+    def defuzz_lines(self, var):
+        '''The code to defuzzify one output variable'''
+        ident = self.var_ids[var.label]
+        method = weighted.weighted_method(var) or var.defuzzify_method
+        assert method in _DEFUZZ_HELPERS,\
+            'Unknown defuzzify method "{}"'.format(method)
+        used = [index for index in range(len(var.terms))
+                if (var.label, index) in self.accumulated]
+        target = 'outputs[{!r}]'.format(var.label)
+        if not used:
+            return ['{} = np.full(num_rows, np.nan)'.format(target)]
+        defuzz = self.add_function(_DEFUZZ_HELPERS[method])
+        levels = '[acc_{}[i] for i in {}]'.format(ident, used)
+        if var.label in self.rule_terms:
+            levels, used = 'rules_{}'.format(ident), self.rule_terms[var.label]
+        if method in weighted._WEIGHTED_DEFUZZ:
+            return ['{} = {}('.format(target, defuzz),
+                    '    np.stack({}, axis=1),'.format(levels),
+                    '    {})'.format(self.positions(var, used))]
+        mfs = '_MF_{}'.format(ident) if len(used) == len(var.terms) \
+            else '_MF_{}[{}]'.format(ident, used)
+        return ['{} = {}(*_output_set('.format(target, defuzz),
+                '    _U_{}, {}, {}))'.format(ident, mfs, levels)]
+
+    def positions(self, var, used):
+        '''
+            The positions of the used terms (one per rule, for TSK), for
+            weighted defuzzification: fixed, unless some are TSK functions
+            of the (clipped) inputs.
+        '''
+        terms = list(var.terms.values())
+        if not any(tsk.is_function_term(terms[index]) for index in used):
+            return 'np.array({!r})'.format(
+                [float(weighted.term_position(terms[index],
+                                              self.parser.translate_mf))
+                 for index in used])
+        exprs = []
+        for index in used:
+            term = terms[index]
+            if tsk.is_function_term(term):
+                parts = ['{!r}'.format(float(term.function.constant))]
+                parts.extend('{!r} * x_{}'.format(float(coeff),
+                                                  self.var_ids[varname])
+                             for varname, coeff in
+                             term.function.coeffs.items())
+            else:
+                parts = ['{!r}'.format(float(weighted.term_position(
+                    term, self.parser.translate_mf)))]
+            exprs.append('np.full(num_rows, {})'.format(' + '.join(parts)))
+        return 'np.stack([{}], axis=1)'.format(
+            ',\n                  '.join(exprs))
+
+    def constants(self):
+        '''The universe and membership arrays for each variable'''
+        lines = []
+        for var in self.inputs + self.outputs:
+            ident = self.var_ids[var.label]
+            lines.append('# {}: {}'.format(var.label, ', '.join(var.terms)))
+            lines.append('_U_{} = {}'.format(ident,
+                                             _array_source(var.universe)))
+            mfs = np.array([term.mf for term in var.terms.values()])
+            lines.append('_MF_{} = {}'.format(ident, _array_source(mfs)))
+            lines.append('')
+        return lines
+
+    def body(self):
+        '''The code for _evaluate_rows: all of the inference'''
+        args = ', '.join('x_' + self.var_ids[var.label]
+                         for var in self.inputs)
+        lines = ['def _evaluate_rows({}):'.format(args),
+                 '    \'\'\'Run the controller for 1-D arrays of inputs\'\'\'',
+                 '    num_rows = len(x_{})'.format(
+                     self.var_ids[self.inputs[0].label])]
+        for var in self.inputs:
+            ident = self.var_ids[var.label]
+            lines.append('    x_{0}, mu_{0} = _fuzzify(x_{0}, _U_{0}, _MF_{0})'
+                         .format(ident))
+        for var in self.outputs:
+            lines.append('    acc_{} = [None] * {}'.format(
+                self.var_ids[var.label], len(var.terms)))
+            if var.label in self.rule_terms:
+                lines.append('    rules_{} = []'.format(
+                    self.var_ids[var.label]))
+        lines.append('    rule_activation = OrderedDict()')
+        for rule in self.control_system.rules:
+            lines.append('')
+            lines.extend('    ' + line for line in self.rule_lines(rule))
+        lines.extend(['', '    outputs = OrderedDict()'])
+        for var in self.outputs:
+            lines.extend('    ' + line for line in self.defuzz_lines(var))
+        lines.append('    return outputs, rule_activation')
+        return lines
+
+    def module(self):
+        '''The complete source of the generated module'''
+        for func in _ALL_HELPERS:
+            self.add_function(func)
+        body = self.body()  # Adds the functions it needs
+        source = ' from {}'.format(self.source_name) \
+            if self.source_name else ''
+        lines = ['# -*- coding: utf-8 -*-',
+                 '\'\'\'',
+                 '    Generated{} by fcl_codegen.py: do not edit.'
+                 .format(source),
+                 '    Run the controller with evaluate(inputs).',
+                 '\'\'\'',
+                 '',
+                 'from collections import OrderedDict',
+                 '',
+                 'import numpy as np',
+                 '',
+                 'INPUTS = {!r}'.format([v.label for v in self.inputs]),
+                 'OUTPUTS = {!r}'.format([v.label for v in self.outputs]),
+                 'RULES = {!r}'.format(list(self.parser.all_rules.keys())),
+                 '',
+                 '_CHUNK_ROWS = {}'.format(_CHUNK_ROWS),
+                 '']
+        lines.extend(self.constants())
+        for source in self.functions.values():
+            lines.extend(['', source, ''])
+        lines.extend([''] + body + ['', ''] + _EVALUATE_SOURCE.splitlines())
+        return '\n'.join(lines) + '\n'
+
+
+_EVALUATE_SOURCE = """\
+def evaluate(inputs, rules=False):
+    '''
+        Run the controller for a dict mapping input names to values (or
+        arrays of values, all the same shape).  Returns an OrderedDict
+        mapping the output names (then the rule labels, with their
+        activations, if wanted) to values of that shape.
+    '''
+    values = [np.asarray(inputs[name], dtype=np.float64) for name in INPUTS]
+    shape = np.broadcast(*values).shape
+    values = [np.broadcast_to(value, shape).ravel() for value in values]
+    num_rows = int(np.prod(shape))
+    results = OrderedDict((name, np.empty(num_rows))
+                          for name in OUTPUTS + (RULES if rules else []))
+    for start in range(0, num_rows, _CHUNK_ROWS):
+        chunk = slice(start, start + _CHUNK_ROWS)
+        outputs, activations = _evaluate_rows(*[v[chunk] for v in values])
+        outputs.update(activations)
+        for name, result in results.items():
+            result[chunk] = outputs[name]
+    return OrderedDict((name, result.reshape(shape)[()])
+                       for name, result in results.items())
+"""
+
+
+def generate_module(parser, source_name=None):
+    '''
+        Return the source of a standalone module for the parsed controller;
+        the source name (e.g. the FCL file) is noted in its docstring.
+    '''
+    return _ModuleWriter(parser, source_name).module()
+
+
+def write_module(parser, filename, source_name=None):
+    '''Write the standalone module for the parsed controller to a file'''
+    with open(filename, 'w') as fileh:
+        fileh.write(generate_module(parser, source_name))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: {} fcl-file module-file'.format(sys.argv[0]))
+        sys.exit(1)
+    _PARSER = FCLParser().read_fcl_file(sys.argv[1])
+    write_module(_PARSER, sys.argv[2], os.path.basename(sys.argv[1]))
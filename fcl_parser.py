@@ -18,18 +18,49 @@
 import os
 import sys
 import codecs
+from collections import OrderedDict
 
 import numpy as np
 
+import skfuzzy
 import skfuzzy.control as ctrl
 import skfuzzy.control.term as fuzzterm
 
+import extramf
+import memreport
+import metrics
+import plmf
+import sparsemf
+import tsk
+import weighted
 from fcl_scanner import BufferedFCLLexer
 from fcl_symbols import NameMapper, SymbolTable
+from hedges import fuse_hedges, is_pointwise, HedgedClause
 
 # A universe is given this no. of points unless specified:
 _DEFAULT_UNIVERSE_SIZE = 1000
 
+# Universes and membership functions are built with this precision:
+_DEFAULT_DTYPE = np.float64
+
+# For adaptive universes: start with this no. of points, double up to max:
+_ADAPT_MIN_POINTS = 9
+_ADAPT_MAX_POINTS = 16 * _DEFAULT_UNIVERSE_SIZE
+# ... and check the error against this many evenly-spaced points:
+_ADAPT_PROBE_POINTS = 4001
+# ... cutting output terms at these levels:
+_ADAPT_CUT_LEVELS = (1.0, 0.9, 0.7, 0.45, 0.2)  # Avoid 'round' values
+# These return a point of the universe, so they're only as good as its spacing
+_ADAPT_PICK_POINT = ('mom', 'som', 'lom')
+
+# The "mf name" we use for (TSK) output terms that are functions of the inputs:
+_FUNCTION_TERM = 'linear'
+
+# Functions of the inputs can only be defuzzified by these methods:
+_FUNCTION_DEFUZZ = ('wtaver', 'wtsum')
+# ... and a weighted method leaves this for skfuzzy (see weighted.py):
+_WEIGHTED_FALLBACK = 'centroid'
+
 
 class ParsingError(Exception):
     '''The parser raises this to flag an error while parsing an FCL file.'''
@@ -49,11 +80,29 @@ class FCLParser(NameMapper, SymbolTable):
         really be "has-a" rather than "is-a", but it's simpler this way.
     '''
 
-    def __init__(self, vars=None):
+    def __init__(self, vars=None, dtype=None, tolerance=None,
+                 memory_budget=None, sparse=False):
         '''
             Set up parser by initialising symbol table and lexer
             Optionally supply an initial list of variables (or add them later)
-        '''
+            Optionally give a float dtype (e.g. np.float32) for the universes
+            and membership functions; the default is double precision.
+            Optionally give a tolerance (as a fraction of the range) to
+            pick the universe for each variable from its terms, rather than
+            guessing the step (see _adapt_universe).
+            Optionally give a memory budget (in bytes) for the controller;
+            it's an error to go over this (see memreport.py).
+            If sparse, keep only the support of each output term's mf
+            (see sparsemf.py).
+        '''
+        self.dtype = np.dtype(dtype if dtype else _DEFAULT_DTYPE)
+        self.tolerance = tolerance
+        self.memory_budget = memory_budget
+        self.sparse = sparse
+        self._range = None  # The most recent RANGE: (start, stop, step)
+        assert np.issubdtype(self.dtype, np.floating),\
+            'Parser dtype must be a floating-point type, not {}'\
+            .format(self.dtype)
         NameMapper.__init__(self)
         self.load_ieee_names()
         self.load_fcl_names_too()
@@ -61,6 +110,26 @@ class FCLParser(NameMapper, SymbolTable):
         SymbolTable.__init__(self, vars)
         self.lex = BufferedFCLLexer(self._report_error)
 
+    @property
+    def universe_sizes(self):
+        '''The number of points in each variable's universe'''
+        return OrderedDict((var.label, len(var.universe))
+                           for var in self.fuzzy_variables)
+
+    def _check_memory(self, what, extra=0):
+        '''
+            Report an error if the controller (plus some extra bytes, not
+            yet allocated) is over the memory budget, if there is one.
+        '''
+        if self.memory_budget is None:
+            return
+        used = memreport.memory_report(self, with_state=False).total + extra
+        if used > self.memory_budget:
+            self._report_error('{} would need {} bytes in all, over the '
+                               'budget of {}'.format(what, used,
+                                                     self.memory_budget),
+                               'memory error')
+
     def _report_error(self, msg, error_kind='syntax error', pos=None):
         '''
             Raise an error; report the current position if none given.
@@ -85,9 +154,105 @@ class FCLParser(NameMapper, SymbolTable):
             urange = 1 + (stop - start)
             scale_by = urange / _DEFAULT_UNIVERSE_SIZE
             step = np.power(10, np.round(np.log10(scale_by), 0))
-        universe = np.arange(start, stop, step)
+        # Calculate the points in double precision, then store as required:
+        universe = np.arange(start, stop, step).astype(self.dtype)
         return universe
 
+    def _adapt_universe(self, universe, termlist, defuzz_method=None):
+        '''
+            Pick the points for a universe from its terms: always include
+            the breakpoints of the terms, then keep doubling the number of
+            evenly-spaced points until the error is within the tolerance.
+            For inputs the error is in the memberships (when interpolated),
+            for outputs it's in the defuzzified value of each term, cut at
+            a few levels; this stands in for the error in the output.
+            Only used if there's a tolerance and no WITH step.
+        '''
+        start, stop, step = self._range
+        if not self.tolerance or step:
+            return universe
+        terms = [(fname, params) for (_, fname, params) in termlist
+                 if fname != _FUNCTION_TERM]
+        if defuzz_method in _FUNCTION_DEFUZZ:
+            terms = []  # Only the term positions matter (see weighted.py)
+        probe = np.linspace(start, stop, _ADAPT_PROBE_POINTS)
+        breaks, errors = [start, stop], []
+        for fname, params in terms:
+            mf_func, split_params = self.translate_mf(fname)
+            fname, params = self._point_mf_def(probe, fname, params)
+            bps = plmf.breakpoints(mf_func, params, split_params)
+            if mf_func is extramf.singletonmf:  # Just needs its point
+                breaks.append(params[0])
+                continue
+            if bps is None:  # Smooth, but may have a cusp at its peak:
+                peak_func, split_params = self.translate_point_mf(fname)
+                peaks = peak_func(probe, *params) if split_params \
+                    else peak_func(probe, params)
+                breaks.append(probe[np.argmax(peaks)])
+            else:
+                breaks.extend(bps[0])
+                # Add points either side of a vertical jump:
+                jumps = bps[0][1:][np.diff(bps[0]) == 0]
+                gap = 4 * np.spacing(np.abs(jumps).astype(self.dtype))
+                breaks.extend(jumps - gap)
+                breaks.extend(jumps + gap)
+            errors.append(self._term_error_func(probe, fname, params,
+                                                bps, defuzz_method))
+        if defuzz_method in _ADAPT_PICK_POINT:  # Picks a universe point
+            errors.append(lambda universe:
+                          np.max(np.diff(universe)) / (stop - start))
+        breaks = np.unique(np.clip(breaks, start, stop))
+        num_points = _ADAPT_MIN_POINTS
+        while True:
+            universe = np.union1d(np.linspace(start, stop, num_points),
+                                  breaks)
+            if num_points >= _ADAPT_MAX_POINTS or \
+                    all(err(universe) <= self.tolerance for err in errors):
+                return universe.astype(self.dtype)
+            num_points = 2 * num_points - 1  # Keep the existing points
+
+    def _term_error_func(self, probe, fname, params, bps, defuzz_method):
+        '''
+            Return a function giving the error (as a fraction of the range)
+            in a term when sampled over a given universe.  For an output
+            variable, give its defuzzification method.
+        '''
+        point_func, split_params = self.translate_point_mf(fname)
+        want_mf = point_func(probe, *params) if split_params \
+            else point_func(probe, params)
+        if not defuzz_method:  # An input, so check memberships
+            def input_error(universe):
+                got_mf = skfuzzy.interp_membership(
+                    universe, self._make_mf(universe, fname, params), probe)
+                return np.max(np.abs(got_mf - want_mf))
+            return input_error
+        # Outputs: compare defuzzified values, exactly if we can:
+        want = OrderedDict()
+        for level in _ADAPT_CUT_LEVELS:
+            if bps is not None:
+                xs, ys = plmf.cut(*plmf.restrict(bps[0], bps[1],
+                                                 probe[0], probe[-1]), level)
+                if plmf._segment_areas(xs, ys).sum() > 0:
+                    want[level] = plmf._PL_DEFUZZ[defuzz_method](xs, ys)
+                    continue
+            cut_mf = np.fmin(want_mf, level)
+            if cut_mf.any():
+                want[level] = skfuzzy.defuzz(probe, cut_mf, defuzz_method)
+        x_range = probe[-1] - probe[0]
+
+        def output_error(universe):
+            mf_vals = self._make_mf(universe, fname, params)
+            errs = [0]
+            for level, value in want.items():
+                cut_mf = np.fmin(mf_vals, level).astype(np.float64)
+                if not cut_mf.any():
+                    errs.append(np.inf)  # Missed it completely
+                    continue
+                got = skfuzzy.defuzz(universe, cut_mf, defuzz_method)
+                errs.append(abs(got - value) / x_range)
+            return max(errs)
+        return output_error
+
     def _make_mf(self, universe, mfunc, params):
         '''
             Given a function name and parameters, make a membership function.
@@ -96,9 +261,10 @@ class FCLParser(NameMapper, SymbolTable):
             'No current universe has been set for this mf'
         skfunc, split_params = self.translate_mf(mfunc)
         if split_params:
-            return skfunc(universe, *params)
+            mf_vals = skfunc(universe, *params)
         else:  # Takes parameters as an array
-            return skfunc(universe, params)
+            mf_vals = skfunc(universe, params)
+        return np.asarray(mf_vals, dtype=self.dtype)
 
     def _finalise_ante_var(self, universe, varname):
         '''
@@ -118,7 +284,11 @@ class FCLParser(NameMapper, SymbolTable):
         for key, val in options.items():
             key = key.upper()
             if key == 'METHOD':
-                fuzzyvar.defuzzify_method = self.translate_defuzz(val)
+                method = self.translate_defuzz(val)
+                if method in weighted._WEIGHTED_DEFUZZ:
+                    fuzzyvar.weighted_method = method
+                    method = _WEIGHTED_FALLBACK
+                fuzzyvar.defuzzify_method = method
             elif key == 'ACCU':
                 fuzzyvar.accumulation_method = self.translate_accu(val)
             elif key == 'DEFAULT':
@@ -135,29 +305,134 @@ class FCLParser(NameMapper, SymbolTable):
         for term in termlist:
             if not isinstance(term, fuzzterm.Term):
                 (term_name, fname, params) = term
-                mf_def = self._make_mf(universe, fname, params)
-                term = fuzzterm.Term(term_name, mf_def)
+                if fname == _FUNCTION_TERM:
+                    term = self._function_term(fuzzyvar, term_name, params)
+                elif self.sparse and isinstance(fuzzyvar, ctrl.Consequent):
+                    skfunc, split_params = self.translate_mf(fname)
+                    term = sparsemf.SparseTerm(term_name, sparsemf.sparse_mf(
+                        universe, skfunc, params, split_params, self.dtype))
+                    term.mf_def = self._point_mf_def(universe, fname, params)
+                else:
+                    mf_def = self._make_mf(universe, fname, params)
+                    term = fuzzterm.Term(term_name, mf_def)
+                    term.mf_def = self._point_mf_def(universe, fname, params)
             self.add_term_to_var(fuzzyvar, term)
 
-    def _add_hedges(self, fvar, hedges, membfun):
+    def _function_term(self, fuzzyvar, term_name, func):
+        '''
+            Make a (TSK) output term that is a function of the inputs.
+            It has no membership function as such, so this is all zeros.
+        '''
+        if not isinstance(fuzzyvar, ctrl.Consequent):
+            self._report_error('term "{}" of "{}" is a function, which is '
+                               'only allowed for output variables'
+                               .format(term_name, fuzzyvar.label))
+        for varname in func.variables:
+            if not self.is_input_var(varname):
+                self._report_error('Input variable "{}" (used in term "{}")'
+                                   ' not found'.format(varname, term_name),
+                                   'scope error')
+        term = fuzzterm.Term(term_name, np.zeros_like(fuzzyvar.universe))
+        term.function = func
+        term.mf_def = None
+        return term
+
+    def _check_function_terms(self, fuzzyvar, options):
+        '''
+            If any terms are functions of the inputs, make sure we use
+            a weighted average (the default) or weighted sum for them.
+        '''
+        if not tsk.has_function_terms(fuzzyvar):
+            return
+        if 'METHOD' not in [key.upper() for key in options]:
+            fuzzyvar.weighted_method = _FUNCTION_DEFUZZ[0]
+        elif weighted.weighted_method(fuzzyvar) not in _FUNCTION_DEFUZZ:
+            self._unsupported('defuzzify method "{}" for terms that are '
+                              'functions of the inputs'
+                              .format(fuzzyvar.defuzzify_method))
+
+    def _point_mf_def(self, universe, fname, params):
+        '''
+            Record the mf name and parameters, so that we can evaluate
+            the term at any point later.  A point-set is extended here
+            to the universe bounds, just as it was when making the mf.
+        '''
+        skfunc, _ = self.translate_mf(fname)
+        if skfunc is extramf.pointsetmf:
+            params = extramf.extend_pointset(params, universe[0], universe[-1])
+        return (fname, params)
+
+    def term_membership(self, term, values):
+        '''
+            Return the membership of the given crisp value(s) in a term.
+            Uses the mf definition directly if we have it, otherwise
+            falls back to interpolating over the term's universe.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        mf_def = getattr(term, 'mf_def', None)
+        if mf_def:
+            fname, params = mf_def
+            point_func, split_params = self.translate_point_mf(fname)
+            if split_params:
+                mf_vals = point_func(values, *params)
+            else:  # Takes parameters as an array
+                mf_vals = point_func(values, params)
+        else:
+            universe = term.parent.universe
+            mf_vals = np.reshape(
+                [skfuzzy.interp_membership(universe, term.mf, v)
+                 for v in values.ravel()], values.shape)
+        return np.asarray(mf_vals, dtype=self.dtype)
+
+    def fuzzify(self, varname, values):
+        '''
+            Return the membership of the crisp value(s) in every term
+            of the named variable, as a dict of term-name: memberships.
+        '''
+        fuzzyvar = self.get_var_defn(varname)
+        return OrderedDict((term_name, self.term_membership(term, values))
+                           for term_name, term in fuzzyvar.terms.items())
+
+    def _add_hedges(self, fvar, hedges, membfun, in_consequent=False):
         '''
             Apply one or more hedge functions to the variable's member func.
-            Create a new mf for the overall result, and add it to the variable.
-            Return the term corresponding to this new membership function.
+            In an antecedent, any pointwise hedges at the front of the list
+            (e.g. very, not) are applied to the membership degree when the
+            rule is evaluated, so these don't need a new mf.
+            For the rest (and always in a consequent) create a new mf for
+            their overall result, and add it to the variable.
+            Return the term or clause corresponding to the hedged mf.
         '''
         if len(hedges) == 0:
             return membfun
-        mf_name = '_{}_{}'.format('_'.join(hedges), membfun)
-        if mf_name in fvar.terms:  # Already done it (some previous rule)
-            return fvar[mf_name]
-        mf_vals = fvar[membfun].mf
-        # Now apply each hedge in turn, starting at the last one:
-        for hedge_name in hedges[::-1]:
-            hedge_func = self.translate_hedge(hedge_name)
-            mf_vals = hedge_func(mf_vals)
-        # All the hedges processed, so add this as a new mf to the variable:
-        fvar[mf_name] = mf_vals
-        return fvar[mf_name]
+        hedge_funcs = [self.translate_hedge(h) for h in hedges]
+        # Count the (outermost) hedges that can be applied to a degree:
+        num_outer = 0
+        while not in_consequent and num_outer < len(hedges) \
+                and is_pointwise(hedge_funcs[num_outer]):
+            num_outer += 1
+        # Make a new mf for the inner hedges, unless we already have one:
+        term = fvar[membfun]
+        if num_outer < len(hedges):
+            mf_name = '_{}_{}'.format('_'.join(hedges[num_outer:]), membfun)
+            if mf_name not in fvar.terms:
+                # Fold the hedges into one function, applied from the last:
+                hedge_func = fuse_hedges(hedge_funcs[num_outer:])
+                mf_vals = hedge_func(fvar[membfun].mf)
+                if metrics.active is not None:
+                    metrics.active.inc('hedge_applications_total',
+                                       len(hedges) - num_outer, stage='parse',
+                                       controller=self.controller_name or
+                                       metrics._NO_CONTROLLER)
+                mf_vals = np.asarray(mf_vals, dtype=self.dtype)
+                if self.sparse and in_consequent:
+                    mf_vals = sparsemf.SparseTerm(
+                        mf_name, sparsemf.SparseMF.from_dense(mf_vals))
+                fvar[mf_name] = mf_vals
+            term = fvar[mf_name]
+        if num_outer == 0:
+            return term
+        return HedgedClause(term, hedges[:num_outer], hedge_funcs[:num_outer])
 
     def _finalise_rules(self, rbname, rulelist, options):
         '''
@@ -174,6 +449,7 @@ class FCLParser(NameMapper, SymbolTable):
                 self.set_rule_label(rule, '{}.{}'.format(rbname, rule.label))
             rule.and_func = fam.and_func
             rule.or_func = fam.or_func
+            rule.rule_block = rbname  # For profiling (see profiling.py)
         return rulelist
 
     def read_fcl_file(self, filename):
@@ -182,6 +458,7 @@ class FCLParser(NameMapper, SymbolTable):
             Returns the parser object, to facilitate create-and-call.
         '''
         self.lex.reset_lineno(filename)
+        self.fclfile = filename
         self.flag_error_on_redefine()
         with codecs.open(filename, 'r',
                          encoding='utf-8', errors='ignore') as fileh:
@@ -309,6 +586,10 @@ class FCLParser(NameMapper, SymbolTable):
         if len(universe) == 0:
             self._report_error('No universe for variable "{}"'
                                .format(varname), 'range error')
+        universe = self._adapt_universe(universe, termlist)
+        self._check_memory('Variable "{}"'.format(varname),
+                           len(universe) * (1 + len(termlist)) *
+                           self.dtype.itemsize)
         fuzzyvar = self._finalise_ante_var(universe, varname)
         self._finalise_terms(fuzzyvar, termlist)
         return fuzzyvar
@@ -360,8 +641,17 @@ class FCLParser(NameMapper, SymbolTable):
         if len(universe) == 0:
             self._report_error('No universe for variable "{}"'
                                .format(varname), 'range error')
+        method = [self.translate_defuzz(val) for key, val in options.items()
+                  if key.upper() == 'METHOD']
+        universe = self._adapt_universe(universe, termlist,
+                                        method[0] if method else 'centroid')
+        # Sparse terms are (much) smaller, so only count the universe:
+        self._check_memory('Variable "{}"'.format(varname),
+                           len(universe) * self.dtype.itemsize *
+                           (1 if self.sparse else 1 + len(termlist)))
         fuzzyvar = self._finalise_cons_var(universe, varname, options)
         self._finalise_terms(fuzzyvar, termlist)
+        self._check_function_terms(fuzzyvar, options)
         return fuzzyvar
 
     def range_def(self, input_string=None):
@@ -382,6 +672,7 @@ class FCLParser(NameMapper, SymbolTable):
         if self.lex.recognise_if_there('WITH'):
             numpoints = self.number()
         self.lex.recognise_if_there('SEMICOLON')
+        self._range = (rmin, rmax, numpoints)
         return self._calc_universe(rmin, rmax, numpoints)
 
     # ###################################### #
@@ -414,9 +705,13 @@ class FCLParser(NameMapper, SymbolTable):
 
     def mf(self, input_string=None, universe=[]):
         '''
-            membership_function ::= singleton | points | funcall
+            membership_function ::= singleton | points | funcall | function
             singleton ::= numeric_literal
             funcall ::= 'IDENTIFIER' {'IDENTIFIER'}
+            function ::= linear_function | 'Linear' {numeric_literal}
+            A funcall must use a known mf name; any other identifier
+            starts a linear function if it's an input variable or is
+            followed by an operator (as does a number with an operator).
         '''
         self.lex.maybe_set_input(input_string)
         if self.lex.peek('LPAREN'):
@@ -427,15 +722,90 @@ class FCLParser(NameMapper, SymbolTable):
             params = []
             while self.lex.peek_some(['INT_CONST', 'FLOAT_CONST']):
                 params.append(self.number())
-        else:  # Must be a singleton value
-            fname, params = 'singleton', [self.number()]
+            if fname.lower() == _FUNCTION_TERM and \
+                    fname.lower() not in self.known_mfs:
+                fname, params = _FUNCTION_TERM, self._linear_coeffs(params)
+            elif fname.lower() not in self.known_mfs and len(params) == 0:
+                if not self.is_input_var(fname) and \
+                        not self.lex.peek_some(['TIMES', 'PLUS', 'MINUS']):
+                    self._unsupported('membership function "{}"'
+                                      .format(fname))
+                fname, params = _FUNCTION_TERM, self.linear_function(
+                    first=fname)
+        elif self.lex.peek_some(['PLUS', 'MINUS']):
+            fname, params = _FUNCTION_TERM, self.linear_function()
+        else:  # Must be a singleton value, or a function
+            value = self.number()
+            if self.lex.peek_some(['TIMES', 'PLUS', 'MINUS',
+                                   'INT_CONST', 'FLOAT_CONST']):
+                fname, params = _FUNCTION_TERM, self.linear_function(
+                    first=value)
+            else:
+                fname, params = 'singleton', [value]
         # Make a term if we have a universe:
         if len(universe) > 0:
+            if fname == _FUNCTION_TERM:
+                self._unsupported('function "{}" as a membership function'
+                                  .format(params))
             mf_def = self._make_mf(universe, fname, params)
         else:  # No universe defined yet, return items for the moment:
             mf_def = ['MF', fname, params]
         return mf_def
 
+    def _linear_coeffs(self, params):
+        '''
+            As in fuzzylite, "Linear" is followed by one coefficient for
+            each input variable (in the order they were defined),
+            and then a constant.
+        '''
+        inputs = [var.label for var in self.antecedents]
+        if len(params) != len(inputs) + 1:
+            self._report_error('Linear needs {} values (one for each of {}'
+                               ' and then a constant), not {}'
+                               .format(len(inputs) + 1, inputs, len(params)))
+        return tsk.LinearFunction(zip(inputs, params[:-1]), params[-1])
+
+    def linear_function(self, input_string=None, first=None):
+        '''
+            linear_function ::= product {['+' | '-'] product}
+            product ::= numeric_literal ['*' IDENTIFIER]
+                      | IDENTIFIER ['*' numeric_literal]
+            A signed number (e.g. "-3") also starts a new product.
+            Optionally give the first item (number or name) if already read.
+        '''
+        self.lex.maybe_set_input(input_string)
+        func = tsk.LinearFunction()
+        if first is None:
+            func.add(*self._signed_product())
+        else:
+            func.add(*self._product(first))
+        while self.lex.peek_some(['PLUS', 'MINUS',
+                                  'INT_CONST', 'FLOAT_CONST']):
+            func.add(*self._signed_product())
+        return func
+
+    def _signed_product(self):
+        '''A product, possibly preceded by '+' or '-' '''
+        sign = -1 if self.lex.recognise_if_there('MINUS') else 1
+        self.lex.recognise_if_there('PLUS')
+        varname, coeff = self._product()
+        return varname, sign * coeff
+
+    def _product(self, first=None):
+        '''Read a product, return the (variable-name, coefficient) pair'''
+        if first is None:
+            if self.lex.peek('IDENTIFIER'):
+                first = self.lex.recognise('IDENTIFIER')
+            else:
+                first = self.number()
+        if isinstance(first, str):  # Starts with a variable name
+            coeff = self.number() if self.lex.recognise_if_there('TIMES')\
+                else 1
+            return first, coeff
+        if self.lex.recognise_if_there('TIMES'):
+            return self.lex.recognise('IDENTIFIER'), first
+        return None, first
+
     def point_list(self, input_string=None):
         '''
             points ::= {'(' numeric_literal ',' numeric_literal ')'}
@@ -485,7 +855,10 @@ class FCLParser(NameMapper, SymbolTable):
             else:
                 self._report_error('Unknown element in rule block')
         self.lex.recognise('END_RULEBLOCK')
-        return self._finalise_rules(rbname, rules, options)
+        rules = self._finalise_rules(rbname, rules, options)
+        self._check_memory('Rule block "{}"'.format(rbname) if rbname
+                           else 'Rule block')
+        return rules
 
     def rule_def(self, input_string=None):
         '''
@@ -606,7 +979,8 @@ class FCLParser(NameMapper, SymbolTable):
             this_clause = fuzzterm.TermAggregate(this_clause, None, 'not')
         # Otherwise apply the hedge functions, if there are any:
         elif len(hedges) > 0:
-            this_clause = self._add_hedges(fvar, hedges, membfun)
+            this_clause = self._add_hedges(fvar, hedges, membfun,
+                                           in_consequent)
         return this_clause
 
     def ident_or_number(self, input_string=None):
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''
+    Run an FCL file with several function blocks, where the outputs of
+    some blocks are the inputs of others (matched by variable name).
+
+    Each function block gets its own parser and harness.  The blocks form
+    a DAG: a block runs once all the blocks whose outputs it uses have run,
+    and blocks that don't depend on each other can run at the same time.
+    The rows of the input data are split into chunks, and each chunk goes
+    through the blocks in turn, so different blocks can be working on
+    different chunks at once (a pipeline).  Each block runs all the rows
+    of a chunk at once, and its output arrays are passed straight on as
+    the inputs of the next blocks, without copying them.
+
+        pipeline = FCLPipeline()
+        pipeline.read_fcl_file('tests/pipeline.fcl')
+        outputs, rules = pipeline.simulate_batch(input_data)
+
+    The outputs include those of every block; the rules are labelled with
+    the name of their block, e.g. "dimmer.1".
+'''
+
+import codecs
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fcl_parser import FCLParser, ParsingError
+from simulate import SimulationHarness, TestData, no_output_message
+
+_CHUNK_ROWS = 1024  # Rows passed through the pipeline at a time
+
+
+def read_function_blocks(fclfile, **parser_args):
+    '''
+        Read all the function blocks in an FCL file, each with its own
+        parser (they all share one lexer); return a list of the parsers.
+    '''
+    first = FCLParser(**parser_args)
+    first.lex.reset_lineno(fclfile)
+    parsers = []
+    with codecs.open(fclfile, 'r', encoding='utf-8', errors='ignore') as fileh:
+        first.lex.input(fileh.read())
+    parser = first
+    try:
+        while True:
+            parser.flag_error_on_redefine()
+            parser.function_block()
+            parsers.append(parser)
+            if not first.lex.peek('FUNCTION_BLOCK'):
+                break
+            parser = FCLParser(**parser_args)
+            parser.lex = first.lex
+        if first.lex.peek_type() is not None:
+            first._report_error('Expected FUNCTION_BLOCK')
+    except ParsingError as parsing_error:
+        raise parsing_error
+    except Exception as other_error:
+        first._report_error(str(other_error), 'internal error')
+    return parsers
+
+
+class FCLPipeline(object):
+    '''
+        The function blocks from an FCL file, and how they are wired up.
+        Any extra arguments are passed to the harness for each block, and
+        so to its parser (e.g. a memory_budget applies to each block).
+    '''
+    def __init__(self, engine='batch', workers=None, chunk_rows=_CHUNK_ROWS,
+                 **harness_args):
+        self.engine = engine
+        self.workers = workers if workers else min(os.cpu_count() or 1, 8)
+        self.chunk_rows = chunk_rows
+        self.harness_args = harness_args
+        self.stages = OrderedDict()   # Block name: harness, in run order
+        self.sources = OrderedDict()  # Block name: {input: block (or None)}
+        self.levels = []  # Lists of blocks that can run at the same time
+        self.input_names = []   # Inputs not set by any block
+        self.output_names = []  # Outputs of all the blocks
+        self.rule_names = []    # Block.rule for all the rules
+        self._locks = {}  # Block name: lock (a harness runs one at a time)
+
+    @staticmethod
+    def _scope_error(fclfile, msg):
+        '''Report a problem with how the blocks are wired up'''
+        raise ParsingError(fclfile, 'scope error', msg)
+
+    def read_fcl_file(self, fclfile):
+        '''Read the function blocks from the file, and wire them up'''
+        harnesses = OrderedDict()
+        producer = {}  # Output name: block name
+        parser_args = SimulationHarness(engine=self.engine,
+                                        **self.harness_args).parser_args()
+        for num, parser in enumerate(read_function_blocks(fclfile,
+                                                          **parser_args)):
+            name = parser.fb_name if parser.fb_name else 'block{}'.format(num)
+            if name in harnesses:
+                self._scope_error(fclfile, 'Function block "{}" defined '
+                                  'twice'.format(name))
+            harness = SimulationHarness(engine=self.engine,
+                                        **self.harness_args)
+            harness.use_parser(parser)
+            harnesses[name] = harness
+            for vname in harness.consequents:
+                if vname in producer:
+                    self._scope_error(fclfile, 'Output "{}" is set by both '
+                                      '"{}" and "{}"'.format(
+                                          vname, producer[vname], name))
+                producer[vname] = name
+        sources = OrderedDict(
+            (name, OrderedDict((vname, producer.get(vname))
+                               for vname in harness.antecedents))
+            for name, harness in harnesses.items())
+        # Sort the blocks into levels, each depending only on earlier ones:
+        self.levels = []
+        done = set()
+        while len(done) < len(harnesses):
+            level = [name for name in harnesses if name not in done and
+                     all(src is None or src in done
+                         for src in sources[name].values())]
+            if not level:
+                self._scope_error(fclfile, 'The outputs and inputs of '
+                                  'blocks {} form a cycle'.format(
+                                      [n for n in harnesses
+                                       if n not in done]))
+            self.levels.append(level)
+            done.update(level)
+        order = [name for level in self.levels for name in level]
+        self.stages = OrderedDict((name, harnesses[name]) for name in order)
+        self.sources = OrderedDict((name, sources[name]) for name in order)
+        self.input_names = []
+        for name, srcs in self.sources.items():
+            self.input_names.extend(vname for vname, src in srcs.items()
+                                    if src is None and
+                                    vname not in self.input_names)
+        self.output_names = [vname for harness in self.stages.values()
+                             for vname in harness.consequents]
+        self.rule_names = ['{}.{}'.format(name, label)
+                           for name, harness in self.stages.items()
+                           for label in harness.all_rules]
+        self._locks = {name: threading.Lock() for name in self.stages}
+        return self
+
+    def enable_profiling(self, profile=None):
+        '''Profile all the blocks, adding to one profile; return it'''
+        for harness in self.stages.values():
+            profile = harness.enable_profiling(profile)
+        return profile
+
+    @staticmethod
+    def _columns(harness, inputs):
+        '''
+            Run the rows one at a time (if they can't all be run at once);
+            return the outputs, with NaN where there wasn't one (as the
+            harness leaves them, for a row that failed or an unset output).
+        '''
+        input_data = TestData(inputs.keys(), len(next(iter(inputs.values()))))
+        input_data.value = np.stack(list(inputs.values()), axis=1)
+        output_data, rule_data = harness.simulate(input_data)
+        outputs = OrderedDict(zip(output_data.names, output_data.value.T))
+        return outputs, OrderedDict(zip(rule_data.names, rule_data.value.T))
+
+    def _run_stage(self, name, inputs, waiting_for):
+        '''
+            Run one block on one chunk, once the blocks it needs are done;
+            the inputs so far are the external ones (views of the data).
+        '''
+        harness = self.stages[name]
+        inputs = OrderedDict(inputs)
+        for future in waiting_for:
+            outputs, _ = future.result()
+            inputs.update((vname, outputs[vname]) for vname in outputs
+                          if vname in harness.antecedents)
+        inputs = OrderedDict((vname, inputs[vname])
+                             for vname in harness.antecedents)
+        num_rows = len(next(iter(inputs.values())))
+        with self._locks[name]:
+            try:
+                outputs, activations = harness.compute_arrays(inputs)
+            except Exception:
+                return self._columns(harness, inputs)
+        outputs = OrderedDict(
+            (vname, np.broadcast_to(outputs.get(vname, np.nan), (num_rows,)))
+            for vname in harness.consequents)
+        return outputs, activations
+
+    def simulate_batch(self, input_data):
+        '''
+            Run the input data (a TestData, with a column for each of the
+            input names) through the blocks; return the results (outputs,
+            rules), as for SimulationHarness.simulate_batch.
+        '''
+        columns = {vname: input_data.value[:, j]
+                   for j, vname in enumerate(input_data.names)}
+        num_tests = input_data.num_tests
+        chunks = [(start, min(start + self.chunk_rows, num_tests))
+                  for start in range(0, num_tests, self.chunk_rows)]
+        futures = OrderedDict()  # (Block name, chunk): future
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Submit in order, so a block only waits for blocks already
+            # running (or done), and earlier chunks go first:
+            for chunk in chunks:
+                for name, srcs in self.sources.items():
+                    inputs = {vname: columns[vname][slice(*chunk)]
+                              for vname, src in srcs.items() if src is None}
+                    waiting_for = [futures[(src, chunk)]
+                                   for src in set(srcs.values()) if src]
+                    futures[(name, chunk)] = executor.submit(
+                        self._run_stage, name, inputs, waiting_for)
+        output_data = TestData(self.output_names, num_tests)
+        rule_data = TestData(self.rule_names, num_tests)
+        for (name, chunk), future in futures.items():
+            outputs, activations = future.result()
+            rows = slice(*chunk)
+            for vname, values in outputs.items():
+                output_data.value[rows, output_data.names.index(vname)] = \
+                    values
+            for label, values in activations.items():
+                col = rule_data.names.index('{}.{}'.format(name, label))
+                rule_data.value[rows, col] = values
+        for row in np.flatnonzero(np.isnan(output_data.value).any(axis=1)):
+            output_data.message[row] = no_output_message(
+                [vname for vname, value in zip(output_data.names,
+                                               output_data.value[row])
+                 if np.isnan(value)])
+        return output_data, rule_data
@@ -119,7 +119,7 @@ class FCLLexer(object):
     tokens = '''
         INT_CONST FLOAT_CONST IDENTIFIER
         COMMA DOTDOT SEMICOLON COLON ASSIGN
-        LPAREN RPAREN
+        LPAREN RPAREN PLUS MINUS TIMES
         '''.split() + [a.upper() for a in reserved_words]
 
     # Token patterns:
@@ -130,6 +130,10 @@ class FCLLexer(object):
     t_ASSIGN = r':='
     t_LPAREN = r'\('
     t_RPAREN = r'\)'
+    # Only used in (TSK) functions; a sign before a digit is part of the number
+    t_PLUS = r'\+'
+    t_MINUS = r'-'
+    t_TIMES = r'\*'
 
     def t_ANY_newline(self, t):
         r'\n+'
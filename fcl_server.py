@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+'''
+    A small inference server: keep parsed FCL controllers in memory and
+    evaluate them on request, over HTTP on a localhost port or a Unix socket.
+
+    Requests that arrive together for the same controller are collected
+    into one batch (up to a maximum size, or waiting at most a short time)
+    and evaluated in one go by the simulation harness, using array inputs.
+    A controller is re-read if its FCL file changes, and a request for an
+    unknown controller makes the server look for new FCL files (but not
+    more than once a second or so, if they aren't found).  A file that
+    can't be read is logged and skipped; if it was a controller we had
+    already, we keep running the old version until the file changes again.
+
+      GET  /              the controllers, with their inputs and outputs
+      GET  /stats         latency and throughput for each controller
+      POST /<controller>  the body is a JSON object mapping input names to
+                          values, or a list of these; the reply is the
+                          output values in the same form (null if no output)
+
+    Run it as, e.g.:
+        python fcl_server.py Examples/jFuzzyLogic 8080
+        python fcl_server.py Examples/jFuzzyLogic /tmp/fcl.sock
+'''
+
+import collections
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Queue, Empty
+from socketserver import ThreadingMixIn, UnixStreamServer
+from timeit import default_timer
+
+import numpy as np
+
+from simulate import SimulationHarness, TestData
+
+_FCL_SUFFIX = '.fcl'
+
+# Defaults for collecting requests into batches:
+_MAX_BATCH = 1024    # rows
+_MAX_WAIT = 0.002    # seconds
+
+# The number of recent request latencies kept for the percentiles:
+_LATENCY_WINDOW = 1000
+
+# After looking for an unknown controller, wait this long before looking
+# again (in seconds), so bad requests can't keep us scanning the dirs:
+_RESCAN_INTERVAL = 1.0
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ControllerStats(object):
+    '''
+        Counts of the requests, rows and batches for one controller,
+        and the latency (from arrival to reply) of recent requests.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = default_timer()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=_LATENCY_WINDOW)
+
+    def record(self, latencies, num_rows, failed=False):
+        '''Note a batch: the latency of each of its requests, and its size'''
+        with self._lock:
+            self.batches += 1
+            self.requests += len(latencies)
+            self.rows += num_rows
+            self.errors += len(latencies) if failed else 0
+            self.latencies.extend(latencies)
+
+    def as_dict(self):
+        '''A summary of the stats, suitable for JSON'''
+        with self._lock:
+            elapsed = default_timer() - self.started
+            latencies = np.array(self.latencies)
+            summary = collections.OrderedDict([
+                ('requests', self.requests),
+                ('rows', self.rows),
+                ('batches', self.batches),
+                ('errors', self.errors),
+                ('rows_per_second', self.rows / elapsed if elapsed else 0),
+                ('mean_batch_rows',
+                 self.rows / self.batches if self.batches else 0),
+            ])
+        for pct in (50, 95, 99):
+            summary['latency_p{}'.format(pct)] = \
+                float(np.percentile(latencies, pct)) if len(latencies) else 0
+        return summary
+
+
+class Controller(object):
+    '''
+        One FCL file, parsed and ready to run (with array inputs).
+        Any extra arguments are passed to the SimulationHarness.
+    '''
+    def __init__(self, fclfile, engine='batch', **harness_args):
+        self.fclfile = fclfile
+        self.name = os.path.splitext(os.path.basename(fclfile))[0]
+        self.harness_args = dict(harness_args, engine=engine)
+        self.stats = ControllerStats()
+        self.harness = None
+        self.mtime = None
+        self.load_error = None  # Why the last reload failed (if it did)
+        self._bad_mtime = None  # The mtime of the file we couldn't read
+        self.load()
+
+    def load(self):
+        '''(Re-)read the FCL file'''
+        mtime = os.path.getmtime(self.fclfile)
+        harness = SimulationHarness(**self.harness_args)
+        harness.read_fcl_file(self.fclfile)
+        self.harness, self.mtime = harness, mtime
+
+    def maybe_reload(self):
+        '''
+            Re-read the FCL file if it has changed; return True if we did.
+            If it can't be read, log why and keep the old version, until
+            the file changes again.
+        '''
+        try:
+            mtime = os.path.getmtime(self.fclfile)
+        except OSError:  # Gone, perhaps only for now
+            return False
+        if mtime in (self.mtime, self._bad_mtime):
+            return False
+        try:
+            self.load()
+        except Exception as exc:
+            self.load_error, self._bad_mtime = exc, mtime
+            _LOGGER.error('Can\'t reload %s (keeping the old version): %s',
+                          self.fclfile, exc)
+            return False
+        self.load_error, self._bad_mtime = None, None
+        return True
+
+    @property
+    def input_names(self):
+        return list(self.harness.antecedents.keys())
+
+    @property
+    def output_names(self):
+        return list(self.harness.consequents.keys())
+
+    def evaluate(self, rows):
+        '''
+            Run the controller for a list of dicts (input name: value),
+            and return a list of dicts (output name: value, or None).
+        '''
+        input_data = TestData(self.input_names, len(rows))
+        for row, inputs in enumerate(rows):
+            missing = set(self.input_names) - set(inputs)
+            if missing:
+                raise ValueError('No value for input(s) {}'
+                                 .format(sorted(missing)))
+            input_data.value[row] = [float(inputs[name])
+                                     for name in self.input_names]
+        output_data, _ = self.harness.simulate_batch(input_data)
+        return [collections.OrderedDict(
+                    (name, None if np.isnan(value) else float(value))
+                    for name, value in zip(output_data.names, values))
+                for values in output_data.value]
+
+
+class _Request(object):
+    '''Some rows for a controller, waiting in a queue for their outputs'''
+    def __init__(self, rows):
+        self.rows = rows
+        self.arrived = default_timer()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    '''
+        Collect the requests for one controller into batches, and evaluate
+        each batch in one go, on a thread of its own.
+    '''
+    def __init__(self, controller, max_batch=_MAX_BATCH, max_wait=_MAX_WAIT):
+        self.controller = controller
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run,
+                                       name='batch-' + controller.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, rows):
+        '''Evaluate the rows (a list of input dicts), waiting for the result'''
+        request = _Request(rows)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        '''Stop the thread, once it has dealt with the queued requests'''
+        self.queue.put(None)
+        self.thread.join()
+
+    def _next_batch(self, first):
+        '''Collect requests after the first, until the batch is full or late'''
+        batch, num_rows = [first], len(first.rows)
+        deadline = default_timer() + self.max_wait
+        while num_rows < self.max_batch:
+            timeout = deadline - default_timer()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except Empty:
+                break
+            if request is None:  # Finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(request)
+            num_rows += len(request.rows)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            self._evaluate(self._next_batch(first))
+
+    def _evaluate(self, batch):
+        '''Run all the rows together, then hand back each request's part'''
+        rows = [inputs for request in batch for inputs in request.rows]
+        try:
+            self.controller.maybe_reload()
+            results = self.controller.evaluate(rows)
+        except Exception as exc:
+            if len(batch) > 1:  # Don't let one bad request spoil the rest
+                for request in batch:
+                    self._evaluate([request])
+                return
+            batch[0].error = exc
+            results = None
+        start = 0
+        for request in batch:
+            if results is not None:
+                request.result = results[start:start + len(request.rows)]
+                start += len(request.rows)
+        now = default_timer()
+        self.controller.stats.record([now - request.arrived
+                                      for request in batch],
+                                     len(rows), failed=results is None)
+        for request in batch:
+            request.done.set()
+
+
+class _HTTPRequestHandler(BaseHTTPRequestHandler):
+    '''Translate HTTP requests into calls to the InferenceServer'''
+
+    def _reply(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        inference = self.server.inference
+        if self.path.rstrip('/') == '':
+            self._reply(200, inference.describe())
+        elif self.path.rstrip('/') == '/stats':
+            self._reply(200, inference.stats())
+        else:
+            self._reply(404, {'error': 'Unknown path "{}"'.format(self.path)})
+
+    def do_POST(self):
+        name = self.path.strip('/')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            inputs = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as exc:
+            self._reply(400, {'error': 'Bad JSON: {}'.format(exc)})
+            return
+        try:
+            self._reply(200, self.server.inference.evaluate(name, inputs))
+        except KeyError:
+            self._reply(404, {'error': 'Unknown controller "{}"'
+                                       .format(name)})
+        except (ValueError, TypeError) as exc:
+            self._reply(400, {'error': str(exc)})
+        except Exception as exc:
+            self._reply(500, {'error': str(exc)})
+
+    def address_string(self):
+        # Unix sockets don't have a client address:
+        return str(self.client_address[0]) if self.client_address else '-'
+
+    def log_message(self, format, *args):
+        if self.server.inference.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+class InferenceServer(object):
+    '''
+        Keep a set of controllers (by name) and a batcher for each.
+        Give FCL files and/or directories to look in for them, and how
+        long to wait after a miss before looking in the dirs again;
+        other arguments are passed to each Controller.
+    '''
+    def __init__(self, paths=(), max_batch=_MAX_BATCH, max_wait=_MAX_WAIT,
+                 verbose=False, rescan_interval=_RESCAN_INTERVAL,
+                 **controller_args):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.verbose = verbose
+        self.rescan_interval = rescan_interval
+        self.controller_args = controller_args
+        self.dirs = []
+        self.batchers = collections.OrderedDict()  # Name: MicroBatcher
+        self._lock = threading.Lock()  # For dirs and batchers
+        self._last_miss = None  # When we last looked for a name in vain
+        self.http_server = None
+        for path in paths:
+            if os.path.isdir(path):
+                self.add_dir(path)
+            else:
+                self.add_controller(path)
+
+    def _add(self, controller):
+        '''Add (or replace) a controller; call with the lock held'''
+        old = self.batchers.get(controller.name)
+        self.batchers[controller.name] = MicroBatcher(
+            controller, self.max_batch, self.max_wait)
+        return old
+
+    def _scan_dir(self, dirpath):
+        '''
+            Add the FCL files we don't have yet; call with the lock held.
+            Any that can't be read are logged and skipped.
+        '''
+        try:
+            filenames = sorted(os.listdir(dirpath))
+        except OSError as exc:
+            _LOGGER.error('Can\'t look in %s: %s', dirpath, exc)
+            return
+        for filename in filenames:
+            name = os.path.splitext(filename)[0]
+            if filename.endswith(_FCL_SUFFIX) and name not in self.batchers:
+                fclfile = os.path.join(dirpath, filename)
+                try:
+                    controller = Controller(fclfile, **self.controller_args)
+                except Exception as exc:
+                    _LOGGER.error('Can\'t read %s: %s', fclfile, exc)
+                    continue
+                self._add(controller)
+
+    def add_controller(self, fclfile):
+        '''Read an FCL file and make it available; return its name'''
+        controller = Controller(fclfile, **self.controller_args)
+        with self._lock:
+            old = self._add(controller)
+        if old:
+            old.close()
+        return controller.name
+
+    def add_dir(self, dirpath):
+        '''Add all the FCL files in this dir (and watch it for new ones)'''
+        with self._lock:
+            if dirpath not in self.dirs:
+                self.dirs.append(dirpath)
+            self._scan_dir(dirpath)
+
+    def _batcher(self, name):
+        '''
+            The batcher for the named controller; if we don't have it,
+            look for new files (unless we looked very recently).
+            Raises KeyError if there's no such controller.
+        '''
+        with self._lock:
+            if name not in self.batchers:
+                now = default_timer()
+                if self._last_miss is not None and \
+                        now - self._last_miss < self.rescan_interval:
+                    raise KeyError(name)
+                for dirpath in self.dirs:
+                    self._scan_dir(dirpath)
+                if name not in self.batchers:
+                    self._last_miss = now
+                    raise KeyError(name)
+            return self.batchers[name]
+
+    def controller(self, name):
+        '''The named controller; look for new files if we don't have it'''
+        return self._batcher(name).controller
+
+    def evaluate(self, name, inputs):
+        '''
+            Evaluate the named controller for one dict of inputs,
+            or a list of them, and return the outputs likewise.
+        '''
+        batcher = self._batcher(name)  # Raises KeyError if unknown
+        if isinstance(inputs, dict):
+            return batcher.submit([inputs])[0]
+        if not isinstance(inputs, list):
+            raise TypeError('Inputs should be an object or a list')
+        return batcher.submit(inputs)
+
+    def _all_batchers(self):
+        '''A copy of the batchers, safe to look through'''
+        with self._lock:
+            return collections.OrderedDict(self.batchers)
+
+    def describe(self):
+        '''The name, inputs and outputs of each controller'''
+        return collections.OrderedDict(
+            (name, {'inputs': batcher.controller.input_names,
+                    'outputs': batcher.controller.output_names})
+            for name, batcher in self._all_batchers().items())
+
+    def stats(self):
+        '''The stats for each controller'''
+        return collections.OrderedDict(
+            (name, batcher.controller.stats.as_dict())
+            for name, batcher in self._all_batchers().items())
+
+    def make_http_server(self, address):
+        '''
+            Make (but don't start) an HTTP server: the address is a port
+            number (on localhost), or else a path for a Unix socket.
+        '''
+        if isinstance(address, int):
+            server = _ThreadingHTTPServer(('localhost', address),
+                                          _HTTPRequestHandler)
+        else:
+            assert hasattr(socket, 'AF_UNIX'), 'No Unix sockets here'
+            if os.path.exists(address):
+                os.remove(address)
+            server = _ThreadingUnixHTTPServer(address, _HTTPRequestHandler)
+        server.inference = self
+        self.http_server = server
+        return server
+
+    def serve(self, address):
+        '''Serve requests until interrupted'''
+        server = self.make_http_server(address)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.close()
+
+    def close(self):
+        '''Stop all the batchers (and the HTTP server, if running)'''
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server = None
+        for batcher in self._all_batchers().values():
+            batcher.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: {} fcl-dir-or-file (port | socket-path)'
+              .format(sys.argv[0]))
+        sys.exit(1)
+    _ADDRESS = int(sys.argv[2]) if sys.argv[2].isdigit() else sys.argv[2]
+    InferenceServer([sys.argv[1]], verbose=True).serve(_ADDRESS)
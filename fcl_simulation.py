@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+'''
+    A version of the skfuzzy ControlSystemSimulation that lets us choose
+    how the consequents are defuzzified.  The rules are fired just as
+    before; only the last step, from term activations to crisp outputs,
+    is different.
+
+    Engines:
+      * 'sampled': the usual skfuzzy way, sampling the terms over the universe
+        (where no rule fires, skfuzzy still gives the MOM/SOM/LOM of the
+        whole universe; the other engines give no output, i.e. NaN)
+      * 'exact': keep piecewise-linear terms as breakpoints, and defuzzify
+        them in closed form (see plmf.py); any consequent whose terms are
+        not all piecewise linear is still sampled.
+      * 'batch': sample the terms, but accumulate and defuzzify all the
+        inputs (for array inputs) at once (see batchdefuzz.py).
+      * 'sparse': cut, accumulate and defuzzify only the supports of the
+        terms (see sparsemf.py); best with a parser made with sparse=True,
+        whose output terms are never made into full arrays.
+
+    Given a RuleIndex (see ruleindex.py), only the rules that might fire
+    for the current inputs are evaluated; the others are set to zero.
+
+    We also time each stage of compute(): the inference (fuzzifying the
+    inputs and firing the rules), then (for the 'batch' engine) cutting
+    the terms and accumulating them, then the defuzzification.  Given a
+    Profile (see profiling.py), we also add the wall and CPU time for each
+    stage, rule block and consequent to it.  If metrics are enabled (see
+    metrics.py), we count the rules, terms, hedges and norms as we go.
+
+    Whatever the engine, the weighted-average and weighted-sum methods
+    (COGS and COGSS in FCL) are done here too, since skfuzzy doesn't have
+    them; see weighted.py.  These are also used for TSK outputs (tsk.py),
+    where the average is over the rules, each weighted by its own
+    activation, rather than over the (accumulated) terms.
+'''
+
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+import skfuzzy.control.term as fuzzterm
+from skfuzzy.control import ControlSystemSimulation
+from skfuzzy.control.controlsystem import CrispValueCalculator
+from skfuzzy.control.exceptions import EmptyMembershipError, \
+    NoTermMembershipsError
+
+import batchdefuzz
+import metrics
+import plmf
+import profiling
+import sparsemf
+import tsk
+import weighted
+from fcl_symbols import NameMapper
+from hedges import HedgedClause
+
+_ENGINES = ('sampled', 'exact', 'batch', 'sparse')
+
+# The stages of compute() that we time:
+_STAGES = ('inference', 'activation', 'accumulation', 'defuzzification')
+
+
+def _all_names():
+    '''A NameMapper that knows all the names the parser knows'''
+    names = NameMapper()
+    names.load_ieee_names()
+    names.load_fcl_names_too()
+    names.load_jfl_names()
+    return names
+
+
+class FCLSimulation(ControlSystemSimulation):
+    '''
+        A ControlSystemSimulation with a choice of defuzzification engine.
+        Supply a NameMapper (e.g. the parser) to look up the mf names
+        recorded in the terms; by default we know all the usual names.
+    '''
+    def __init__(self, control_system, engine='sampled', names=None,
+                 rule_index=None, **kwargs):
+        assert engine in _ENGINES,\
+            'Unknown engine "{}", should be one of {}'.format(engine,
+                                                              _ENGINES)
+        ControlSystemSimulation.__init__(self, control_system, **kwargs)
+        self.engine = engine
+        self.names = names if names else _all_names()
+        self._pl_terms = {}  # Consequent label: breakpoints (or None)
+        self._positions = {}  # Consequent label: term positions
+        self._sparse_terms = {}  # Consequent label: its SparseMFs
+        self.rule_activation = OrderedDict()  # Rule label: activation
+        self.timings = OrderedDict()  # Stage: seconds, for the last compute
+        self.rule_index = rule_index
+        self._live_rules = None  # Labels of the rules to evaluate (or all)
+        self.profile = None  # A Profile to add our timings to (if any)
+        self._profiled = [0.0, 0.0]  # Profiled wall, CPU in this compute
+        self._rule_ops = {}  # Rule label: its norm and hedge counts
+        self.controller = metrics._NO_CONTROLLER  # Our name, for metrics
+
+    def _term_breakpoints(self, consequent):
+        '''The breakpoints for the consequent's terms (None if not PL)'''
+        if consequent.label not in self._pl_terms:
+            self._pl_terms[consequent.label] = \
+                plmf.pl_terms(consequent, self.names.translate_mf)
+        return self._pl_terms[consequent.label]
+
+    def _cuts(self, consequent, idx=None):
+        '''The activation level for each term (for one input, if an array)'''
+        cuts = OrderedDict()
+        for name, term in consequent.terms.items():
+            level = term.membership_value[self]
+            if level is not None and idx is not None:
+                level = level[idx]
+            cuts[name] = level
+        return cuts
+
+    def _term_positions(self, consequent):
+        '''The positions used for weighted average/sum (see weighted.py)'''
+        if consequent.label not in self._positions:
+            self._positions[consequent.label] = \
+                weighted.term_positions(consequent, self.names.translate_mf)
+        return self._positions[consequent.label]
+
+    def _rule_levels(self, consequent):
+        '''
+            The activation of each rule (as a list) for the consequent,
+            and the index of the term that each rule sets.
+        '''
+        index = {id(term): num
+                 for num, term in enumerate(consequent.terms.values())}
+        wterms = [wterm for rule in self.ctrl.rules
+                  for wterm in rule.consequent
+                  if wterm.term.parent is consequent]
+        return ([wterm.activation[self] for wterm in wterms],
+                [index[id(wterm.term)] for wterm in wterms])
+
+    def defuzz_weighted(self, consequent):
+        '''
+            Weighted average/sum of the term positions; for array inputs
+            this is one (inputs x terms) by (terms) product.  For TSK terms
+            it's over the rules instead, each weighted by its activation:
+            an (inputs x rules) by (inputs x rules) row-by-row product.
+        '''
+        is_tsk = tsk.has_function_terms(consequent)
+        if is_tsk:
+            levels, which = self._rule_levels(consequent)
+        else:
+            levels = [term.membership_value[self]
+                      for term in consequent.terms.values()]
+        if all(level is None for level in levels):
+            raise NoTermMembershipsError(consequent)
+        shape = self._array_shape if self._array_inputs else ()
+        weights = np.stack([np.zeros(shape) if level is None
+                            else np.broadcast_to(level, shape)
+                            for level in levels], axis=-1)
+        if not np.any(weights > 0):
+            raise EmptyMembershipError(consequent)
+        positions = self._term_positions(consequent)
+        if is_tsk:
+            inputs = {antecedent.label: antecedent.input[self]
+                      for antecedent in self.ctrl.antecedents}
+            positions = tsk.function_positions(consequent, positions,
+                                               inputs, shape)[..., which]
+        defuzz_func = \
+            weighted._WEIGHTED_DEFUZZ[weighted.weighted_method(consequent)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return defuzz_func(weights, positions)
+
+    def defuzz_exact(self, consequent, terms):
+        '''
+            Defuzzify from the breakpoints, for each input if an array
+            (where an input with no memberships gives NaN, as for 'batch').
+        '''
+        if not self._array_inputs:
+            return plmf.defuzz_cuts(consequent, terms, self._cuts(consequent))
+        output = np.zeros(self._array_shape, dtype=np.float64)
+        for idx in np.ndindex(*self._array_shape):
+            try:
+                output[idx] = plmf.defuzz_cuts(consequent, terms,
+                                               self._cuts(consequent, idx))
+            except EmptyMembershipError:  # As for 'batch', just this input
+                output[idx] = np.nan
+        return output
+
+    def defuzz_sparse(self, consequent):
+        '''
+            Defuzzify from the term supports, for each input if an array
+            (where an input with no memberships gives NaN, as for 'batch').
+        '''
+        if consequent.label not in self._sparse_terms:
+            self._sparse_terms[consequent.label] = \
+                sparsemf.sparse_terms(consequent, self.names.translate_mf)
+        sparse = self._sparse_terms[consequent.label]
+        if not self._array_inputs:
+            return sparsemf.defuzz_cuts(consequent, sparse,
+                                        self._cuts(consequent))
+        output = np.zeros(self._array_shape, dtype=np.float64)
+        for idx in np.ndindex(*self._array_shape):
+            try:
+                output[idx] = sparsemf.defuzz_cuts(consequent, sparse,
+                                                   self._cuts(consequent, idx))
+            except EmptyMembershipError:  # As for 'batch', just this input
+                output[idx] = np.nan
+        return output
+
+    def _add_time(self, stage, start):
+        '''Add the time since start to the given stage; return the time now'''
+        now = default_timer()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - start)
+        return now
+
+    def defuzz_batch(self, consequent):
+        '''
+            Cut and accumulate the terms for many inputs at once, in one
+            (inputs x terms x universe) array, and defuzzify all the rows.
+            The inputs are done in chunks, to keep this array to a
+            reasonable size (see batchdefuzz.chunk_rows).
+        '''
+        start = default_timer()
+        levels = OrderedDict((name, term.membership_value[self])
+                             for name, term in consequent.terms.items())
+        used = [name for name, level in levels.items() if level is not None]
+        if not used:
+            raise NoTermMembershipsError(consequent)
+        shape = self._array_shape if self._array_inputs else ()
+        weights = np.stack([np.broadcast_to(levels[name], shape)
+                            for name in used], axis=-1).reshape(-1, len(used))
+        term_mfs = [consequent[name].mf for name in used]
+        chunk = batchdefuzz.chunk_rows(len(used), len(consequent.universe))
+        output = np.empty(len(weights), dtype=np.float64)
+        for first in range(0, len(weights), chunk):
+            rows = slice(first, first + chunk)
+            tensor = batchdefuzz.activation_tensor(term_mfs, weights[rows])
+            start = self._add_time('activation', start)
+            mfs = batchdefuzz.accumulate(tensor)
+            start = self._add_time('accumulation', start)
+            output[rows] = batchdefuzz.defuzz(consequent.universe, mfs,
+                                              consequent.defuzzify_method)
+            start = default_timer()  # Defuzzifying is timed by the caller
+        if not self._array_inputs:
+            if np.isnan(output[0]):
+                raise EmptyMembershipError(consequent)
+            return output[0]
+        return output.reshape(shape)
+
+    def defuzz_consequent(self, consequent):
+        '''Work out the crisp output value for this consequent'''
+        if weighted.weighted_method(consequent) in weighted._WEIGHTED_DEFUZZ:
+            return self.defuzz_weighted(consequent)
+        if self.engine == 'exact' and \
+                consequent.defuzzify_method in plmf._PL_DEFUZZ:
+            terms = self._term_breakpoints(consequent)
+            if terms is not None:
+                return self.defuzz_exact(consequent, terms)
+        if self.engine == 'batch' and \
+                consequent.defuzzify_method in batchdefuzz._BATCH_DEFUZZ:
+            return self.defuzz_batch(consequent)
+        if self.engine == 'sparse' and \
+                consequent.defuzzify_method in sparsemf._SPARSE_DEFUZZ:
+            return self.defuzz_sparse(consequent)
+        return CrispValueCalculator(consequent, self).defuzz()
+
+    def _find_live_rules(self):
+        '''Use the rule index (if any) to find the rules to evaluate'''
+        self._live_rules = None
+        if self.rule_index is None:
+            return
+        inputs = {}
+        for antecedent in self.ctrl.antecedents:
+            value = antecedent.input['current']
+            if value is None or isinstance(value, str):
+                return  # Evaluate them all (skfuzzy will complain if need be)
+            inputs[antecedent.label] = value
+        self._live_rules = self.rule_index.live_rules(inputs)
+
+    def _fire_rule(self, rule):
+        '''Work out the rule's firing and activations, as skfuzzy does'''
+        if isinstance(rule.antecedent, fuzzterm.TermAggregate):
+            rule.antecedent.agg_methods = rule._aggregation_methods
+        rule.aggregate_firing[self] = rule.antecedent.membership_value[self]
+        for wterm in rule.consequent:
+            wterm.activation[self] = rule.aggregate_firing[self] * wterm.weight
+
+    def _accumulate_rule(self, rule):
+        '''Add the rule's activations to its output terms, as skfuzzy does'''
+        for wterm in rule.consequent:
+            term = wterm.term
+            value = wterm.activation[self]
+            if term.membership_value[self] is None:
+                term.membership_value[self] = value
+            else:
+                accu = term.parent.accumulation_method
+                term.membership_value[self] = accu(value,
+                                                   term.membership_value[self])
+            term.cuts[self][rule.label] = term.membership_value[self]
+
+    def _profile_since(self, start, stage):
+        '''Add the time since start to the stage; return the clocks now'''
+        now = profiling.clocks()
+        wall, cpu = now[0] - start[0], now[1] - start[1]
+        self.profile.add('stages', stage, wall, cpu)
+        self._profiled[0] += wall
+        self._profiled[1] += cpu
+        return now
+
+    def _num_rows(self):
+        '''The number of inputs being run at once'''
+        return int(np.prod(self._array_shape)) if self._array_inputs else 1
+
+    def _find_rule_ops(self, rule):
+        '''
+            Count the norms and hedges in the rule's antecedent: a list of
+            (counter, labels, count) for each evaluation of the rule.
+        '''
+        counts = OrderedDict()
+        clauses = [rule.antecedent]
+        while clauses:
+            clause = clauses.pop()
+            if isinstance(clause, HedgedClause):
+                key = ('hedge_applications_total', (('stage', 'simulate'),))
+                counts[key] = counts.get(key, 0) + len(clause.hedge_names)
+            elif isinstance(clause, fuzzterm.TermAggregate):
+                if clause.kind in ('and', 'or'):
+                    func = getattr(rule, '{}_func'.format(clause.kind))
+                    key = ('norm_calls_total',
+                           (('func', getattr(func, '__name__', str(func))),
+                            ('op', clause.kind)))
+                    counts[key] = counts.get(key, 0) + 1
+            else:
+                continue
+            clauses.extend(term for term in (clause.term1, clause.term2)
+                           if term is not None)
+        return [(name, labels, count)
+                for (name, labels), count in counts.items()]
+
+    def _count_rule(self, registry, rule, skipped):
+        '''Count the rule as skipped or evaluated, with its norms and hedges'''
+        rows = self._num_rows()
+        if skipped:
+            registry.inc('rules_skipped_total', rows,
+                         controller=self.controller)
+            return
+        registry.inc('rules_evaluated_total', rows, controller=self.controller)
+        if rule.label not in self._rule_ops:
+            self._rule_ops[rule.label] = self._find_rule_ops(rule)
+        for name, labels, count in self._rule_ops[rule.label]:
+            registry.inc(name, rows * count, controller=self.controller,
+                         **dict(labels))
+        for wterm in rule.consequent:  # The first setting isn't a call
+            if wterm.term.membership_value[self] is not None:
+                accu = wterm.term.parent.accumulation_method
+                registry.inc('norm_calls_total', rows, op='accu',
+                             func=getattr(accu, '__name__', str(accu)),
+                             controller=self.controller)
+
+    def _count_nan_outputs(self, output):
+        '''
+            Count each input in an array run whose output is NaN (e.g. for
+            the 'batch' engine) as a failure, just as a single run would be.
+        '''
+        failed = np.count_nonzero(np.isnan(output))
+        if failed:
+            metrics.active.inc('defuzz_failures_total', failed,
+                               reason=EmptyMembershipError.__name__,
+                               controller=self.controller)
+
+    def compute_rule(self, rule):
+        '''
+            Evaluate the rule as usual if it might fire; otherwise set its
+            firing and activations to zero, just as evaluating it would.
+        '''
+        skipped = self._live_rules is not None and \
+            rule.label not in self._live_rules
+        if metrics.active is not None:
+            self._count_rule(metrics.active, rule, skipped)
+        if skipped:
+            zero = np.zeros(self._array_shape) if self._array_inputs else 0.0
+            rule.aggregate_firing[self] = zero
+            for wterm in rule.consequent:
+                wterm.activation[self] = zero
+                if wterm.term.membership_value[self] is None:
+                    wterm.term.membership_value[self] = zero
+        elif self.profile is None:
+            ControlSystemSimulation.compute_rule(self, rule)
+        else:
+            start = profiling.clocks()
+            self._fire_rule(rule)
+            now = self._profile_since(start, 'aggregation')
+            self._accumulate_rule(rule)
+            now = self._profile_since(now, 'accumulation')
+            self.profile.add('rule_blocks', getattr(rule, 'rule_block', None)
+                             or profiling._NO_RULE_BLOCK,
+                             now[0] - start[0], now[1] - start[1])
+
+    def compute(self):
+        '''Run the simulation as usual, but time the stages'''
+        self.timings = OrderedDict((stage, 0.0) for stage in _STAGES)
+        start = default_timer()
+        if self.profile is not None:
+            self._profiled = [0.0, 0.0]
+            pstart = profiling.clocks()
+        self._find_live_rules()
+        if metrics.active is not None:
+            metrics.active.inc('terms_fuzzified_total', self._num_rows() *
+                               sum(len(antecedent.terms)
+                                   for antecedent in self.ctrl.antecedents),
+                               controller=self.controller)
+        ControlSystemSimulation.compute(self)
+        self.timings['inference'] = default_timer() - start \
+            - sum(self.timings.values())
+        if self.profile is not None:  # Whatever wasn't profiled elsewhere
+            now = profiling.clocks()
+            self.profile.add('stages', 'fuzzification',
+                             now[0] - pstart[0] - self._profiled[0],
+                             now[1] - pstart[1] - self._profiled[1])
+
+    def defuzz_consequents(self):
+        '''
+            Collect and return the defuzzified consequents.
+            Also note each rule's activation (for its first consequent)
+            here, since skfuzzy forgets these after an array-input run.
+        '''
+        self.rule_activation = OrderedDict(
+            (rule.label, rule.consequent[0].activation[self])
+            for rule in self.ctrl.rules)
+        if metrics.active is not None:
+            metrics.active.inc('rules_zero_total', int(sum(
+                np.count_nonzero(np.asarray(activation) == 0)
+                for label, activation in self.rule_activation.items()
+                if self._live_rules is None or label in self._live_rules)),
+                controller=self.controller)
+        results = {}
+        start = default_timer()
+        for consequent in self.ctrl.consequents:
+            if self.profile is not None:
+                pstart = profiling.clocks()
+            try:
+                consequent.output[self] = self.defuzz_consequent(consequent)
+                if metrics.active is not None and self._array_inputs:
+                    self._count_nan_outputs(consequent.output[self])
+            except (NoTermMembershipsError, EmptyMembershipError) as error:
+                if metrics.active is not None:
+                    metrics.active.inc('defuzz_failures_total',
+                                       reason=type(error).__name__,
+                                       controller=self.controller)
+                if self.lenient:
+                    continue
+                else:
+                    raise error
+            finally:
+                if self.profile is not None:
+                    now = self._profile_since(pstart, 'defuzzification')
+                    self.profile.add('consequents', consequent.label,
+                                     now[0] - pstart[0], now[1] - pstart[1])
+            results[consequent.label] = consequent.output[self]
+        self.timings['defuzzification'] = default_timer() - start \
+            - self.timings.get('activation', 0.0) \
+            - self.timings.get('accumulation', 0.0)
+        return results
@@ -8,6 +8,7 @@
     @author: james.power@mu.ie Created on Wed Aug 22 11:59:59 2018
 '''
 
+import os
 from collections import OrderedDict
 import numpy as np
 
@@ -18,6 +19,7 @@ import skfuzzy.control.term as fuzzterm
 
 import extramf
 import hedges
+import pointmf
 import tnorms
 
 # ############################
@@ -71,6 +73,11 @@ _FCL_MF = {  # FCL name: (fuzz-mf,  split-parameters?)
     'zshape':            (fuzzmf.zmf, True),
 }
 
+# The same mfs again, but evaluated at any points (without a universe):
+_IEEE_POINT_MF = pointmf.point_versions(_IEEE_MF)
+_JFUZZYLOGIC_POINT_MF = pointmf.point_versions(_JFUZZYLOGIC_MF)
+_FCL_POINT_MF = pointmf.point_versions(_FCL_MF)
+
 # ################################
 # ### Defuzzification methods: ###
 # ################################
@@ -85,11 +92,14 @@ _IEEE_DEFUZZ = {
     'mom': 'mom'
 }
 
+# Not all of these are skfuzzy names: the parser records the weighted ones
+# as an output's weighted_method instead (see weighted.py):
 _FCL_DEFUZZ = {
     'mm':  'mom',
-    'cogs': 'centroid',
-    # 'cogs':  WeightedAverage, not implemented
-    # 'cogss': WeightedSum, not implemented
+    'cogs':  'wtaver',
+    'cogss': 'wtsum',
+    'weightedaverage': 'wtaver',
+    'weightedsum':     'wtsum',
 }
 
 
@@ -162,6 +172,7 @@ class NameMapper(object):
             Can load in names from IEEE XML standard as well as FCL.
         '''
         self.known_mfs = {}       # Membership functions
+        self.known_point_mfs = {}  # The same, evaluated at arbitrary points
         self.defuzz_methods = {}  # Defuzzification methods
         self.and_names = {}       # And function (to be applied in rules)
         self.or_names = {}        # Or function (to be applied in rules)
@@ -170,6 +181,7 @@ class NameMapper(object):
     def load_ieee_names(self):
         '''Load in the names used by the IEEE (XML) standard'''
         self.known_mfs.update(_IEEE_MF)
+        self.known_point_mfs.update(_IEEE_POINT_MF)
         self.defuzz_methods.update(_IEEE_DEFUZZ)
         self.and_names.update(_IEEE_AND)
         self.or_names.update(_IEEE_OR)
@@ -181,12 +193,14 @@ class NameMapper(object):
             Note: we assume you've already loaded in the IEEE names.
         '''
         self.known_mfs.update(_FCL_MF)
+        self.known_point_mfs.update(_FCL_POINT_MF)
         self.defuzz_methods.update(_FCL_DEFUZZ)
         self.and_names.update(_FCL_AND)
         self.or_names.update(_FCL_OR)
 
     def load_jfl_names(self):
         self.known_mfs.update(_JFUZZYLOGIC_MF)
+        self.known_point_mfs.update(_JFUZZYLOGIC_POINT_MF)
         self.and_names.update(_JFUZZYLOGIC_AND)
         self.or_names.update(_JFUZZYLOGIC_OR)
 
@@ -205,6 +219,16 @@ class NameMapper(object):
         else:
             self._unsupported('membership function "{}"'.format(mf_name))
 
+    def translate_point_mf(self, mf_name):
+        '''
+            Translate a member-function name to a function that evaluates it
+            at arbitrary points (rather than over a universe).
+        '''
+        if mf_name.lower() in self.known_point_mfs:
+            return self.known_point_mfs[mf_name.lower()]
+        else:
+            self._unsupported('membership function "{}"'.format(mf_name))
+
     def translate_defuzz(self, df_name):
         '''Translate a given defuzz method to its skfuzzy name'''
         if df_name.lower() in self.defuzz_methods:
@@ -274,12 +298,20 @@ class SymbolTable(object):
     def __init__(self, varlist=None):
         '''Set up an empty symbol table; optionally supply list of variables'''
         self.fb_name = None   # Name of function block (if any in file)
+        self.fclfile = None   # The file read (if any)
         self.variables = OrderedDict()   # Map variable label to FuzzyVariable
         self.all_rules = OrderedDict()   # Map rule label to Rule object
         self.error_on_redefine = False
         if varlist:
             self.add_vars(varlist)
 
+    @property
+    def controller_name(self):
+        '''A name for the controller: from its file, else its function block'''
+        if self.fclfile:
+            return os.path.splitext(os.path.basename(self.fclfile))[0]
+        return self.fb_name
+
     def flag_error_on_redefine(self):
         '''
             Signal an error if var or rule is redefined.
@@ -290,6 +322,7 @@ class SymbolTable(object):
     def clear(self):
         ''' Empty all items in the symbol table'''
         self.fb_name = None
+        self.fclfile = None
         self.variables.clear()
         self.all_rules.clear()
 
@@ -380,6 +413,13 @@ class SymbolTable(object):
         self.all_rules[rule.label] = rule
         return rule
 
+    def remove_rule(self, label):
+        '''Remove the rule with this label; return the rule object'''
+        if label not in self.all_rules:
+            self._report_error('Rule "{}" not found'.format(label),
+                               'scope error')
+        return self.all_rules.pop(label)
+
     def set_rule_label(self, rule, new_label):
         '''
             Changing the rule label has consequences for our dict,
@@ -411,7 +451,8 @@ class SymbolTable(object):
             pstr += 'Function-Block "{}"\n'.format(self.fb_name)
         for var in self.fuzzy_variables:
             lo, hi = np.min(var.universe), np.max(var.universe)
-            pstr += '{}, range := ({} .. {})\n'.format(var, lo, hi)
+            pstr += '{}, range := ({} .. {}), {} points\n'.format(
+                var, lo, hi, len(var.universe))
             pstr += '{}terms: {}\n'.format(' '*12, [t for t in var.terms])
         for rule in self.rules:
             pstr += 'Rule {}: {}\n'.format(rule.label, rule)
@@ -12,6 +12,7 @@
 
 import numpy as np
 import skfuzzy.membership as skmemb
+import skfuzzy.control.term as fuzzterm
 import extramf
 
 
@@ -118,6 +119,149 @@ _IEEE_HEDGES = {
 }
 
 
+# ########################################### #
+# ### Planning and fusing chains of hedges ### #
+# ########################################### #
+
+# These hedges are just powers of the mf, so a chain of them is one power:
+_POWER_HEDGES = {
+    extremely:    3,
+    more_or_less: 1/3,
+    plus:         5/4,
+    somewhat:     1/2,
+    very:         2,
+}
+
+
+# Pointwise hedges only look at one membership degree at a time,
+# so these can be applied to a single value as well as to a whole mf:
+_POINTWISE_HEDGES = set(_POWER_HEDGES) | {any_of, intensify, is_not, seldom}
+
+
+def _intensify_values(mf):
+    '''Same as intensify, but for any shape of input (even a scalar)'''
+    return np.where(mf <= 0.5, 2 * (mf ** 2), 1 - (2 * ((1 - mf) ** 2)))
+
+
+def _seldom_values(mf):
+    '''Same as seldom, but for any shape of input (even a scalar)'''
+    return np.where(mf <= 0.5, np.sqrt(mf / 2), 1 - np.sqrt((1 - mf) / 2))
+
+
+_ANY_SHAPE_HEDGES = {
+    intensify: _intensify_values,
+    seldom:    _seldom_values,
+}
+
+
+def is_pointwise(hedge_func):
+    '''Does this hedge work on each membership degree separately?'''
+    return hedge_func in _POINTWISE_HEDGES
+
+
+def plan_hedges(hedge_funcs):
+    '''
+        Work out the steps needed to apply a chain of hedge functions.
+        The chain is given as written, outermost first, so "very somewhat"
+        is [very, somewhat]; the steps are returned innermost first.
+        Each step is a pair: ('power', exponent), ('not', None) or
+        ('func', hedge_func).  Runs of power hedges are folded into a
+        single exponent, a double 'not' cancels out, and 'any' discards
+        whatever is inside it.
+    '''
+    steps = []
+    for func in reversed(hedge_funcs):
+        if func is any_of:  # Result is all 1's, whatever went before
+            steps = [('func', any_of)]
+        elif func in _POWER_HEDGES:
+            exponent = _POWER_HEDGES[func]
+            if steps and steps[-1][0] == 'power':
+                exponent *= steps.pop()[1]
+            if exponent != 1:  # e.g. very somewhat is the identity
+                steps.append(('power', exponent))
+        elif func is is_not:
+            if steps and steps[-1][0] == 'not':
+                steps.pop()
+            else:
+                steps.append(('not', None))
+        else:
+            steps.append(('func', _ANY_SHAPE_HEDGES.get(func, func)))
+    return steps
+
+
+def _apply_step(step, mf):
+    '''
+        Apply one planned step to the mf; overwrites mf where possible.
+        Return the result (which may or may not be the same array).
+    '''
+    kind, arg = step
+    if kind == 'power':
+        return np.power(mf, arg, out=mf)
+    elif kind == 'not':
+        return np.subtract(1, mf, out=mf)
+    else:  # Some other hedge function, not done in-place
+        return arg(mf)
+
+
+def fuse_hedges(hedge_funcs):
+    '''
+        Return a single function that applies the chain of hedge functions,
+        given outermost first, i.e. in the order they appear in a rule.
+        This gives the same results as applying each in turn (from the
+        last one), but makes one copy of the mf and works on that.
+    '''
+    steps = plan_hedges(hedge_funcs)
+
+    def hedged(mf):
+        '''Apply the planned hedge steps to a copy of the mf'''
+        new_mf = np.array(mf, dtype=np.result_type(np.asarray(mf),
+                                                   np.float32))
+        for step in steps:
+            new_mf = _apply_step(step, new_mf)
+        return new_mf[()] if np.ndim(new_mf) == 0 else new_mf
+    hedged.steps = steps
+    return hedged
+
+
+# ############################################ #
+# ### Hedges applied to membership degrees ### #
+# ############################################ #
+
+class _HedgedValueAccessor(object):
+    '''Applies the hedges to the term's membership value in a simulation'''
+    def __init__(self, clause):
+        self.clause = clause
+
+    def __getitem__(self, sim):
+        value = self.clause.term1.membership_value[sim]
+        return self.clause.hedge_func(value)
+
+
+class HedgedClause(fuzzterm.TermAggregate):
+    '''
+        A rule clause like "temp IS very hot", where all the hedges are
+        pointwise: rather than making a new (hedged) mf for the variable,
+        the hedges are applied to the membership degree of "hot" each time
+        the rule is evaluated.  Pretends to be a 'not' aggregate with one
+        term, so that skfuzzy can find the term when building the graph.
+    '''
+    def __init__(self, term, hedge_names, hedge_funcs):
+        assert all(is_pointwise(f) for f in hedge_funcs),\
+            'Only pointwise hedges can be applied to membership degrees'
+        fuzzterm.TermAggregate.__init__(self, term, None, 'not')
+        self.kind = 'hedge'
+        self.hedge_names = list(hedge_names)
+        self.hedge_func = fuse_hedges(hedge_funcs)
+        self.membership_value = _HedgedValueAccessor(self)
+
+    def __repr__(self):
+        if isinstance(self.term1, fuzzterm.Term):
+            term_str = self.term1.full_label
+        else:
+            term_str = '({!s})'.format(self.term1)
+        return '{}-{}'.format('-'.join(self.hedge_names).upper(), term_str)
+
+
 def test_all_hedges(y):
     results = []
     hedgenames = sorted(all_hedges.keys())  # Want them in alphabetical order
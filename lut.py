@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+'''
+    Response surfaces: run a controller with few inputs once, over a grid
+    of input values, and then answer later queries by (multi)linear
+    interpolation on that grid, without running the controller at all.
+
+    The grid for each input is evenly spaced over its range.  The output
+    (and optionally the rule fire-strength) surfaces can be saved as .npy
+    files, one per surface, plus a JSON file with the names and axes;
+    loading them back maps the files into memory rather than reading them.
+    A grid point where no rule fired has a NaN output, and so does any
+    query that interpolates from it.
+
+        surface = build_surface(harness, points=101)
+        surface.check_error(harness)   # max. error, vs. running harness
+        surface.save('tipper.lut')
+        surface = ResponseSurface.load('tipper.lut')
+        outputs = surface.evaluate({'food': [3, 4], 'service': [7, 8]})
+'''
+
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from simulate import TestData
+
+_DEFAULT_GRID_POINTS = 51
+_MAX_GRID_SIZE = 10**7   # Total number of grid points allowed
+_CHUNK_ROWS = 4096       # Grid points per batch when building
+_DEFAULT_CHECK_SAMPLES = 1000
+
+_META_FILE = 'surface.json'
+
+
+class ResponseSurface(object):
+    '''
+        Output values (and maybe rule strengths) on a grid of input values:
+        axes is a list of 1-D arrays, one per input, and each surface is an
+        array with one dimension per input.
+    '''
+    def __init__(self, input_names, axes, outputs, rules=None):
+        self.input_names = list(input_names)
+        self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+        self.outputs = OrderedDict(outputs)         # Name: surface
+        self.rules = OrderedDict(rules if rules else [])  # Label: surface
+        self.max_error = OrderedDict()  # Output name: error (see check_error)
+        shape = tuple(len(axis) for axis in self.axes)
+        assert all(len(axis) > 1 for axis in self.axes),\
+            'Need at least two grid points per input'
+        assert all(s.shape == shape for s in self.all_surfaces().values()),\
+            'All surfaces must have shape {}'.format(shape)
+
+    def all_surfaces(self):
+        '''All the surfaces, keyed by their file names (without suffix)'''
+        surfaces = OrderedDict(('output.' + name, values)
+                               for name, values in self.outputs.items())
+        surfaces.update(('rule.' + label, values)
+                        for label, values in self.rules.items())
+        return surfaces
+
+    def _corners(self, inputs):
+        '''
+            For each input value, the index of the grid cell it's in,
+            and how far along the cell it is (0 to 1), for each axis.
+        '''
+        indexes, fractions = [], []
+        for name, axis in zip(self.input_names, self.axes):
+            x = np.clip(np.asarray(inputs[name], dtype=np.float64),
+                        axis[0], axis[-1])
+            idx = np.clip(np.searchsorted(axis, x, side='right') - 1,
+                          0, len(axis) - 2)
+            indexes.append(idx)
+            fractions.append((x - axis[idx]) / (axis[idx + 1] - axis[idx]))
+        return indexes, fractions
+
+    def _interpolate(self, surface, indexes, fractions):
+        '''Multilinear interpolation: a weighted sum over the cell corners'''
+        result = 0.0
+        for corner in np.ndindex(*([2] * len(indexes))):
+            weight = 1.0
+            for bit, frac in zip(corner, fractions):
+                weight = weight * (frac if bit else 1 - frac)
+            at = tuple(idx + bit for idx, bit in zip(indexes, corner))
+            result = result + weight * surface[at]
+        return result
+
+    def evaluate(self, inputs, rules=False):
+        '''
+            Interpolate the outputs (and the rule strengths, if wanted)
+            for a dict mapping input names to values (or arrays of values).
+            Inputs outside the grid are moved to its edge.
+        '''
+        indexes, fractions = self._corners(inputs)
+        results = OrderedDict((name, self._interpolate(values, indexes,
+                                                       fractions))
+                              for name, values in self.outputs.items())
+        if rules:
+            results.update((label, self._interpolate(values, indexes,
+                                                     fractions))
+                           for label, values in self.rules.items())
+        return results
+
+    def check_error(self, harness, num_samples=_DEFAULT_CHECK_SAMPLES,
+                    seed=None):
+        '''
+            Compare with the harness at some random inputs, and return
+            (and record) the maximum error for each output.
+        '''
+        input_data = TestData(self.input_names, num_samples)
+        rng = np.random.RandomState(seed)
+        for j, axis in enumerate(self.axes):
+            input_data.value[:, j] = rng.uniform(axis[0], axis[-1],
+                                                 num_samples)
+        want, _ = harness.simulate_batch(input_data)
+        got = self.evaluate(dict(zip(input_data.names,
+                                     input_data.value.T)))
+        for j, name in enumerate(want.names):
+            with np.errstate(invalid='ignore'):
+                errors = np.abs(got[name] - want.value[:, j])
+            self.max_error[name] = float(np.nanmax(errors)) \
+                if not np.all(np.isnan(errors)) else 0.0
+        return self.max_error
+
+    def save(self, dirpath):
+        '''Save each surface as a .npy file, and the rest as JSON'''
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        for filename, values in self.all_surfaces().items():
+            np.save(os.path.join(dirpath, filename + '.npy'), values)
+        meta = OrderedDict([
+            ('inputs', self.input_names),
+            ('axes', [axis.tolist() for axis in self.axes]),
+            ('outputs', list(self.outputs.keys())),
+            ('rules', list(self.rules.keys())),
+            ('max_error', self.max_error),
+        ])
+        with open(os.path.join(dirpath, _META_FILE), 'w') as fileh:
+            json.dump(meta, fileh, indent=1)
+
+    @classmethod
+    def load(cls, dirpath, mmap_mode='r'):
+        '''Load saved surfaces (memory-mapped, unless mmap_mode is None)'''
+        with open(os.path.join(dirpath, _META_FILE)) as fileh:
+            meta = json.load(fileh, object_pairs_hook=OrderedDict)
+
+        def read(prefix, names):
+            return [(name, np.load(os.path.join(dirpath, prefix + name +
+                                                '.npy'), mmap_mode=mmap_mode))
+                    for name in names]
+        surface = cls(meta['inputs'], meta['axes'],
+                      read('output.', meta['outputs']),
+                      read('rule.', meta['rules']))
+        surface.max_error.update(meta['max_error'])
+        return surface
+
+
+def grid_axes(harness, points=_DEFAULT_GRID_POINTS):
+    '''
+        Evenly-spaced points over the range of each input; give one number
+        of points for all the inputs, or a list with one for each.
+    '''
+    names = list(harness.antecedents.keys())
+    if np.isscalar(points):
+        points = [points] * len(names)
+    assert len(points) == len(names),\
+        'Need a no. of grid points for each of {}'.format(names)
+    axes = []
+    for name, num in zip(names, points):
+        universe = harness.antecedents[name].universe
+        axes.append(np.linspace(np.min(universe), np.max(universe), num))
+    return names, axes
+
+
+def build_surface(harness, points=_DEFAULT_GRID_POINTS, rules=False,
+                  workers=None):
+    '''
+        Run the harness (with a loaded FCL file) over the grid, in chunks,
+        spread over a number of worker threads, each with its own simulator.
+    '''
+    names, axes = grid_axes(harness, points)
+    shape = tuple(len(axis) for axis in axes)
+    assert np.prod(shape) <= _MAX_GRID_SIZE,\
+        'Grid of {} points is too big (max is {})'.format(shape,
+                                                          _MAX_GRID_SIZE)
+    grid = np.stack([g.ravel() for g in np.meshgrid(*axes, indexing='ij')],
+                    axis=1)
+    workers = workers if workers else min(os.cpu_count() or 1, 8)
+    own_pool = harness.pool is None and workers > 1
+    if own_pool:
+        harness.make_simulator_pool(workers)
+
+    def run_chunk(start):
+        chunk = TestData(names, 0)
+        chunk.value = grid[start:start + _CHUNK_ROWS]
+        return harness.simulate_batch(chunk)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_chunk,
+                                        range(0, len(grid), _CHUNK_ROWS)))
+    finally:
+        if own_pool:
+            harness.pool = None
+    output_data = np.vstack([out.value for (out, _) in results])
+    output_names = results[0][0].names
+    outputs = [(name, output_data[:, j].reshape(shape))
+               for j, name in enumerate(output_names)]
+    rule_surfaces = []
+    if rules:
+        rule_data = np.vstack([rule.value for (_, rule) in results])
+        rule_surfaces = [(label, rule_data[:, j].reshape(shape))
+                         for j, label in enumerate(results[0][1].names)]
+    return ResponseSurface(names, axes, outputs, rule_surfaces)
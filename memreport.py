@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+'''
+    How much memory a controller uses: the bytes for each item in a
+    parser (or any SymbolTable), in these categories:
+      * universes: the universe array of each variable;
+      * terms: the membership function array of each term (or just its
+        support, for a sparse term, see sparsemf.py);
+      * hedged terms: the terms made for hedged mfs (see _add_hedges),
+        whose labels start with an underscore;
+      * rules: the rule objects, with their clauses and weighted terms
+        (but not the terms themselves, which are counted above);
+      * simulation state: what skfuzzy keeps for each simulation (and each
+        set of inputs, if caching), such as term memberships and cuts.
+
+        report = memory_report(parser)
+        print(report)               # Totals, and the biggest items
+        report.total                # Bytes in all
+
+    A parser given a memory budget (in bytes) checks its size as it goes,
+    and reports a 'memory error' as soon as it would go over budget.
+'''
+
+from __future__ import print_function
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from skfuzzy.control.state import StatefulProperty
+import skfuzzy.control.term as fuzzterm
+
+import sparsemf
+
+_CATEGORIES = ('universes', 'terms', 'hedged terms', 'rules',
+               'simulation state')
+
+_DEFAULT_TOP = 10  # Number of items to list in the report
+
+
+def nbytes(value):
+    '''The bytes for a value: arrays in full, containers with contents'''
+    if isinstance(value, np.ndarray):
+        # An array that owns its data includes it in its getsizeof:
+        return sys.getsizeof(value) if value.flags.owndata \
+            else sys.getsizeof(value) + value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(nbytes(key) + nbytes(val) for key, val in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(nbytes(item) for item in value)
+    return size
+
+
+def term_bytes(term):
+    '''The bytes for the term's mf (as it is kept, if sparse)'''
+    if isinstance(term, sparsemf.SparseTerm):
+        return sys.getsizeof(term.sparse) + nbytes(term.sparse.values)
+    return nbytes(term.mf)
+
+
+def _stateful_properties(obj):
+    '''The skfuzzy per-simulation properties of the object's class'''
+    return [prop for cls in type(obj).__mro__ for prop in vars(cls).values()
+            if isinstance(prop, StatefulProperty)]
+
+
+def state_bytes(obj):
+    '''The bytes kept for the object by all the simulations so far'''
+    size = 0
+    for prop in _stateful_properties(obj):
+        state = prop.data.get(obj)
+        if state is not None:
+            size += nbytes(state._sim_data)
+    return size
+
+
+def _clause_bytes(clause):
+    '''The bytes for a rule's antecedent clauses (not counting terms)'''
+    if not isinstance(clause, fuzzterm.TermAggregate):
+        return 0
+    return sys.getsizeof(clause) + sys.getsizeof(vars(clause)) + \
+        _clause_bytes(clause.term1) + _clause_bytes(clause.term2)
+
+
+def rule_bytes(rule):
+    '''The bytes for the rule, its clauses and its weighted terms'''
+    return sys.getsizeof(rule) + sys.getsizeof(vars(rule)) + \
+        _clause_bytes(rule.antecedent) + \
+        nbytes(rule.consequent) + \
+        sum(sys.getsizeof(vars(wterm)) for wterm in rule.consequent)
+
+
+class MemoryReport(object):
+    '''
+        A list of items, each (category, name, bytes), with totals for
+        each category.
+    '''
+    def __init__(self, items=()):
+        self.items = list(items)
+
+    def add(self, category, name, size):
+        '''Add an item'''
+        assert category in _CATEGORIES,\
+            'Unknown category "{}", should be one of {}'.format(category,
+                                                                _CATEGORIES)
+        self.items.append((category, name, size))
+
+    @property
+    def totals(self):
+        '''The total bytes for each category'''
+        totals = OrderedDict((category, 0) for category in _CATEGORIES)
+        for category, _, size in self.items:
+            totals[category] += size
+        return totals
+
+    @property
+    def total(self):
+        '''The total bytes for all the items'''
+        return sum(size for _, _, size in self.items)
+
+    def top(self, num=_DEFAULT_TOP):
+        '''The num biggest items, biggest first'''
+        return sorted(self.items, key=lambda item: -item[2])[:num]
+
+    def as_dict(self, num=_DEFAULT_TOP):
+        '''The totals and the biggest items, suitable for JSON'''
+        return OrderedDict([
+            ('total', self.total),
+            ('totals', self.totals),
+            ('top', [OrderedDict([('category', category), ('name', name),
+                                  ('bytes', size)])
+                     for category, name, size in self.top(num)])])
+
+    def __str__(self):
+        lines = ['{:<20} {:>12}'.format(category, size)
+                 for category, size in self.totals.items()]
+        lines.append('{:<20} {:>12}'.format('total', self.total))
+        lines.append('Largest items:')
+        lines.extend('{:>12}  {}: {}'.format(size, category, name)
+                     for category, name, size in self.top())
+        return '\n'.join(lines)
+
+
+def memory_report(symbols, with_state=True):
+    '''
+        Work out the memory for each variable, term and rule in the symbol
+        table (e.g. a parser), and (optionally) their simulation state.
+    '''
+    report = MemoryReport()
+
+    def add_state(name, size):
+        '''Only list the items that have some state'''
+        if size:
+            report.add('simulation state', name, size)
+
+    for fvar in symbols.fuzzy_variables:
+        report.add('universes', fvar.label, nbytes(fvar.universe))
+        if with_state:
+            add_state(fvar.label, state_bytes(fvar))
+        for term in fvar.terms.values():
+            category = 'hedged terms' if term.label.startswith('_') \
+                else 'terms'
+            name = '{}.{}'.format(fvar.label, term.label)
+            report.add(category, name, term_bytes(term))
+            if with_state:
+                add_state(name, state_bytes(term))
+    for label, rule in symbols.all_rules.items():
+        report.add('rules', label, rule_bytes(rule))
+        if with_state:
+            add_state('rule {}'.format(label),
+                      state_bytes(rule) + sum(state_bytes(wterm)
+                                              for wterm in rule.consequent))
+    return report
+
+
+if __name__ == '__main__':
+    from fcl_parser import FCLParser
+    if len(sys.argv) < 2:
+        print('Usage: {} fcl-file ...'.format(sys.argv[0]))
+        sys.exit(1)
+    for _FCLFILE in sys.argv[1:]:
+        print('===', _FCLFILE)
+        print(memory_report(FCLParser().read_fcl_file(_FCLFILE)))
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+    Counters for what the engine is doing, for finding the busy (or
+    failing) controllers in a long-running process:
+
+        registry = metrics.enable()
+        harness.simulate(input_data)
+        registry.save_prometheus('/var/lib/node_exporter/fcl.prom')
+        print(registry.as_dict())
+
+    Counting is off until enable() is called: each place that counts
+    checks metrics.active first, so this costs next to nothing when off.
+    Every count has a controller label, the name of its FCL file (or else
+    its function block), so the busy ones can be told apart.
+    Rule and term counts are per input row, so a batch of n rows counts n:
+      * rules evaluated, and skipped (by a rule index, see ruleindex.py);
+      * rules that fired with a strength of zero;
+      * terms fuzzified (each term of each input);
+      * hedge applications, when parsing (hedged mfs) or simulating
+        (hedges applied to membership degrees);
+      * norm calls, by operator (and, or, accu) and function;
+      * defuzzification failures, by exception (e.g. no rules fired),
+        including each input in a batch that gave NaN;
+      * rows simulated (and failed), and the time spent simulating them,
+        from which we get the rows per second.
+'''
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+_PREFIX = 'fcl_'
+
+# The controller label for counts from a controller with no name:
+_NO_CONTROLLER = '-'
+
+# Name: (Prometheus type, help text), in the order they are reported:
+_METRICS = OrderedDict([
+    ('rules_evaluated_total', ('counter', 'Rules evaluated, per row')),
+    ('rules_skipped_total', ('counter', 'Rules skipped by the rule index')),
+    ('rules_zero_total', ('counter', 'Rules that fired with strength zero')),
+    ('terms_fuzzified_total', ('counter', 'Input terms fuzzified')),
+    ('hedge_applications_total', ('counter', 'Hedges applied')),
+    ('norm_calls_total', ('counter', 'Norm and co-norm calls')),
+    ('defuzz_failures_total', ('counter', 'Outputs that could not be '
+                               'defuzzified')),
+    ('rows_total', ('counter', 'Input rows simulated')),
+    ('rows_failed_total', ('counter', 'Input rows with an error')),
+    ('simulate_seconds_total', ('counter', 'Time spent simulating rows')),
+    ('rows_per_second', ('gauge', 'Rows simulated per second simulating')),
+])
+
+active = None  # The registry being counted into (None if off)
+
+
+def enable(registry=None):
+    '''Start counting, into the given registry (or a new one); return it'''
+    global active
+    active = registry if registry is not None else Registry()
+    return active
+
+
+def disable():
+    '''Stop counting (the registry keeps its counts)'''
+    global active
+    active = None
+
+
+class Registry(object):
+    '''
+        The counters, each a dict from a tuple of (label, value) pairs
+        to a count.  Safe to count into from several threads at once.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = OrderedDict((name, OrderedDict())
+                                    for name, (kind, _) in _METRICS.items()
+                                    if kind == 'counter')
+
+    def inc(self, name, amount=1, **labels):
+        '''Add to a counter (for the given labels, if any)'''
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self.counters[name]
+            counter[key] = counter.get(key, 0) + amount
+
+    def get(self, name, **labels):
+        '''The count for the given labels (all of them, if none given)'''
+        with self._lock:
+            if labels:
+                return self.counters[name].get(tuple(sorted(labels.items())),
+                                               0)
+            return sum(self.counters[name].values())
+
+    def rows_per_second(self):
+        '''The rows simulated per second spent simulating'''
+        secs = self.get('simulate_seconds_total')
+        return self.get('rows_total') / secs if secs else 0.0
+
+    def reset(self):
+        '''Set all the counts back to zero'''
+        with self._lock:
+            for counter in self.counters.values():
+                counter.clear()
+
+    def as_dict(self):
+        '''A snapshot of the counts, suitable for JSON'''
+        snapshot = OrderedDict()
+        with self._lock:
+            for name, counter in self.counters.items():
+                if any(key for key in counter):
+                    snapshot[name] = [OrderedDict(list(key) + [('value', n)])
+                                      for key, n in counter.items()]
+                else:
+                    snapshot[name] = sum(counter.values())
+        snapshot['rows_per_second'] = self.rows_per_second()
+        return snapshot
+
+    def prometheus_text(self):
+        '''The counts in the Prometheus text exposition format'''
+        with self._lock:
+            counters = OrderedDict((name, OrderedDict(counter))
+                                   for name, counter in self.counters.items())
+        lines = []
+        for name, (kind, help_text) in _METRICS.items():
+            lines.append('# HELP {}{} {}'.format(_PREFIX, name, help_text))
+            lines.append('# TYPE {}{} {}'.format(_PREFIX, name, kind))
+            if kind == 'gauge':
+                samples = [((), self.rows_per_second())]
+            else:
+                samples = list(counters[name].items()) or [((), 0)]
+            for key, value in samples:
+                labels = ','.join('{}="{}"'.format(label, str(val).replace(
+                    '\\', '\\\\').replace('"', '\\"')) for label, val in key)
+                lines.append('{}{}{} {}'.format(
+                    _PREFIX, name, '{' + labels + '}' if labels else '',
+                    repr(float(value)) if isinstance(value, float) else value))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write(filename, text):
+        '''Write to a temporary file, then rename, so readers see it whole'''
+        dirname = os.path.dirname(os.path.abspath(filename))
+        fileh, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fileh, 'w') as tmpfile:
+            tmpfile.write(text)
+        os.replace(tmpname, filename)
+
+    def save_prometheus(self, filename):
+        '''Save the counts as Prometheus text (for a textfile collector)'''
+        self._write(filename, self.prometheus_text())
+
+    def save_json(self, filename):
+        '''Save a snapshot of the counts as JSON'''
+        self._write(filename, json.dumps(self.as_dict(), indent=2))
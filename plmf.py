@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+    Piecewise-linear membership functions, kept as a list of breakpoints
+    (xs, ys) rather than sampled over a universe.  Triangles, trapezoids,
+    rectangles, ramps and point-sets are all of this form, and stay that way
+    when cut (MIN activation) and combined (MAX accumulation), so we can
+    defuzzify them exactly, in closed form.
+
+    The xs are in ascending order; a repeated x value marks a vertical jump.
+    Outside the breakpoints, the first/last y value continues on.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import skfuzzy.membership as skmemb
+from skfuzzy.control.exceptions import EmptyMembershipError, \
+    NoTermMembershipsError
+
+import extramf
+
+
+def _ramp(a, b):
+    '''Breakpoints for extramf.rampmf: up or down, depending on order'''
+    if a < b:
+        return [a, b], [0, 1]
+    elif a > b:
+        return [b, a], [1, 0]
+    return [a, a], [0, 0]
+
+
+# For each piecewise-linear mf, how to get its breakpoints:
+_BREAKPOINTS = {
+    skmemb.trimf:          lambda abc: (abc, [0, 1, 0]),
+    skmemb.trapmf:         lambda abcd: (abcd, [0, 1, 1, 0]),
+    extramf.rectanglemf:   lambda a, b: ([a, a, b, b], [0, 1, 1, 0]),
+    extramf.leftlinearmf:  lambda a, b: ([a, b], [1, 0]),
+    extramf.rightlinearmf: lambda a, b: ([a, b], [0, 1]),
+    extramf.rampmf:        _ramp,
+    extramf.pointsetmf:    extramf.pointset_arrays,
+}
+
+
+def breakpoints(mf_func, params, split_params=True):
+    '''
+        Return the breakpoints (xs, ys) for a membership function,
+        or None if it is not one of the piecewise-linear ones.
+    '''
+    if mf_func not in _BREAKPOINTS:
+        return None
+    bp_func = _BREAKPOINTS[mf_func]
+    xs, ys = bp_func(*params) if split_params else bp_func(params)
+    return np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+
+def _limits(xs, ys, at, from_left):
+    '''
+        Values of the mf at the given points; at a vertical jump we need
+        to know whether we are arriving from the left or the right.
+    '''
+    if from_left:
+        hi = np.searchsorted(xs, at, 'left')
+    else:
+        hi = np.searchsorted(xs, at, 'right')
+    lo = np.clip(hi - 1, 0, len(xs) - 1)
+    hi = np.clip(hi, 0, len(xs) - 1)
+    dx = xs[hi] - xs[lo]
+    frac = np.where(dx > 0, (at - xs[lo]) / np.where(dx > 0, dx, 1), 0)
+    vals = ys[lo] + frac * (ys[hi] - ys[lo])
+    vals = np.where(at < xs[0], ys[0], vals)
+    return np.where(at > xs[-1], ys[-1], vals)
+
+
+def _from_limits(at, left, right):
+    '''Rebuild breakpoints, adding a vertical jump where the limits differ'''
+    jump = left != right
+    xs = np.repeat(at, np.where(jump, 2, 1))
+    ys = np.empty_like(xs)
+    starts = np.cumsum(np.where(jump, 2, 1)) - np.where(jump, 2, 1)
+    ys[starts] = left
+    ys[starts + jump] = right
+    return xs, ys
+
+
+def restrict(xs, ys, x_min, x_max):
+    '''Just the part of the mf between x_min and x_max'''
+    inside = (xs > x_min) & (xs < x_max)
+    at = np.unique(np.concatenate(([x_min], xs[inside], [x_max])))
+    left = _limits(xs, ys, at, True)
+    right = _limits(xs, ys, at, False)
+    left[0], right[-1] = right[0], left[-1]  # No jumps at the ends
+    return _from_limits(at, left, right)
+
+
+def cut(xs, ys, level):
+    '''Clip the mf at the given level (i.e. MIN activation)'''
+    y0, y1 = ys[:-1], ys[1:]
+    crosses = (y0 - level) * (y1 - level) < 0
+    frac = (level - y0[crosses]) / (y1[crosses] - y0[crosses])
+    new_xs = xs[:-1][crosses] + frac * (xs[1:][crosses] - xs[:-1][crosses])
+    # Put each crossing point in after the start of its segment:
+    where = np.flatnonzero(crosses) + 1
+    xs = np.insert(xs, where, new_xs)
+    ys = np.insert(ys, where, level)
+    return xs, np.minimum(ys, level)
+
+
+def envelope(pl_mfs):
+    '''
+        The maximum of the mfs (i.e. MAX accumulation); these should all
+        cover the same range, as they do after restrict().
+    '''
+    at = np.unique(np.concatenate([xs for xs, _ in pl_mfs]))
+    # Find any crossings inside the segments, and add them in:
+    right = np.array([_limits(xs, ys, at[:-1], False) for xs, ys in pl_mfs])
+    left = np.array([_limits(xs, ys, at[1:], True) for xs, ys in pl_mfs])
+    crossings = []
+    for i in range(len(pl_mfs)):
+        for j in range(i + 1, len(pl_mfs)):
+            d0, d1 = right[i] - right[j], left[i] - left[j]
+            crosses = d0 * d1 < 0
+            frac = d0[crosses] / (d0[crosses] - d1[crosses])
+            crossings.append(at[:-1][crosses] +
+                             frac * (at[1:][crosses] - at[:-1][crosses]))
+    at = np.unique(np.concatenate([at] + crossings))
+    left = np.max([_limits(xs, ys, at, True) for xs, ys in pl_mfs], axis=0)
+    right = np.max([_limits(xs, ys, at, False) for xs, ys in pl_mfs], axis=0)
+    return _from_limits(at, left, right)
+
+
+# ################################ #
+# ### Closed-form defuzzifiers ### #
+# ################################ #
+
+def _segment_areas(xs, ys):
+    '''The area under each straight-line segment'''
+    return np.diff(xs) * (ys[:-1] + ys[1:]) / 2.0
+
+
+def centroid(xs, ys):
+    '''Centre of gravity: the integral of x.mf(x) over the integral of mf'''
+    dx = np.diff(xs)
+    x0, x1, y0, y1 = xs[:-1], xs[1:], ys[:-1], ys[1:]
+    moments = dx * (x0 * (2 * y0 + y1) + x1 * (y0 + 2 * y1)) / 6.0
+    return moments.sum() / _segment_areas(xs, ys).sum()
+
+
+def bisector(xs, ys):
+    '''Centre of area: the x value that splits the area in half'''
+    areas = _segment_areas(xs, ys)
+    cumul = np.cumsum(areas)
+    half = cumul[-1] / 2.0
+    k = min(np.searchsorted(cumul, half), len(areas) - 1)
+    need = half - (cumul[k] - areas[k])  # Area still needed in segment k
+    x0, dx, y0 = xs[k], xs[k+1] - xs[k], ys[k]
+    slope = (ys[k+1] - y0) / dx
+    # Solve y0.s + slope.s^2/2 = need for the distance s into the segment:
+    if abs(slope) < 1e-12:
+        return x0 + need / y0
+    return x0 + (np.sqrt(y0 * y0 + 2 * slope * need) - y0) / slope
+
+
+def _maxima(xs, ys):
+    '''Return the x values where the mf reaches its maximum'''
+    return xs[ys == ys.max()]
+
+
+def som(xs, ys):
+    '''Smallest (leftmost) of maximum'''
+    return _maxima(xs, ys).min()
+
+
+def lom(xs, ys):
+    '''Largest (rightmost) of maximum'''
+    return _maxima(xs, ys).max()
+
+
+def mom(xs, ys):
+    '''
+        Mean of maximum: the mean over all the x values where the mf is at
+        its maximum, so plateaus count in proportion to their width.
+        If the maximum is only reached at single points, use their mean.
+    '''
+    top = ys.max()
+    flat = (ys[:-1] == top) & (ys[1:] == top)
+    widths = np.diff(xs)[flat]
+    if widths.sum() > 0:
+        mids = (xs[:-1][flat] + xs[1:][flat]) / 2.0
+        return (mids * widths).sum() / widths.sum()
+    return np.unique(_maxima(xs, ys)).mean()
+
+
+# Keyed by the skfuzzy names (see _IEEE_DEFUZZ in fcl_symbols):
+_PL_DEFUZZ = {
+    'centroid': centroid,
+    'bisector': bisector,
+    'mom':      mom,
+    'som':      som,
+    'lom':      lom,
+}
+
+
+def pl_terms(fuzzyvar, translate_mf):
+    '''
+        Return the breakpoints of all the terms of a variable (restricted
+        to its universe), or None if any of them is not piecewise linear.
+    '''
+    x_min, x_max = fuzzyvar.universe[0], fuzzyvar.universe[-1]
+    terms = OrderedDict()
+    for term_name, term in fuzzyvar.terms.items():
+        mf_def = getattr(term, 'mf_def', None)
+        if not mf_def:
+            return None
+        fname, params = mf_def
+        mf_func, split_params = translate_mf(fname)
+        bps = breakpoints(mf_func, params, split_params)
+        if bps is None:
+            return None
+        terms[term_name] = restrict(bps[0], bps[1], x_min, x_max)
+    return terms
+
+
+def defuzz_cuts(fuzzyvar, terms, cuts, method=None):
+    '''
+        Defuzzify a variable exactly, given the cut (activation) level
+        for each term; terms maps term names to breakpoints (see pl_terms),
+        and cuts maps term names to levels (None if not activated).
+    '''
+    method = method or fuzzyvar.defuzzify_method
+    active = [cut(terms[name][0], terms[name][1], level)
+              for name, level in cuts.items() if level is not None]
+    if len(active) == 0:
+        raise NoTermMembershipsError(fuzzyvar)
+    xs, ys = envelope(active)
+    if ys.max() <= 0 or (method in ('centroid', 'bisector') and
+                         _segment_areas(xs, ys).sum() <= 0):
+        raise EmptyMembershipError(fuzzyvar)
+    return _PL_DEFUZZ[method](xs, ys)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+    Membership functions that are evaluated at arbitrary points,
+    rather than over all the points of a universe.
+    Most of the universe-based mfs (from skfuzzy and extramf) are already
+    worked out point-by-point, so here we just let them take any shape of
+    input; only the singleton and the point-set need their own closed form.
+"""
+
+import numpy as np
+
+import extramf
+
+
+def singletonmf(x, xpt):
+    '''One at exactly the given point, zero everywhere else'''
+    return np.where(np.asarray(x) == xpt, 1.0, 0.0)
+
+
+def pointsetmf(x, pointset, method='linear'):
+    '''
+        Interpolate from a point-set at the given points.
+        Leads in from y=0 on the left, and trails off at the last y value,
+        so extend the point-set (see extramf) if you want it to cover a range.
+    '''
+    px, py = extramf.pointset_arrays(pointset)
+    x = np.asarray(x, dtype=np.float64)
+    if method == 'linear':
+        return np.clip(np.interp(x, px, py, left=0, right=py[-1]), 0, 1)
+    f = extramf.pointset_interpolator(px, py, method)
+    mf = np.clip(f(np.clip(x, px[0], px[-1])), 0, 1)
+    return np.where(x < px[0], 0, np.where(x > px[-1], py[-1], mf))
+
+
+# These need a closed form, since their universe version depends on x[0] etc.
+_CLOSED_FORMS = {
+    extramf.singletonmf: singletonmf,
+    extramf.pointsetmf:  pointsetmf,
+}
+
+
+def at_points(mf_func):
+    '''
+        Return a version of the (universe-based) mf that takes any array
+        of points, of any shape, and returns the membership of each point.
+    '''
+    if mf_func in _CLOSED_FORMS:
+        return _CLOSED_FORMS[mf_func]
+
+    def point_func(x, *params):
+        '''Evaluate the mf on a flattened copy of x, then restore its shape'''
+        x = np.asarray(x, dtype=np.float64)
+        return np.reshape(mf_func(x.ravel(), *params), x.shape)
+    point_func.__name__ = mf_func.__name__
+    return point_func
+
+
+def point_versions(mf_table):
+    '''
+        Given a table of mf names mapped to (mf, split-parameters?),
+        make the corresponding table for evaluating these at points.
+    '''
+    return {name: (at_points(mf_func), split_params)
+            for name, (mf_func, split_params) in mf_table.items()}
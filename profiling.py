@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+'''
+    Record where the time goes in a simulation: the wall-clock and CPU
+    time (and number of calls) for each stage, each rule block and each
+    consequent.  Profiling is off unless you ask for it:
+
+        profile = harness.enable_profiling()
+        harness.simulate(input_data)
+        print(profile)                  # A text table
+        profile.save('profile.json')
+
+    The stages are:
+      * load inputs: handing the input values to the simulator;
+      * fuzzification: the rest of the inference, apart from the rules
+        (mostly fuzzifying the inputs);
+      * aggregation: working out each rule's firing strength (and so its
+        activation), from its antecedent;
+      * accumulation: adding each rule's activation to its output terms;
+      * defuzzification: getting each crisp output from its terms;
+      * collect results: copying the outputs and rule activations out.
+    The rule blocks get the aggregation and accumulation time of their
+    rules, and the consequents their defuzzification time.
+
+    CPU time is for the thread doing the work, so profiles from several
+    workers (or several runs) can be added up: use merge, or run this
+    module with some saved profiles to print them all merged together.
+'''
+
+from __future__ import print_function
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+# The kinds of thing we time, and the stages (in order):
+_KINDS = ('stages', 'rule_blocks', 'consequents')
+_STAGES = ('load inputs', 'fuzzification', 'aggregation', 'accumulation',
+           'defuzzification', 'collect results')
+
+# The name used for rules not in a named rule block:
+_NO_RULE_BLOCK = '-'
+
+
+def clocks():
+    '''The wall-clock time and this thread's CPU time, now'''
+    return default_timer(), time.thread_time()
+
+
+class Profile(object):
+    '''
+        The total wall and CPU time (in seconds), and the number of calls,
+        for each stage, rule block and consequent.  Safe to add to from
+        several threads at once.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = OrderedDict((kind, OrderedDict()) for kind in _KINDS)
+        for stage in _STAGES:
+            self.records['stages'][stage] = [0.0, 0.0, 0]
+
+    def add(self, kind, name, wall, cpu, calls=1):
+        '''Add some time for the given stage, rule block or consequent'''
+        with self._lock:
+            record = self.records[kind].setdefault(name, [0.0, 0.0, 0])
+            record[0] += wall
+            record[1] += cpu
+            record[2] += calls
+
+    def add_since(self, kind, name, start):
+        '''Add the time since start (from clocks); return the clocks now'''
+        now = clocks()
+        self.add(kind, name, now[0] - start[0], now[1] - start[1])
+        return now
+
+    @contextmanager
+    def timing(self, kind, name):
+        '''Time the body of a with-statement'''
+        start = clocks()
+        try:
+            yield
+        finally:
+            self.add_since(kind, name, start)
+
+    def merge(self, other):
+        '''Add the times from another profile into this one'''
+        for kind, records in other.records.items():
+            for name, (wall, cpu, calls) in records.items():
+                self.add(kind, name, wall, cpu, calls)
+        return self
+
+    def as_dict(self):
+        '''The records, suitable for JSON'''
+        with self._lock:
+            return OrderedDict(
+                (kind, OrderedDict(
+                    (name, OrderedDict([('wall', wall), ('cpu', cpu),
+                                        ('calls', calls)]))
+                    for name, (wall, cpu, calls) in records.items()))
+                for kind, records in self.records.items())
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Make a profile from the records in as_dict form'''
+        profile = cls()
+        for kind, records in data.items():
+            for name, record in records.items():
+                profile.add(kind, name, record['wall'], record['cpu'],
+                            record['calls'])
+        return profile
+
+    def save(self, filename):
+        '''Save the records as JSON'''
+        with open(filename, 'w') as fileh:
+            json.dump(self.as_dict(), fileh, indent=2)
+
+    @classmethod
+    def load(cls, filename):
+        '''Read a profile saved as JSON'''
+        with open(filename) as fileh:
+            return cls.from_dict(json.load(fileh, object_pairs_hook=OrderedDict))
+
+    def table(self):
+        '''The records as a text table, one section for each kind'''
+        lines = []
+        total = sum(wall for wall, _, _ in self.records['stages'].values())
+        for kind, records in self.records.items():
+            if not records:
+                continue
+            lines.append('{:<24} {:>10} {:>10} {:>9} {:>6}'.format(
+                kind.replace('_', ' '), 'wall (s)', 'cpu (s)', 'calls',
+                'wall%'))
+            for name, (wall, cpu, calls) in records.items():
+                lines.append('{:<24} {:10.4f} {:10.4f} {:9d} {:5.1f}%'.format(
+                    name, wall, cpu, calls, 100 * wall / total if total else 0))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.table()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: {} profile.json ...'.format(sys.argv[0]))
+        sys.exit(1)
+    _PROFILE = Profile()
+    for _FILENAME in sys.argv[1:]:
+        _PROFILE.merge(Profile.load(_FILENAME))
+    print(_PROFILE)
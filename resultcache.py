@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+'''
+    A bounded cache of simulation results, keyed on the input values
+    rounded to a given precision, for when the same inputs come up again
+    and again (e.g. from sensors with a limited resolution).
+
+    The precision is a step size, either one for all the inputs, or a dict
+    giving the step for each input variable (anything not in the dict is
+    not rounded).  The inputs are rounded to a multiple of their step
+    before they are simulated, so a result is the same whether or not it
+    came from the cache.  When the cache is full, the least recently used
+    ('lru') or least frequently used ('lfu') result is dropped.
+
+        cache = harness.make_result_cache(maxsize=10000, precision=0.01)
+        harness.simulate(input_data)   # Only simulates rows not seen before
+        print(cache.as_dict())         # Hits, misses, hit rate, etc.
+
+    The harness clears its cache whenever a new controller is read in.
+'''
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_POLICIES = ('lru', 'lfu')
+
+_DEFAULT_MAXSIZE = 4096  # results
+
+
+class ResultCache(object):
+    '''
+        Up to maxsize results, each filed under a tuple of (rounded) input
+        values; for LFU the least recently used of the least frequently
+        used results is dropped first.  Safe to use from several threads.
+    '''
+    def __init__(self, maxsize=_DEFAULT_MAXSIZE, policy='lru',
+                 precision=None):
+        assert maxsize > 0, 'Cache size must be positive, not {}'.format(
+            maxsize)
+        assert policy in _POLICIES,\
+            'Unknown policy "{}", should be one of {}'.format(policy,
+                                                              _POLICIES)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # Key: result, least recent first
+        self._counts = {}              # Key: uses (LFU only)
+        self._by_count = {}            # Uses: OrderedDict of keys (LFU)
+        self._min_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _step(self, name):
+        '''The step size for this input variable (or None)'''
+        if isinstance(self.precision, dict):
+            return self.precision.get(name)
+        return self.precision
+
+    def quantise(self, names, values):
+        '''
+            Round an (inputs x variables) array of values, one column for
+            each of the names, to the step for that variable.
+        '''
+        values = np.array(values, dtype=np.float64)
+        for j, name in enumerate(names):
+            step = self._step(name)
+            if step:
+                values[..., j] = np.round(values[..., j] / step) * step
+        return values
+
+    @staticmethod
+    def key(names, row):
+        '''The key for a (rounded) row of values for these variables'''
+        return tuple(names), tuple(float(value) for value in row)
+
+    def __len__(self):
+        return len(self._results)
+
+    def _bump(self, key):
+        '''Note another use of the key, for LFU'''
+        count = self._counts.get(key, 0)
+        if count:
+            del self._by_count[count][key]
+            if not self._by_count[count]:
+                del self._by_count[count]
+                if self._min_count == count:
+                    self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._by_count.setdefault(count + 1, OrderedDict())[key] = None
+
+    def _evict(self):
+        '''Drop one result, to make room for another'''
+        if self.policy == 'lru':
+            self._results.popitem(last=False)
+        else:
+            key, _ = self._by_count[self._min_count].popitem(last=False)
+            if not self._by_count[self._min_count]:
+                del self._by_count[self._min_count]
+            del self._counts[key]
+            del self._results[key]
+        self.evictions += 1
+
+    def get(self, key, uses=1):
+        '''
+            The result for the key, or None if it isn't in the cache.
+            If the result is wanted for several inputs at once, the first
+            is a miss, but the rest can share its result, so are hits.
+        '''
+        with self._lock:
+            if key not in self._results:
+                self.misses += 1
+                self.hits += uses - 1
+                return None
+            self.hits += uses
+            if self.policy == 'lru':
+                self._results.move_to_end(key)
+            else:
+                self._bump(key)
+            return self._results[key]
+
+    def put(self, key, result):
+        '''Add (or replace) the result for the key'''
+        with self._lock:
+            if key not in self._results and \
+                    len(self._results) >= self.maxsize:
+                self._evict()
+            self._results[key] = result
+            if self.policy == 'lru':
+                self._results.move_to_end(key)
+            else:
+                if key not in self._counts:
+                    self._min_count = 1
+                self._bump(key)
+
+    def clear(self):
+        '''Drop all the results (but keep the counts of hits and misses)'''
+        with self._lock:
+            self._results.clear()
+            self._counts.clear()
+            self._by_count.clear()
+            self._min_count = 0
+
+    @property
+    def hit_rate(self):
+        '''The fraction of lookups that found a result'''
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self):
+        '''A summary of the cache's use, suitable for JSON'''
+        with self._lock:
+            return OrderedDict([('policy', self.policy),
+                                ('size', len(self._results)),
+                                ('maxsize', self.maxsize),
+                                ('hits', self.hits),
+                                ('misses', self.misses),
+                                ('hit_rate', self.hit_rate),
+                                ('evictions', self.evictions)])
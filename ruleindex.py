@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+'''
+    An index from input values to the rules that might fire for them,
+    so that a simulation need only evaluate those rules.
+
+    Each antecedent term has a support: the part of its universe where its
+    (interpolated) membership is above zero.  Cutting each input variable's
+    universe at the ends of its terms' supports gives a few intervals, and
+    inside each of these the same terms are non-zero.  For each interval we
+    note which rules could still fire, whatever the other inputs are: e.g.
+    a rule "x IS low AND y IS high" can't fire for any x outside the
+    support of "low".  For some inputs we look up the interval for each
+    input variable, and a rule is live if it's live in all of them.  This
+    is exact for rules that AND their terms together; a rule that ORs terms
+    for different inputs can only be skipped if all of them are zero, which
+    no one input can tell us, so these are evaluated more often than needed.
+
+    Skipping a rule must give exactly the same results as evaluating it,
+    so we only skip rules where this is guaranteed:
+      * the AND (t-norm) must give 0 if either side is 0, and the OR must
+        give 0 if both are 0 (true for all the IEEE norms);
+      * any hedges must map 0 to 0 (NOT never does, so is always live);
+      * the accumulation method for each of its consequents must leave a
+        value unchanged when adding 0 to it (true for all the co-norms).
+    We check these by trying the functions on a few values; a rule that
+    fails any check is always evaluated.  A skipped rule's firing and
+    activations are set to 0, just as if it had been evaluated.
+
+        index = RuleIndex(harness.control_system)
+        index.live_rules({'food': 3, 'service': 7})
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+import skfuzzy.control as ctrl
+import skfuzzy.control.term as fuzzterm
+
+from hedges import HedgedClause
+
+# The values we try the norms, hedges and accumulation methods on:
+_CHECK_VALUES = np.linspace(0, 1, 11)
+
+
+def _keeps_zero(func, *args):
+    '''Is func(*args) zero, for each of the given values?'''
+    with np.errstate(all='ignore'):
+        return bool(np.all(np.asarray(func(*args)) == 0))
+
+
+def _and_keeps_zero(and_func):
+    '''Is (0 AND x) and (x AND 0) always zero?'''
+    zeros = np.zeros_like(_CHECK_VALUES)
+    return _keeps_zero(and_func, zeros, _CHECK_VALUES) and \
+        _keeps_zero(and_func, _CHECK_VALUES, zeros)
+
+
+def _or_keeps_zero(or_func):
+    '''Is (0 OR 0) zero?'''
+    return _keeps_zero(or_func, np.zeros(1), np.zeros(1))
+
+
+def _adds_zero(accu_func):
+    '''Does accumulating 0 leave any value unchanged?'''
+    with np.errstate(all='ignore'):
+        got = accu_func(np.zeros_like(_CHECK_VALUES), _CHECK_VALUES)
+    return bool(np.all(np.asarray(got) == _CHECK_VALUES))
+
+
+def term_intervals(antecedent):
+    '''
+        Cut the antecedent's universe into intervals where the same terms
+        are non-zero; return the start of each interval, and a dict
+        mapping each term label to an array saying if it's non-zero there.
+        The membership between two universe points is interpolated, so is
+        zero only if it's zero at both; the start of an interval belongs
+        to it, and the last interval includes the end of the universe.
+    '''
+    universe = np.asarray(antecedent.universe)
+    labels = list(antecedent.terms.keys())
+    if len(universe) < 2:
+        return universe[:1], OrderedDict((label, np.ones(1, dtype=bool))
+                                         for label in labels)
+    # For each segment (between universe points), which terms are live:
+    segments = np.array([~((term.mf[:-1] == 0) & (term.mf[1:] == 0))
+                         for term in antecedent.terms.values()]).T
+    changes = np.any(segments[1:] != segments[:-1], axis=1)
+    firsts = np.concatenate([[0], np.flatnonzero(changes) + 1])
+    return universe[firsts], OrderedDict(
+        (label, segments[firsts, j]) for j, label in enumerate(labels))
+
+
+def _can_fire(clause, agg_methods, live):
+    '''
+        Could the clause be non-zero?  The live dict maps some antecedent
+        terms to arrays of flags (one for each interval); for any other
+        term, or if we can't tell, the answer is True.
+    '''
+    if isinstance(clause, fuzzterm.Term):
+        if isinstance(clause.parent, ctrl.Antecedent):
+            return live.get((clause.parent.label, clause.label), True)
+        return True
+    if isinstance(clause, HedgedClause):
+        if _keeps_zero(clause.hedge_func, np.zeros(1)):
+            return _can_fire(clause.term1, agg_methods, live)
+        return True
+    if clause.kind == 'not':
+        return True
+    can1 = _can_fire(clause.term1, agg_methods, live)
+    can2 = _can_fire(clause.term2, agg_methods, live)
+    if clause.kind == 'and' and _and_keeps_zero(agg_methods.and_func):
+        return np.logical_and(can1, can2)
+    if clause.kind == 'or' and _or_keeps_zero(agg_methods.or_func):
+        return np.logical_or(can1, can2)
+    return True
+
+
+class RuleIndex(object):
+    '''
+        For each input variable, the starts of its intervals and a table
+        (intervals x rules) saying which rules could fire in each interval.
+        Rules are identified by their labels, so the index can be used with
+        copies of the control system (e.g. in a SimulatorPool).
+    '''
+    def __init__(self, control_system):
+        rules = list(control_system.rules)
+        self.rule_labels = [rule.label for rule in rules]
+        skippable = np.array([all(_adds_zero(wterm.term.parent
+                                             .accumulation_method)
+                                  for wterm in rule.consequent)
+                              for rule in rules], dtype=bool)
+        self.starts = OrderedDict()  # Input name: interval starts
+        self.tables = OrderedDict()  # Input name: (intervals x rules) flags
+        for antecedent in control_system.antecedents:
+            starts, term_live = term_intervals(antecedent)
+            live = {(antecedent.label, label): flags
+                    for label, flags in term_live.items()}
+            table = np.ones((len(starts), len(rules)), dtype=bool)
+            for j, rule in enumerate(rules):
+                if skippable[j]:
+                    table[:, j] = _can_fire(rule.antecedent,
+                                            rule._aggregation_methods, live)
+            self.starts[antecedent.label] = starts
+            self.tables[antecedent.label] = table
+
+    @property
+    def num_intervals(self):
+        '''The number of intervals for each input variable'''
+        return OrderedDict((name, len(starts))
+                           for name, starts in self.starts.items())
+
+    def live_mask(self, inputs):
+        '''
+            Given a dict of input values (numbers, or arrays of the same
+            shape), return an (inputs x rules) array of flags, True for
+            the rules that might fire for each input.
+        '''
+        live = np.ones((1, len(self.rule_labels)), dtype=bool)
+        unknown = np.zeros(1, dtype=bool)
+        for name, starts in self.starts.items():
+            values = np.asarray(inputs[name], dtype=np.float64).reshape(-1)
+            pos = np.searchsorted(starts, values, side='right') - 1
+            live = live & self.tables[name][np.clip(pos, 0, len(starts) - 1)]
+            unknown = unknown | np.isnan(values)
+        live[unknown] = True  # A NaN input might not give 0, so evaluate all
+        return live
+
+    def live_rules(self, inputs):
+        '''The labels of the rules that might fire for any of the inputs'''
+        live = np.any(self.live_mask(inputs), axis=0)
+        return set(label for label, flag in zip(self.rule_labels, live)
+                   if flag)
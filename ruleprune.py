@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+'''
+    Find, and remove, rules that make no difference to the outputs:
+      * dead rules, that can never fire: e.g. a term that is zero over the
+        whole range, or "x IS low AND x IS high" where these don't overlap;
+      * duplicate rules, the same (up to the order of ANDs and ORs) as an
+        earlier rule, with the same consequents;
+      * subsumed rules, that never fire more strongly than some other rule
+        with the same consequents, e.g. "IF a AND b THEN c" with "IF a THEN c".
+    Fewer rules means less work for each simulation.
+
+    A dead rule only ever adds zero to its terms, so can always go.  The
+    others are only removed when each of their output variables accumulates
+    with max (the usual case), since then a weaker copy of a rule doesn't
+    change the output; with e.g. a bounded sum they'd be counted twice.
+
+    To find dead rules we work out bounds on each clause's membership, and
+    so on the rule's firing strength: for a clause with one input variable
+    these are bounds over each segment of that variable's universe,
+    otherwise just one lower and upper bound over all the inputs.
+
+    Optionally, run the data from an FLD file and flag the rules that never
+    fired for any of it; these are reported, but not removed.
+
+        harness.read_fcl_file('robot.fcl')
+        report = prune_harness(harness, 'robot.fld')
+        print(report)
+'''
+
+from __future__ import print_function
+
+import sys
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+import skfuzzy.control as ctrl
+import skfuzzy.control.term as fuzzterm
+
+from hedges import HedgedClause
+
+# A replayed rule activation below this counts as not having fired:
+_MIN_FIRING = 1e-3
+
+
+class RuleReport(object):
+    '''
+        The rules found by check_rules, and whether they were removed.
+        Each dict maps a rule label to the reason (e.g. the other rule).
+    '''
+    def __init__(self, num_rules):
+        self.num_rules = num_rules
+        self.dead = OrderedDict()       # Label: ''
+        self.duplicate = OrderedDict()  # Label: label of the same rule
+        self.subsumed = OrderedDict()   # Label: label of the stronger rule
+        self.kept = OrderedDict()       # Label: why it can't be removed
+        self.unfired = []               # Labels (from an FLD replay)
+
+    @property
+    def removable(self):
+        '''The labels of all the rules that can be removed'''
+        return [label for found in (self.dead, self.duplicate, self.subsumed)
+                for label in found if label not in self.kept]
+
+    def __str__(self):
+        lines = ['{} rules, {} can be removed'.format(self.num_rules,
+                                                      len(self.removable))]
+        for title, found in [('dead (can never fire)', self.dead),
+                             ('duplicate of', self.duplicate),
+                             ('subsumed by', self.subsumed),
+                             ('not removed', self.kept)]:
+            for label, reason in found.items():
+                lines.append('  {:>10}: {}{}'.format(
+                    label, title, ' ' + reason if reason else ''))
+        if self.unfired:
+            lines.append('  never fired in replay: {}'
+                         .format(', '.join(self.unfired)))
+        return '\n'.join(lines)
+
+
+# ############################################## #
+# ### Bounds on a rule's firing strength ### #
+# ############################################## #
+
+def _segment_bounds(mf):
+    '''The min and max of the (interpolated) mf over each segment'''
+    if len(mf) == 1:
+        return mf, mf
+    return np.fmin(mf[:-1], mf[1:]), np.fmax(mf[:-1], mf[1:])
+
+
+def _clause_bounds(clause, agg_methods):
+    '''
+        Lower and upper bounds on the membership of a clause, as a triple
+        (varname, lower, upper).  If the clause only uses one input
+        variable, the bounds are arrays (one per segment of its universe);
+        otherwise varname is None, and the bounds are numbers.
+        All the norms and hedges are monotone, so we can apply them to the
+        bounds (swapping them for a NOT).
+    '''
+    if isinstance(clause, fuzzterm.Term):
+        if isinstance(clause.parent, ctrl.Antecedent):
+            return (clause.parent.label,) + _segment_bounds(clause.mf)
+        return None, 0.0, 1.0  # An output's term: could be anything
+    varname, lower, upper = _clause_bounds(clause.term1, agg_methods)
+    if isinstance(clause, HedgedClause):
+        for kind, arg in clause.hedge_func.steps:
+            if kind == 'power':
+                lower, upper = np.power(lower, arg), np.power(upper, arg)
+            elif kind == 'not':
+                lower, upper = 1 - upper, 1 - lower
+            else:
+                lower, upper = arg(lower), arg(upper)
+        return varname, lower, upper
+    if clause.kind == 'not':
+        return varname, 1 - upper, 1 - lower
+    func = agg_methods.and_func if clause.kind == 'and' \
+        else agg_methods.or_func
+    varname2, lower2, upper2 = _clause_bounds(clause.term2, agg_methods)
+    if varname is None or varname != varname2:  # Bound over all inputs
+        varname = None
+        lower, upper = np.min(lower), np.max(upper)
+        lower2, upper2 = np.min(lower2), np.max(upper2)
+    return varname, func(lower, lower2), func(upper, upper2)
+
+
+def max_firing(rule):
+    '''An upper bound on the rule's activation, for any inputs'''
+    _, _, upper = _clause_bounds(rule.antecedent, rule._aggregation_methods)
+    weight = max(wterm.weight for wterm in rule.consequent)
+    return float(np.max(upper)) * weight
+
+
+# ################################################ #
+# ### Comparing antecedents (for subsumption) ### #
+# ################################################ #
+
+def _clause_key(clause, agg_methods):
+    '''
+        A canonical form for a clause, as nested tuples; chains of ANDs
+        (or ORs) are flattened, and their parts sorted, since the norms
+        are associative and commutative.
+    '''
+    if isinstance(clause, fuzzterm.Term):
+        return ('term', clause.parent.label, clause.label)
+    if isinstance(clause, HedgedClause):
+        return ('hedge', tuple(clause.hedge_names),
+                _clause_key(clause.term1, agg_methods))
+    if clause.kind == 'not':
+        return ('not', _clause_key(clause.term1, agg_methods))
+    func = agg_methods.and_func if clause.kind == 'and' \
+        else agg_methods.or_func
+    parts = []
+    for sub in (clause.term1, clause.term2):
+        key = _clause_key(sub, agg_methods)
+        if key[0] == clause.kind and key[1] == func.__name__:
+            parts.extend(key[2])
+        else:
+            parts.append(key)
+    return (clause.kind, func.__name__, tuple(sorted(parts)))
+
+
+def _weaker(key_a, key_b):
+    '''
+        Is clause a never more true than clause b, whatever the inputs?
+        Uses: x AND y <= x <= x OR y, for any norms, and for the same norm,
+        (more ANDed parts) <= (fewer), (fewer ORed parts) <= (more).
+        Min and max are the largest t-norm and smallest co-norm.
+    '''
+    if key_a == key_b:
+        return True
+    if key_b[0] == 'or' and any(_weaker(key_a, part) for part in key_b[2]):
+        return True
+    if key_a[0] == 'and' and any(_weaker(part, key_b) for part in key_a[2]):
+        return True
+    if key_a[0] == key_b[0] == 'and':
+        if key_b[1] == 'fmin':
+            return all(any(_weaker(a, b) for a in key_a[2])
+                       for b in key_b[2])
+        return key_a[1] == key_b[1] and \
+            not Counter(key_b[2]) - Counter(key_a[2])
+    if key_a[0] == key_b[0] == 'or':
+        if key_a[1] == 'fmax':
+            return all(any(_weaker(a, b) for b in key_b[2])
+                       for a in key_a[2])
+        return key_a[1] == key_b[1] and \
+            not Counter(key_a[2]) - Counter(key_b[2])
+    return False
+
+
+def _consequent_weights(rule):
+    '''Map each consequent (variable, term) to its weight'''
+    return OrderedDict(((wterm.term.parent.label, wterm.term.label),
+                        wterm.weight) for wterm in rule.consequent)
+
+
+def _covers(rule_b, rule_a):
+    '''Does rule b set every consequent of a, with at least its weight?'''
+    weights_b = _consequent_weights(rule_b)
+    return all(cons in weights_b and weights_b[cons] >= weight
+               for cons, weight in _consequent_weights(rule_a).items())
+
+
+def _accumulates_with_max(rule):
+    '''Do all the rule's output variables accumulate with max?'''
+    return all(wterm.term.parent.accumulation_method
+               in (ctrl.accumulation_max, np.fmax)
+               for wterm in rule.consequent)
+
+
+# ########################### #
+# ### Checking the rules ### #
+# ########################### #
+
+def _last_uses(rule, others):
+    '''
+        Why the rule can't be removed: it is the last one using an input
+        (which the simulation would then reject), or the last one setting
+        an output term that another rule uses.  None if it can be removed.
+    '''
+    used = set()
+    for other in others:
+        used.update(term.parent.label for term in other.antecedent_terms)
+    for term in rule.antecedent_terms:
+        if isinstance(term.parent, ctrl.Antecedent) and \
+                term.parent.label not in used:
+            return 'last rule using "{}"'.format(term.parent.label)
+    set_by_others = set(cons for other in others
+                        for cons in _consequent_weights(other))
+    used_terms = set((term.parent.label, term.label)
+                     for other in others for term in other.antecedent_terms)
+    for cons in _consequent_weights(rule):
+        if cons in used_terms and cons not in set_by_others:
+            return 'last rule setting "{}.{}"'.format(*cons)
+    return None
+
+
+def check_rules(symbol_table):
+    '''
+        Find the dead, duplicate and subsumed rules in the symbol table
+        (e.g. a parser), in that order, and return a RuleReport.
+        Only rules not already found are checked against each other,
+        so where two rules are the same the first one is kept.
+    '''
+    rules = list(symbol_table.rules)
+    report = RuleReport(len(rules))
+    keys = OrderedDict()  # Rule label: antecedent key
+    for rule in rules:
+        if max_firing(rule) <= 0:
+            report.dead[rule.label] = ''
+        else:
+            keys[rule.label] = _clause_key(rule.antecedent,
+                                           rule._aggregation_methods)
+    live = [rule for rule in rules if rule.label in keys]
+    for num, rule_a in enumerate(live):
+        if not _accumulates_with_max(rule_a):
+            continue
+        for rule_b in live[:num] + live[num+1:]:
+            if rule_b.label in report.duplicate or \
+                    rule_b.label in report.subsumed or \
+                    not _covers(rule_b, rule_a):
+                continue
+            key_a, key_b = keys[rule_a.label], keys[rule_b.label]
+            if key_a == key_b and \
+                    _consequent_weights(rule_a) == _consequent_weights(rule_b):
+                if rule_b in live[:num]:  # Keep the first of the two
+                    report.duplicate[rule_a.label] = rule_b.label
+                    break
+            elif _weaker(key_a, key_b):
+                report.subsumed[rule_a.label] = rule_b.label
+                break
+    # Now make sure it's safe to remove them all together:
+    removable = set(report.removable)
+    for rule in rules:
+        if rule.label in removable:
+            others = [other for other in rules if other.label not in removable]
+            reason = _last_uses(rule, others)
+            if reason:
+                report.kept[rule.label] = reason
+                removable.discard(rule.label)
+    return report
+
+
+def unfired_rules(harness, input_data, min_firing=_MIN_FIRING):
+    '''
+        Run the harness on the input data (a TestData) and return the
+        labels of the rules that never reached the given activation.
+    '''
+    _, rule_data = harness.simulate_batch(input_data)
+    fired = np.any(rule_data.value >= min_firing, axis=0)
+    return [label for label, did in zip(rule_data.names, fired) if not did]
+
+
+def prune_rules(symbol_table, report=None):
+    '''
+        Remove the rules that can be removed from the symbol table,
+        checking the rules first if no report is given.
+        Returns the report.
+    '''
+    if report is None:
+        report = check_rules(symbol_table)
+    for label in report.removable:
+        symbol_table.remove_rule(label)
+    return report
+
+
+def prune_harness(harness, fldfile=None, min_firing=_MIN_FIRING):
+    '''
+        Check the harness's rules, remove those that can be removed,
+        and set up the harness again with the rest.  If an FLD file is
+        given, replay its inputs first to find the rules that never fired.
+    '''
+    report = check_rules(harness.parser)
+    if fldfile:
+        input_data, _, _ = harness.read_fld_file(fldfile)
+        report.unfired = unfired_rules(harness, input_data, min_firing)
+    prune_rules(harness.parser, report)
+    harness.use_parser(harness.parser)
+    return report
+
+
+if __name__ == '__main__':
+    from simulate import SimulationHarness
+    if len(sys.argv) < 2:
+        print('Usage: {} fcl-file [fld-file]'.format(sys.argv[0]))
+        sys.exit(1)
+    _HARNESS = SimulationHarness()
+    _HARNESS.read_fcl_file(sys.argv[1])
+    print(prune_harness(_HARNESS, sys.argv[2] if len(sys.argv) > 2 else None))
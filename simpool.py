@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+    A pool of ready-made simulators for one control system, for use from
+    several threads at once.
+
+    skfuzzy keeps the state of a simulation in the control system's own
+    terms and rules (keyed by the simulation), and clears all of it after an
+    array-input run, so two simulators sharing a control system can't safely
+    run at the same time.  So each simulator in the pool gets its own copy of
+    the control system; the universes and membership arrays are never changed
+    by a simulation, so the copies share these.  Each simulator is warmed up
+    (working out the rule order, and so on) when the pool is made, and its
+    state is cleared when it is returned.
+
+        pool = SimulatorPool(harness.control_system, size=8)
+        with pool.simulator() as sim:
+            sim.input['food'] = 3
+            ...
+'''
+
+import copy
+from collections import OrderedDict
+from contextlib import contextmanager
+from queue import LifoQueue
+
+from fcl_simulation import FCLSimulation
+
+_DEFAULT_POOL_SIZE = 4
+
+
+def copy_control_system(control_system):
+    '''A deep copy of the control system, sharing its (read-only) arrays'''
+    memo = {}
+    for var in list(control_system.antecedents) + \
+            list(control_system.consequents):
+        memo[id(var.universe)] = var.universe
+        for term in var.terms.values():
+            memo[id(term.mf)] = term.mf
+    return copy.deepcopy(control_system, memo)
+
+
+class SimulatorPool(object):
+    '''
+        A fixed number of simulators (FCLSimulation objects) to check out
+        and return; any extra arguments are passed to each simulator.
+    '''
+    def __init__(self, control_system, size=_DEFAULT_POOL_SIZE,
+                 **simulator_args):
+        assert size > 0, 'Pool size must be positive, not {}'.format(size)
+        self.size = size
+        self._cache = simulator_args.get('cache', True)  # Restore on return
+        self._free = LifoQueue()  # Most recently used first
+        for _ in range(size):
+            simulator = FCLSimulation(copy_control_system(control_system),
+                                      **simulator_args)
+            self._warm_up(simulator)
+            self._free.put(simulator)
+
+    @staticmethod
+    def _warm_up(simulator):
+        '''Run once, with each input in mid-range, to fill any caches'''
+        for antecedent in simulator.ctrl.antecedents:
+            universe = antecedent.universe
+            simulator.input[antecedent.label] = \
+                (universe[0] + universe[-1]) / 2
+        try:
+            simulator.compute()
+        except Exception:  # e.g. no rules fire, but caches are still full
+            pass
+
+    def _reset(self, simulator):
+        '''Clear all the state of a simulation (inputs, outputs, etc.)'''
+        simulator.reset()
+        simulator.output = OrderedDict()
+        simulator.rule_activation = OrderedDict()
+        simulator.cache = self._cache
+        simulator._array_inputs = False
+        simulator._array_shape = None
+        simulator._update_unique_id()
+
+    @property
+    def available(self):
+        '''The number of simulators not checked out (right now)'''
+        return self._free.qsize()
+
+    def checkout(self, timeout=None):
+        '''
+            Take a simulator from the pool, waiting if none are free.
+            With a timeout (in seconds), raise queue.Empty if none come free.
+        '''
+        return self._free.get(timeout=timeout)
+
+    def checkin(self, simulator):
+        '''Clear a simulator's state and give it back to the pool'''
+        self._reset(simulator)
+        self._free.put(simulator)
+
+    @contextmanager
+    def simulator(self, timeout=None):
+        '''Check out a simulator for the duration of a with-statement'''
+        simulator = self.checkout(timeout)
+        try:
+            yield simulator
+        finally:
+            self.checkin(simulator)
@@ -12,16 +12,24 @@ from __future__ import print_function
 import sys
 import os.path
 import codecs
+import threading
 from datetime import datetime
+from timeit import default_timer
 from collections import OrderedDict
+from contextlib import contextmanager
 
 import numpy as np
 
 from skfuzzy import control as ctrl
-from skfuzzy.control import ControlSystemSimulation
 from skfuzzy.control.controlsystem import CrispValueCalculator
 
+import metrics
+import profiling
+import resultcache
 from fcl_parser import FCLParser
+from fcl_simulation import FCLSimulation
+from ruleindex import RuleIndex
+from simpool import SimulatorPool
 
 _COMMENT_CHAR = '#'
 _FCL_SUFFIX = '.fcl'
@@ -102,6 +110,12 @@ def _print_memberships(var):
               ['{:8.3}'.format(v.mf[i]) for v in var.terms.values()])
 
 
+def no_output_message(vnames):
+    '''The message for a test case where these outputs weren't set'''
+    return '\t- no output for {} (no rules fired)'.format(
+        ', '.join('"{}"'.format(vname) for vname in vnames))
+
+
 class TestData(object):
     '''
         Just a container for var/rule names and corresponding test data.
@@ -123,7 +137,18 @@ class SimulationHarness(object):
     '''
         A class to handle reading FLD files and running simulations.
     '''
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, dtype=None, engine='sampled',
+                 tolerance=None, indexed=False, memory_budget=None):
+        '''
+            Optionally give a float dtype (e.g. np.float32) to be used by
+            the parser for universes and membership functions.
+            The engine says how to defuzzify (see fcl_simulation.py);
+            for the 'sparse' engine, the output terms are kept sparse too.
+            The tolerance is passed to the parser, for adaptive universes.
+            If indexed, only evaluate the rules that might fire for each
+            input (see ruleindex.py).
+            The memory budget (in bytes) is passed to the parser too.
+        '''
         # N.B. the following are stored in lists since the order is important
         self.antecedents = OrderedDict()  # Maps names to variable objects
         self.consequents = OrderedDict()  # Maps names to variable objects
@@ -131,6 +156,18 @@ class SimulationHarness(object):
         self.control_system = None
         self.percent_accuracy = _DEFAULT_PERCENT_ACCURACY
         self.verbose = verbose
+        self.dtype = dtype
+        self.engine = engine
+        self.tolerance = tolerance
+        self.indexed = indexed
+        self.memory_budget = memory_budget
+        self.rule_index = None  # Built for each control system, if indexed
+        self.parser = None
+        self.name = metrics._NO_CONTROLLER  # For metrics labels
+        self._local = threading.local()  # Each thread's last timings
+        self.pool = None  # Simulators to reuse (see make_simulator_pool)
+        self.result_cache = None  # Results to reuse (see make_result_cache)
+        self.profile = None  # Where the time goes (see enable_profiling)
 
     def set_verbose(self):
         '''Will set flag to print detailed simulation results'''
@@ -144,30 +181,114 @@ class SimulationHarness(object):
         '''
         return fclfile.replace(_FCL_SUFFIX, _FLD_SUFFIX)
 
+    def parser_args(self):
+        '''The arguments for the FCLParser, given our settings'''
+        return dict(dtype=self.dtype, tolerance=self.tolerance,
+                    memory_budget=self.memory_budget,
+                    sparse=self.engine == 'sparse')
+
     def read_fcl_file(self, fclfile):
         '''Read an FCL file and initialise the variable/rule lists.'''
         assert os.path.isfile(fclfile),\
             'Can\'t find specified FCL file "{}"'.format(fclfile)
-        parser = FCLParser().read_fcl_file(fclfile)
+        parser = FCLParser(**self.parser_args()).read_fcl_file(fclfile)
         if self.verbose:
             print(parser)
+        self.use_parser(parser)
+
+    def use_parser(self, parser):
+        '''
+            Set up the variable/rule lists and control system from a parser;
+            call this again if the parser's rules are changed.
+        '''
+        self.parser = parser
+        self.name = parser.controller_name or metrics._NO_CONTROLLER
+        self.pool = None
         self.antecedents = {var.label: var for var in parser.antecedents}
         self.consequents = {var.label: var for var in parser.consequents}
         self.all_rules = OrderedDict(parser.all_rules)
         self.control_system = ctrl.ControlSystem(self.all_rules.values())
+        self.rule_index = \
+            RuleIndex(self.control_system) if self.indexed else None
+        if self.result_cache is not None:  # Its results are out of date
+            self.result_cache.clear()
+
+    def make_simulator(self):
+        '''Make a new simulation object for the current control system'''
+        return FCLSimulation(self.control_system, engine=self.engine,
+                             names=self.parser, rule_index=self.rule_index)
+
+    def make_simulator_pool(self, size):
+        '''
+            Make a pool of simulators for the current control system, and
+            use it from now on (until the next FCL file is read).
+            The harness can then be used from up to size threads at once.
+        '''
+        self.pool = SimulatorPool(self.control_system, size,
+                                  engine=self.engine, names=self.parser,
+                                  rule_index=self.rule_index)
+        return self.pool
+
+    def make_result_cache(self, maxsize=resultcache._DEFAULT_MAXSIZE,
+                          policy='lru', precision=None):
+        '''
+            Make a cache of simulation results, keyed on the inputs rounded
+            to the given precision (see resultcache.py), and use it from
+            now on; it is cleared whenever a new FCL file is read.
+        '''
+        self.result_cache = resultcache.ResultCache(maxsize, policy, precision)
+        return self.result_cache
+
+    def enable_profiling(self, profile=None):
+        '''
+            Add the time for each stage, rule block and consequent of every
+            simulation from now on to a profile (a new one, if not given;
+            see profiling.py), and return it.
+        '''
+        self.profile = profile if profile is not None else profiling.Profile()
+        return self.profile
+
+    @contextmanager
+    def _simulator(self):
+        '''A simulator from the pool if there is one, else a new one'''
+        if self.pool is None:
+            simulator = self.make_simulator()
+            simulator.profile = self.profile
+            simulator.controller = self.name
+            yield simulator
+        else:
+            with self.pool.simulator() as simulator:
+                simulator.profile = self.profile
+                simulator.controller = self.name
+                yield simulator
+
+    def _profile_since(self, start, stage):
+        '''Add the time since start to the stage, if profiling'''
+        if self.profile is not None:
+            self.profile.add_since('stages', stage, start)
 
     def simulate_one(self, input_dict):
         '''
             A utility routine to run a simluation with a given set of data.
             Supply the data as a dict of var-name:value pairs.
             Handy for testing; not used elsewhere here.
+            Returns a dict of the output values.
         '''
-        simulator = ControlSystemSimulation(self.control_system)
-        for k, v in input_dict.items():
-            simulator.input[k] = v
-        simulator.compute()
-        print('-'*70)
-        _print_simulator_state(simulator)
+        with self._simulator() as simulator:
+            for k, v in input_dict.items():
+                simulator.input[k] = v
+            simulator.compute()
+            print('-'*70)
+            _print_simulator_state(0, simulator)
+            return OrderedDict(simulator.output)
+
+    def _as_dtype(self, value):
+        '''Convert an input value (or array) to the parser's precision'''
+        if self.dtype is None:
+            return value
+        if isinstance(value, np.ndarray):
+            return value.astype(self.dtype)
+        return np.dtype(self.dtype).type(value)
 
     @staticmethod
     def _get_fs(simulator, rule, weighted=True):
@@ -183,43 +304,206 @@ class SimulationHarness(object):
             # I'm assuming activation is the same for other consequents.
             return first_conseq.activation[simulator]
 
+    @property
+    def timings(self):
+        '''
+            The seconds for each stage in the last run by this thread,
+            so that runs in other threads don't get mixed in.
+        '''
+        return getattr(self._local, 'timings', OrderedDict())
+
+    @staticmethod
+    def _add_timings(timings, simulator):
+        '''Add the simulator's stage timings (for one compute) to these'''
+        for stage, secs in simulator.timings.items():
+            timings[stage] = timings.get(stage, 0.0) + secs
+
+    def print_timings(self):
+        '''Print the time taken by each stage in the last run'''
+        total = sum(self.timings.values())
+        for stage, secs in self.timings.items():
+            print('{:>16}: {:8.4f}s ({:.0f}%)'.format(
+                stage, secs, 100 * secs / total if total else 0))
+
+    def _simulate_cached(self, input_data, run):
+        '''
+            Round the inputs, and look up each row in the result cache;
+            run the rows not found (each distinct one just once), and add
+            their results to the cache.
+        '''
+        cache = self.result_cache
+        names = input_data.names
+        values = cache.quantise(names, input_data.value)
+        output_data = TestData(self.consequents.keys(), len(values))
+        rule_data = TestData(self.all_rules.keys(), len(values))
+        key_rows = OrderedDict()  # Key: rows with this key
+        for row, row_values in enumerate(values):
+            key_rows.setdefault(cache.key(names, row_values), []).append(row)
+        missing = OrderedDict()  # Key: rows, for the keys not in the cache
+        for key, rows in key_rows.items():
+            result = cache.get(key, len(rows))
+            if result is None:
+                missing[key] = rows
+                continue
+            output_data.value[rows], rule_data.value[rows], message = result
+            if message is not None:
+                output_data.message.update((row, message) for row in rows)
+        self._local.timings = OrderedDict()
+        if not missing:
+            return output_data, rule_data
+        miss_data = TestData(names, len(missing))
+        miss_data.value = values[[rows[0] for rows in missing.values()]]
+        miss_out, miss_rules = run(miss_data)
+        for num, (key, rows) in enumerate(missing.items()):
+            message = miss_out.message.get(num)
+            cache.put(key, (miss_out.value[num].copy(),
+                            miss_rules.value[num].copy(), message))
+            output_data.value[rows] = miss_out.value[num]
+            rule_data.value[rows] = miss_rules.value[num]
+            if message is not None:
+                output_data.message.update((row, message) for row in rows)
+        return output_data, rule_data
+
+    def _counted(self, run, input_data):
+        '''Run, and count the rows and time taken, if metrics are on'''
+        registry = metrics.active
+        if registry is None:
+            return run(input_data)
+        start = default_timer()
+        output_data, rule_data = run(input_data)
+        registry.inc('simulate_seconds_total', default_timer() - start,
+                     controller=self.name)
+        registry.inc('rows_total', input_data.num_tests, controller=self.name)
+        registry.inc('rows_failed_total', len(output_data.message),
+                     controller=self.name)
+        return output_data, rule_data
+
     def simulate(self, input_data):
         '''
             Supply the inputs, run the system, collect the outputs,
             return the results (outputs, rules), once row for each test.
+            If there's a result cache, only run the rows not in it.
         '''
-        simulator = ControlSystemSimulation(self.control_system)
+        if self.result_cache is not None:
+            return self._counted(lambda data: self._simulate_cached(
+                data, self._simulate_rows), input_data)
+        return self._counted(self._simulate_rows, input_data)
+
+    def _simulate_rows(self, input_data):
+        '''Run the system on each row of the input data in turn'''
         num_tests = input_data.num_tests
         output_data = TestData(self.consequents.keys(), num_tests)
         rule_data = TestData(self.all_rules.keys(), num_tests)
+        timings = OrderedDict()
         if self.verbose:
             print('-'*70)
             for var in (list(self.antecedents.values()) +
                         list(self.consequents.values())):
                 _print_memberships(var)
             print('-'*70)
-        # For each test case (row of input values):
-        for row in range(num_tests):
-            # Load up the inputs and run:
-            for j, vname in enumerate(input_data.names):
-                simulator.input[vname] = input_data.value[row][j]
-            try:
-                simulator.compute()
-                if self.verbose:
-                    _print_simulator_state(row, simulator)
-            except Exception as exc:
-                if self.verbose:
-                    _print_simulator_state(row, simulator)
-                output_data.message[row] = '\t- {}'.format(exc)
-                continue
-            # Collect the output values:
-            for j, vname in enumerate(output_data.names):
-                output_data.value[row][j] = simulator.output[vname]
-            # Collect the rule fire-strengths:
-            for rule in simulator.ctrl.rules:
-                if rule.label in rule_data.names:  # and it should be
-                    col = rule_data.names.index(rule.label)
-                    rule_data.value[row][col] = self._get_fs(simulator, rule)
+        with self._simulator() as simulator:
+            # For each test case (row of input values):
+            for row in range(num_tests):
+                # Load up the inputs (at the parser's precision) and run:
+                start = profiling.clocks()
+                for j, vname in enumerate(input_data.names):
+                    value = self._as_dtype(input_data.value[row][j])
+                    simulator.input[vname] = value
+                self._profile_since(start, 'load inputs')
+                try:
+                    simulator.compute()
+                    self._add_timings(timings, simulator)
+                    if self.verbose:
+                        _print_simulator_state(row, simulator)
+                except Exception as exc:
+                    if self.verbose:
+                        _print_simulator_state(row, simulator)
+                    output_data.message[row] = '\t- {}'.format(exc)
+                    output_data.value[row] = np.nan
+                    continue
+                # Collect the outputs (a lenient skfuzzy omits unfired ones):
+                start = profiling.clocks()
+                missing = [vname for vname in output_data.names
+                           if vname not in simulator.output]
+                for j, vname in enumerate(output_data.names):
+                    output_data.value[row][j] = \
+                        simulator.output.get(vname, np.nan)
+                if missing:  # This test case failed, so no rules either
+                    output_data.message[row] = no_output_message(missing)
+                    self._profile_since(start, 'collect results')
+                    continue
+                # Collect the rule fire-strengths:
+                for rule in simulator.ctrl.rules:
+                    if rule.label in rule_data.names:  # and it should be
+                        col = rule_data.names.index(rule.label)
+                        rule_data.value[row][col] = \
+                            self._get_fs(simulator, rule)
+                self._profile_since(start, 'collect results')
+        self._local.timings = timings
+        return output_data, rule_data
+
+    def simulate_batch(self, input_data):
+        '''
+            As for simulate, but run all the test cases at once, with
+            each input variable given as an array (one value per row).
+            If this fails (e.g. skfuzzy can't defuzzify some row),
+            fall back to running the rows one at a time.
+            Use the 'batch' engine to accumulate and defuzzify in batches too.
+        '''
+        if self.result_cache is not None:
+            return self._counted(lambda data: self._simulate_cached(
+                data, self._simulate_batch), input_data)
+        return self._counted(self._simulate_batch, input_data)
+
+    def compute_arrays(self, inputs):
+        '''
+            Run the system once, with each input given as an array (all of
+            the same shape); return dicts of the outputs and activations.
+            Raises whatever skfuzzy raises if it can't do all the rows.
+        '''
+        with self._simulator() as simulator:
+            start = profiling.clocks()
+            for vname, values in inputs.items():
+                simulator.input[vname] = self._as_dtype(values)
+            self._profile_since(start, 'load inputs')
+            simulator.compute()
+            # Keep the results (the simulator may be reused):
+            start = profiling.clocks()
+            self._local.timings = OrderedDict(simulator.timings)
+            results = OrderedDict(simulator.output), \
+                OrderedDict(simulator.rule_activation)
+            self._profile_since(start, 'collect results')
+            return results
+
+    def _simulate_batch(self, input_data):
+        '''Run the system on all the rows of the input data at once'''
+        num_tests = input_data.num_tests
+        output_data = TestData(self.consequents.keys(), num_tests)
+        rule_data = TestData(self.all_rules.keys(), num_tests)
+        try:
+            outputs, activations = self.compute_arrays(OrderedDict(
+                (vname, input_data.value[:, j])
+                for j, vname in enumerate(input_data.names)))
+        except Exception:
+            return self._simulate_rows(input_data)
+        if self.verbose:
+            self.print_timings()
+        start = profiling.clocks()
+        missing = OrderedDict()  # Row: the outputs it's missing
+        for j, vname in enumerate(output_data.names):
+            values = np.broadcast_to(outputs.get(vname, np.nan),
+                                     (num_tests,))
+            output_data.value[:, j] = values
+            for row in np.flatnonzero(np.isnan(values)):
+                missing.setdefault(row, []).append(vname)
+        for label, activation in activations.items():
+            if label in rule_data.names:
+                col = rule_data.names.index(label)
+                rule_data.value[:, col] = activation
+        for row, vnames in missing.items():  # Failed, so no rules either
+            output_data.message[row] = no_output_message(vnames)
+            rule_data.value[row] = 0.0
+        self._profile_since(start, 'collect results')
         return output_data, rule_data
 
     def read_fld_file(self, fldfile):
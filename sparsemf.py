@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+    Membership functions stored as just their support, i.e. the part of the
+    universe where they are nonzero, as an offset plus a slice of values.
+    Narrow terms (triangles, trapezoids, rectangles, singletons) over a large
+    universe then take up much less space, and cutting, accumulating and
+    defuzzifying them only touches the points in their support.
+
+    The support keeps one zero point on either side of the nonzero values,
+    so the piecewise-linear areas (and so the defuzzified values) are
+    exactly the same as for the full array.
+
+    A parser made with sparse=True keeps its output terms as SparseTerms,
+    which hold only a SparseMF (the full mf array is made when asked for);
+    the 'sparse' engine (see fcl_simulation.py) then defuzzifies straight
+    from these, so the full arrays are never made at all.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import skfuzzy
+import skfuzzy.membership as skmemb
+import skfuzzy.control.term as fuzzterm
+from skfuzzy.defuzzify import EmptyMembershipError as \
+    DefuzzEmptyMembershipError
+from skfuzzy.fuzzymath.fuzzy_ops import _interp_universe_fast
+from skfuzzy.control.exceptions import EmptyMembershipError, \
+    NoTermMembershipsError
+
+import extramf
+
+# The defuzzification methods that defuzz_cuts can do (as skfuzzy does):
+_SPARSE_DEFUZZ = ('centroid', 'bisector', 'mom', 'som', 'lom')
+
+
+class SparseMF(object):
+    '''
+        A membership function over a universe of the given size,
+        which is zero everywhere except in universe[offset:stop].
+    '''
+    def __init__(self, size, offset, values):
+        self.size = size
+        self.offset = offset
+        self.values = values
+
+    @property
+    def stop(self):
+        '''The end of the support (as a slice bound, so not included)'''
+        return self.offset + len(self.values)
+
+    @property
+    def support(self):
+        '''The slice of the universe where this mf (may) be nonzero'''
+        return slice(self.offset, self.stop)
+
+    @classmethod
+    def from_dense(cls, mf, offset=0, size=None):
+        '''Trim the zeros from the mf (a slice starting at offset)'''
+        mf = np.asarray(mf)
+        size = len(mf) if size is None else size
+        nonzero = np.flatnonzero(mf)
+        if len(nonzero) == 0:
+            return cls(size, offset, mf[:0].copy())
+        lo = max(nonzero[0] - 1, 0)
+        hi = min(nonzero[-1] + 2, len(mf))
+        return cls(size, offset + lo, mf[lo:hi].copy())
+
+    def to_dense(self, dtype=None):
+        '''Return the full array for this mf'''
+        dtype = self.values.dtype if dtype is None else dtype
+        mf = np.zeros(self.size, dtype=dtype)
+        mf[self.support] = self.values
+        return mf
+
+    def cut(self, level):
+        '''Clip the mf at the given level (i.e. MIN activation)'''
+        return SparseMF(self.size, self.offset,
+                        np.minimum(self.values, level))
+
+    def __repr__(self):
+        return 'SparseMF({}, [{}:{}])'.format(self.size, self.offset,
+                                             self.stop)
+
+
+class SparseTerm(fuzzterm.Term):
+    '''
+        A term that only keeps the support of its mf; its mf attribute
+        is still the full array, but this is made afresh each time.
+    '''
+    def __init__(self, label, sparse):
+        self.sparse = sparse
+        fuzzterm.Term.__init__(self, label, None)
+
+    @property
+    def mf(self):
+        '''The full array for the mf'''
+        return self.sparse.to_dense()
+
+    @mf.setter
+    def mf(self, mf):
+        if mf is not None:
+            self.sparse = SparseMF.from_dense(mf)
+
+
+def singleton(universe, xpt, dtype=np.float64):
+    '''
+        Same as extramf.singletonmf (one at the nearest universe point),
+        but without making an array the size of the universe.
+    '''
+    idx = np.searchsorted(universe, xpt)
+    if idx == len(universe) or \
+            (idx > 0 and xpt - universe[idx-1] <= universe[idx] - xpt):
+        idx -= 1
+    lo, hi = max(idx - 1, 0), min(idx + 2, len(universe))
+    values = np.zeros(hi - lo, dtype=dtype)
+    values[idx - lo] = 1
+    return SparseMF(len(universe), lo, values)
+
+
+# These mfs are zero outside [left, right], so we can skip the rest:
+_FINITE_SUPPORT = {
+    skmemb.trimf:        lambda abc: (abc[0], abc[-1]),
+    skmemb.trapmf:       lambda abcd: (abcd[0], abcd[-1]),
+    extramf.rectanglemf: lambda a, b: (a, b),
+}
+
+
+def sparse_mf(universe, mf_func, params, split_params=True,
+              dtype=np.float64):
+    '''
+        Make a sparse membership function from a (universe-based) mf.
+        Only the support is calculated, if we know where that is.
+    '''
+    if mf_func is extramf.singletonmf:
+        return singleton(universe, *params, dtype=dtype)
+    if mf_func in _FINITE_SUPPORT:
+        bounds = _FINITE_SUPPORT[mf_func]
+        left, right = bounds(*params) if split_params else bounds(params)
+        lo = max(np.searchsorted(universe, left, 'left') - 1, 0)
+        hi = min(np.searchsorted(universe, right, 'right') + 1, len(universe))
+    else:  # Work it out over the whole universe
+        lo, hi = 0, len(universe)
+    if split_params:
+        mf_vals = mf_func(universe[lo:hi], *params)
+    else:  # Takes parameters as an array
+        mf_vals = mf_func(universe[lo:hi], params)
+    return SparseMF.from_dense(np.asarray(mf_vals, dtype=dtype),
+                               lo, len(universe))
+
+
+def sparse_terms(fuzzyvar, translate_mf=None):
+    '''
+        Return the sparse versions of all the terms of a variable.
+        A SparseTerm is already sparse; otherwise, if the term was defined
+        by the parser (and so has an mf_def) and a translate_mf function
+        is given, the mf is worked out afresh, or else we just trim the
+        term's existing mf array.
+    '''
+    universe = fuzzyvar.universe
+    sparse = OrderedDict()
+    for term_name, term in fuzzyvar.terms.items():
+        mf_def = getattr(term, 'mf_def', None)
+        if isinstance(term, SparseTerm):
+            sparse[term_name] = term.sparse
+        elif translate_mf and mf_def:
+            fname, params = mf_def
+            mf_func, split_params = translate_mf(fname)
+            sparse[term_name] = sparse_mf(universe, mf_func, params,
+                                          split_params, term.mf.dtype)
+        else:
+            sparse[term_name] = SparseMF.from_dense(term.mf)
+    return sparse
+
+
+def accumulate(sparse_mfs, or_func=np.fmax):
+    '''
+        Combine the mfs using the given co-norm, only over the union of
+        their supports (co-norms leave the value alone when combined with 0).
+    '''
+    sparse_mfs = [s for s in sparse_mfs if len(s.values) > 0]
+    if len(sparse_mfs) == 0:
+        return None
+    lo = min(s.offset for s in sparse_mfs)
+    hi = max(s.stop for s in sparse_mfs)
+    dtype = np.result_type(*[s.values for s in sparse_mfs])
+    out = np.zeros(hi - lo, dtype=dtype)
+    for s in sparse_mfs:
+        part = slice(s.offset - lo, s.stop - lo)
+        out[part] = or_func(out[part], s.values)
+    return SparseMF(sparse_mfs[0].size, lo, out)
+
+
+def defuzz_cuts(fuzzyvar, sparse, cuts, method=None):
+    '''
+        Defuzzify a variable given the cut (activation) level for each term,
+        as skfuzzy does in CrispValueCalculator.find_memberships, but only
+        looking at the supports of the terms that have a (nonzero) cut.
+        The sparse arg maps term names to SparseMF objects,
+        while cuts maps term names to the levels (None if not activated).
+        If every cut is zero there's no membership at all, so (as for the
+        'exact' and 'batch' engines) even MOM/SOM/LOM give no output.
+    '''
+    universe = fuzzyvar.universe
+    method = method or fuzzyvar.defuzzify_method
+    active = [(sparse[name], cut) for name, cut in cuts.items()
+              if cut is not None and cut > 0 and len(sparse[name].values) > 0]
+    if not any(cut is not None for cut in cuts.values()):
+        raise NoTermMembershipsError(fuzzyvar)
+    if len(active) == 0:
+        raise EmptyMembershipError(fuzzyvar)
+    # Add in the points where each term crosses its cut level:
+    new_values = []
+    for s, cut in active:
+        new_values.extend(_interp_universe_fast(universe[s.support],
+                                                s.values, cut).tolist())
+    lo = min(s.offset for s, _ in active)
+    hi = max(s.stop for s, _ in active)
+    new_universe = np.union1d(universe[lo:hi], new_values)
+    output_mf = np.zeros_like(new_universe, dtype=np.float64)
+    for s, cut in active:
+        sub_universe = universe[s.support]
+        part = slice(np.searchsorted(new_universe, sub_universe[0], 'left'),
+                     np.searchsorted(new_universe, sub_universe[-1], 'right'))
+        upsampled_mf = skfuzzy.interp_membership(sub_universe, s.values,
+                                                 new_universe[part])
+        np.maximum(output_mf[part], np.minimum(cut, upsampled_mf),
+                   output_mf[part])
+    try:
+        return skfuzzy.defuzz(new_universe, output_mf, method)
+    except DefuzzEmptyMembershipError:
+        raise EmptyMembershipError(fuzzyvar)
+
+
+def defuzz_simulation(sim, fuzzyvar, sparse):
+    '''
+        Defuzzify a consequent using the term memberships (cut levels)
+        that were worked out by a (non-array) ControlSystemSimulation.
+    '''
+    cuts = OrderedDict((name, term.membership_value[sim])
+                       for name, term in fuzzyvar.terms.items())
+    return defuzz_cuts(fuzzyvar, sparse, cuts)
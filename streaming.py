@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+'''
+    A simulator for a stream of inputs (e.g. a control loop), where only a
+    few of the inputs change from one step to the next.
+
+    It keeps the term memberships, rule firings and outputs from the last
+    step, and on each step only re-does the work that depends on the inputs
+    that changed:
+      * fuzzify the changed inputs;
+      * fire the rules that use any of their terms (or use the terms of an
+        output set by a re-fired rule, for chained rules);
+      * re-accumulate the output terms set by the re-fired rules, using the
+        saved activations of all the rules that set them, in the same order
+        as a full simulation would;
+      * defuzzify the outputs whose terms changed (and any TSK outputs,
+        since these use the inputs directly).
+    Each step does the same arithmetic, in the same order, as the full
+    simulation, so the outputs are identical.
+
+        simulator = StreamingSimulator(harness.control_system)
+        simulator.step({'food': 3, 'service': 7})  # First step: everything
+        simulator.step({'food': 4})                # Only what uses food
+'''
+
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+from skfuzzy.control.controlsystem import CrispValueCalculator
+from skfuzzy.control.exceptions import EmptyMembershipError, \
+    NoTermMembershipsError
+
+import tsk
+from fcl_simulation import FCLSimulation, _STAGES
+from simulate import TestData, no_output_message
+
+
+def _term_key(term):
+    '''Identify a term by its variable and label'''
+    return term.parent.label, term.label
+
+
+class StreamingSimulator(FCLSimulation):
+    '''
+        An FCLSimulation that keeps its state from one step to the next.
+        Its state is kept under one id, rather than one for each set of
+        inputs, so skfuzzy's own caching is turned off.
+    '''
+    def __init__(self, control_system, **kwargs):
+        kwargs['cache'] = False
+        FCLSimulation.__init__(self, control_system, **kwargs)
+        self._rules = list(self.ctrl.rules)  # In the order skfuzzy uses
+        # Term key: the rules (and weighted terms) that set it, in order:
+        self._setters = OrderedDict()
+        for rule in self._rules:
+            for wterm in rule.consequent:
+                self._setters.setdefault(_term_key(wterm.term), []) \
+                    .append((rule, wterm))
+        self._tsk = set(consequent.label for consequent in self.ctrl.consequents
+                        if tsk.has_function_terms(consequent))
+        self._last_inputs = {}  # Antecedent label: value at the last step
+        self._stale = set(consequent.label  # Outputs not yet defuzzified
+                          for consequent in self.ctrl.consequents)
+        self.last_fired = []  # Labels of the rules fired in the last step
+
+    def _update_unique_id(self):
+        '''Use the same id for every step, so the state is kept'''
+        self.unique_id = 'stream{}'.format(id(self))
+
+    def _changed_inputs(self):
+        '''The labels of the antecedents whose input changed since last time'''
+        changed = set()
+        for antecedent in self.ctrl.antecedents:
+            value = antecedent.input['current']
+            if value is None:
+                raise ValueError('All antecedents must have input values!')
+            last = self._last_inputs.get(antecedent.label)
+            if last is None or not np.array_equal(value, last):
+                changed.add(antecedent.label)
+                self._last_inputs[antecedent.label] = np.copy(value)
+        return changed
+
+    def _accumulate(self, key):
+        '''Accumulate a term's saved activations, in rule order'''
+        membership = None
+        for _, wterm in self._setters[key]:
+            value = wterm.activation[self]
+            if membership is None:
+                membership = value
+            else:
+                accu = wterm.term.parent.accumulation_method
+                membership = accu(value, membership)
+        wterm.term.membership_value[self] = membership
+
+    def compute(self):
+        '''Re-do only the work that depends on the changed inputs'''
+        self.timings = OrderedDict((stage, 0.0) for stage in _STAGES)
+        start = default_timer()
+        self.input._update_to_current()
+        changed = self._changed_inputs()
+        for antecedent in self.ctrl.antecedents:
+            if antecedent.label in changed:
+                CrispValueCalculator(antecedent, self) \
+                    .fuzz(antecedent.input[self])
+        dirty = set()  # Keys of output terms to be re-accumulated
+        self.last_fired = []
+        for rule in self._rules:
+            reads = [_term_key(term) for term in rule.antecedent_terms]
+            if not any(key[0] in changed or key in dirty for key in reads):
+                continue
+            for key in reads:  # Chained rules: bring the terms up to date
+                if key in dirty:
+                    self._accumulate(key)
+                    dirty.discard(key)
+            self._fire_rule(rule)
+            self.last_fired.append(rule.label)
+            for wterm in rule.consequent:
+                key = _term_key(wterm.term)
+                dirty.add(key)
+                self._stale.add(key[0])
+        for key in dirty:
+            self._accumulate(key)
+        if changed:
+            self._stale.update(self._tsk)
+        self.timings['inference'] = default_timer() - start
+        self.output = self.defuzz_consequents()
+
+    def defuzz_consequents(self):
+        '''Defuzzify just the outputs whose terms changed'''
+        self.rule_activation = OrderedDict(
+            (rule.label, rule.consequent[0].activation[self])
+            for rule in self._rules)
+        start = default_timer()
+        for consequent in self.ctrl.consequents:
+            if consequent.label not in self._stale:
+                continue
+            try:
+                consequent.output[self] = self.defuzz_consequent(consequent)
+            except (NoTermMembershipsError, EmptyMembershipError) as error:
+                consequent.output[self] = None
+                if not self.lenient:
+                    raise error
+            self._stale.discard(consequent.label)
+        results = OrderedDict()
+        for consequent in self.ctrl.consequents:
+            if consequent.output[self] is not None:
+                results[consequent.label] = consequent.output[self]
+        self.timings['defuzzification'] = default_timer() - start \
+            - self.timings['activation'] - self.timings['accumulation']
+        return results
+
+    def step(self, inputs):
+        '''
+            Set the given inputs (a dict; any not given are unchanged),
+            run, and return a dict of the outputs.
+        '''
+        for name, value in inputs.items():
+            self.input[name] = value
+        self.compute()
+        return self.output
+
+
+def simulate_stream(harness, input_data):
+    '''
+        Run the rows of the input data (a TestData) through a streaming
+        simulator, in order, as for harness.simulate; return the results
+        (outputs, rules) and the number of rules fired at each step.
+    '''
+    simulator = StreamingSimulator(harness.control_system,
+                                   engine=harness.engine,
+                                   names=harness.parser)
+    output_data = TestData(harness.consequents.keys(), input_data.num_tests)
+    rule_data = TestData(harness.all_rules.keys(), input_data.num_tests)
+    num_fired = np.zeros(input_data.num_tests, dtype=int)
+    for row in range(input_data.num_tests):
+        try:
+            outputs = simulator.step({
+                vname: harness._as_dtype(input_data.value[row][j])
+                for j, vname in enumerate(input_data.names)})
+        except Exception as exc:
+            output_data.message[row] = '\t- {}'.format(exc)
+            output_data.value[row] = np.nan
+            continue
+        finally:
+            num_fired[row] = len(simulator.last_fired)
+        missing = [vname for vname in output_data.names
+                   if vname not in outputs]
+        for j, vname in enumerate(output_data.names):
+            output_data.value[row][j] = outputs.get(vname, np.nan)
+        if missing:
+            output_data.message[row] = no_output_message(missing)
+            continue
+        for j, label in enumerate(rule_data.names):
+            rule_data.value[row][j] = simulator.rule_activation[label]
+    return output_data, rule_data, num_fired
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the adaptive universes: picking the points for each variable
+    from its terms, given a tolerance.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_parser import FCLParser
+from simulate import SimulationHarness
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, '..', 'Examples', 'jFuzzyLogic',
+                            'tipper.fcl')
+
+_TOLERANCE = 1e-3
+
+
+def test_piecewise_linear_is_small():
+    '''Triangles and trapezoids need only a few dozen points'''
+    p = FCLParser(tolerance=_TOLERANCE).read_fcl_file(_TIPPER_FILE)
+    default_sizes = FCLParser().read_fcl_file(_TIPPER_FILE).universe_sizes
+    for varname, size in p.universe_sizes.items():
+        assert size < 100, '{} has {} points'.format(varname, size)
+        assert size < default_sizes[varname] / 10
+
+
+def test_breakpoints_included():
+    '''The universe includes the breakpoints of the terms'''
+    p = FCLParser(tolerance=_TOLERANCE)
+    var = p.fuzzify_block('''
+        FUZZIFY x
+            RANGE := (0 .. 10)
+            TERM a := Triangle 0.3 1.7 2.9
+            TERM b := Rectangle 3.1 6.45
+        END_FUZZIFY
+    ''')
+    for point in (0.3, 1.7, 2.9, 3.1, 6.45):
+        assert np.min(np.abs(var.universe - point)) < 1e-12
+    tst.assert_allclose(var['b'].mf[var.universe > 3.1][0], 1)
+
+
+def test_steep_terms_get_more_points():
+    '''A steep sigmoid needs more points than a gentle one'''
+    sizes = []
+    for slope in (1, 50):
+        p = FCLParser(tolerance=_TOLERANCE)
+        var = p.fuzzify_block('''
+            FUZZIFY x
+                RANGE := (0 .. 10)
+                TERM s := Sigmoid 5 {}
+            END_FUZZIFY
+        '''.format(slope))
+        sizes.append(len(var.universe))
+    assert sizes[0] < sizes[1]
+
+
+def test_with_overrides():
+    '''A WITH step in the RANGE is always used as given'''
+    p = FCLParser(tolerance=_TOLERANCE)
+    var = p.fuzzify_block('''
+        FUZZIFY x
+            RANGE := (0 .. 10) WITH 0.5
+            TERM a := Triangle 0 5 10
+        END_FUZZIFY
+    ''')
+    assert len(var.universe) == 20
+
+
+def test_output_within_tolerance():
+    '''The outputs are close to those from the default universes'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_TIPPER_FILE)
+    adaptive = SimulationHarness(tolerance=_TOLERANCE)
+    adaptive.read_fcl_file(_TIPPER_FILE)
+    input_data, _, _ = harness.read_fld_file(
+        harness.make_fld_filename(_TIPPER_FILE))
+    want, _ = harness.simulate(input_data)
+    got, _ = adaptive.simulate(input_data)
+    x_range = np.ptp(harness.consequents['tip'].universe)
+    tst.assert_allclose(got.value, want.value, atol=2 * _TOLERANCE * x_range)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the batched accumulation and defuzzification against skfuzzy.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy
+
+import batchdefuzz
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+# Two rules for the same term, where BSUM is not the same as MAX:
+_BSUM_FCL = '''
+    FUNCTION_BLOCK bsum
+        VAR_INPUT x : REAL; END_VAR
+        VAR_OUTPUT y : REAL; END_VAR
+        FUZZIFY x
+            RANGE := (0 .. 10) WITH 0.1
+            TERM low := Triangle 0 0 6
+            TERM mid := Triangle 2 5 8
+            TERM high := Triangle 2 10 10
+        END_FUZZIFY
+        DEFUZZIFY y
+            RANGE := (0 .. 10) WITH 0.01
+            TERM a := Triangle 0 3 6
+            TERM b := Triangle 4 7 10
+            ACCU : BSUM;
+            METHOD : COG;
+        END_DEFUZZIFY
+        RULEBLOCK rules
+            RULE 1 : IF x IS low THEN y IS a;
+            RULE 2 : IF x IS mid THEN y IS a;
+            RULE 3 : IF x IS high THEN y IS b;
+        END_RULEBLOCK
+    END_FUNCTION_BLOCK
+'''
+
+
+def _random_mfs(rows, points, seed=1961):
+    '''Some membership values, with a flat top (to test the maxima)'''
+    mfs = np.random.RandomState(seed).uniform(0, 1, (rows, points))
+    mfs[:, 10:15] = 1
+    mfs[0, :] = 0.5
+    return mfs
+
+
+def test_same_as_skfuzzy():
+    '''Each row gives what skfuzzy gives, for every method'''
+    universe = np.sort(np.random.RandomState(42).uniform(0, 10, 50))
+    mfs = _random_mfs(20, 50)
+    for method in batchdefuzz._BATCH_DEFUZZ:
+        want = [skfuzzy.defuzz(universe, mf, method) for mf in mfs]
+        got = batchdefuzz.defuzz(universe, mfs, method)
+        tst.assert_allclose(got, want, err_msg=method)
+
+
+def test_empty_rows():
+    '''A row of all zeros defuzzifies to NaN'''
+    universe = np.linspace(0, 1, 11)
+    mfs = np.zeros((2, 11))
+    mfs[1, 3:6] = 0.5
+    for method in batchdefuzz._BATCH_DEFUZZ:
+        got = batchdefuzz.defuzz(universe, mfs, method)
+        assert np.isnan(got[0]) and not np.isnan(got[1]), method
+
+
+def test_accumulate():
+    '''The cut terms are combined by taking their maximum'''
+    term_mfs = [np.array([0, 0.5, 1]), np.array([1, 0.5, 0])]
+    weights = np.array([[1, 0.4], [0.2, 0.2]])
+    tensor = batchdefuzz.activation_tensor(term_mfs, weights)
+    assert tensor.shape == (2, 2, 3)
+    tst.assert_allclose(batchdefuzz.accumulate(tensor),
+                        [[0.4, 0.5, 1], [0.2, 0.2, 0.2]])
+    tst.assert_equal(batchdefuzz.chunk_rows(4, 1000, 10000), 2)
+    tst.assert_equal(batchdefuzz.chunk_rows(4, 1000, 100), 1)
+
+
+def test_batch_engine():
+    '''The batch engine is close to skfuzzy's, and is timed'''
+    input_data = TestData(['food', 'service'], 30)
+    input_data.value = np.random.RandomState(7).uniform(0, 10, (30, 2))
+    results = []
+    for engine in ('sampled', 'batch'):
+        harness = SimulationHarness(engine=engine)
+        harness.read_fcl_file(_TIPPER_FILE)
+        output_data, _ = harness.simulate_batch(input_data)
+        results.append(output_data.value)
+    tst.assert_allclose(results[1], results[0], atol=0.01)
+    assert set(harness.timings) == {'inference', 'activation',
+                                    'accumulation', 'defuzzification'}
+    assert all(secs >= 0 for secs in harness.timings.values())
+
+
+def test_bounded_sum():
+    '''With BSUM, the rules for a term are summed, but not the terms'''
+    parser = FCLParser()
+    parser.function_block(_BSUM_FCL)
+    input_data = TestData(['x'], 4)
+    input_data.value[:, 0] = [4, 2, 5.5, 7]
+    results = []
+    for engine in ('sampled', 'exact', 'batch'):
+        harness = SimulationHarness(engine=engine)
+        harness.use_parser(parser)
+        output_data, _ = harness.simulate_batch(input_data)
+        results.append(output_data.value)
+    tst.assert_allclose(results[1], results[0], atol=0.01)
+    tst.assert_allclose(results[2], results[0], atol=0.01)
+
+
+def test_chunks():
+    '''Doing the rows in chunks gives the same as all at once'''
+    input_data = TestData(['food', 'service'], 30)
+    input_data.value = np.random.RandomState(8).uniform(0, 10, (30, 2))
+    harness = SimulationHarness(engine='batch')
+    harness.read_fcl_file(_TIPPER_FILE)
+    want, _ = harness.simulate_batch(input_data)
+    saved = batchdefuzz._MAX_TENSOR_POINTS
+    batchdefuzz._MAX_TENSOR_POINTS = 7 * 3 * 101  # Rows of 3 terms x 101
+    try:
+        got, _ = harness.simulate_batch(input_data)
+    finally:
+        batchdefuzz._MAX_TENSOR_POINTS = saved
+    tst.assert_allclose(got.value, want.value)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
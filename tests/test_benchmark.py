@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the benchmark runner: that it times what it should, and that
+    regressions against a saved baseline are flagged.
+'''
+
+import copy
+import os
+import tempfile
+
+import numpy.testing as tst
+
+import benchmark
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_DIMMER_FCL = os.path.join(_HERE, '..', 'Examples', 'fuzzylite-mamdani',
+                           'SimpleDimmer.fcl')
+
+
+def _results():
+    '''A quick run on one small controller'''
+    return benchmark.run_benchmarks([_DIMMER_FCL], sizes=(1, 4), min_rows=8,
+                                    min_batches=20)
+
+
+def test_results():
+    '''Parse, build and each batch size are all timed'''
+    results = _results()
+    tst.assert_equal(list(results), [_DIMMER_FCL])
+    result = results[_DIMMER_FCL]
+    tst.assert_(result['parse_ms'] > 0 and result['build_ms'] > 0)
+    tst.assert_(result['fld_rows'] > 0)
+    tst.assert_equal(list(result['sizes']), ['1', '4'])
+    for stats in result['sizes'].values():
+        tst.assert_equal(list(stats), list(benchmark._METRICS))
+        tst.assert_(stats['rows_per_sec'] > 0)
+        tst.assert_(0 < stats['p50_ms'] <= stats['p99_ms'])
+        tst.assert_(stats['peak_bytes'] > 0)
+
+
+def test_find_fcl_files():
+    '''Directories are searched for FCL files; files are taken as given'''
+    examples = os.path.join(_HERE, '..', 'Examples')
+    fclfiles = benchmark.find_fcl_files([examples])
+    tst.assert_(len(fclfiles) > 10)
+    tst.assert_(all(name.endswith('.fcl') for name in fclfiles))
+    tst.assert_equal(benchmark.find_fcl_files([_DIMMER_FCL]), [_DIMMER_FCL])
+
+
+def test_compare():
+    '''Only changes beyond the threshold (and time slack) are flagged'''
+    results = _results()
+    tst.assert_equal(benchmark.compare(results, results), [])
+    baseline = copy.deepcopy(results)
+    stats = baseline[_DIMMER_FCL]['sizes']['4']
+    stats['rows_per_sec'] *= 2
+    stats['peak_bytes'] //= 2
+    baseline[_DIMMER_FCL]['parse_ms'] -= 0.01  # Within the time slack
+    regressions = benchmark.compare(results, baseline)
+    flagged = [(size, metric) for _, size, metric, _, _ in regressions]
+    tst.assert_equal(flagged, [(4, 'rows_per_sec'), (4, 'peak_bytes')])
+    # A big enough threshold lets everything through:
+    tst.assert_equal(benchmark.compare(results, baseline, threshold=100), [])
+
+
+def test_baseline_file():
+    '''A saved baseline loads back the same'''
+    results = _results()
+    fileh, filename = tempfile.mkstemp(suffix='.json')
+    os.close(fileh)
+    try:
+        benchmark.save_baseline(results, filename)
+        baseline = benchmark.load_baseline(filename)
+    finally:
+        os.remove(filename)
+    tst.assert_equal(baseline, results)
+    tst.assert_equal(benchmark.compare(results, baseline), [])
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the asyncio front end: concurrent calls are batched together.
+'''
+
+from __future__ import division
+import asyncio
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_async import AsyncSimulator
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+
+def _harness(engine='sampled'):
+    harness = SimulationHarness(engine=engine)
+    harness.read_fcl_file(_TIPPER_FILE)
+    return harness
+
+
+def _inputs(num_rows, seed=1815):
+    input_data = TestData(['food', 'service'], num_rows)
+    input_data.value = np.random.RandomState(seed).uniform(0, 10,
+                                                           (num_rows, 2))
+    return input_data
+
+
+def test_simulate_one_batched():
+    '''Concurrent single calls are run as one batch'''
+    input_data = _inputs(20)
+    sim = AsyncSimulator(_harness(), max_wait=0.05)
+
+    async def run_all():
+        return await asyncio.gather(*[
+            sim.simulate_one(dict(zip(input_data.names, row)))
+            for row in input_data.value])
+    got = [outputs['tip'] for outputs in asyncio.run(run_all())]
+    want, _ = _harness().simulate(input_data)
+    tst.assert_allclose(got, want.value[:, 0])
+    assert sim.batches == 1
+
+
+def test_simulate_test_data():
+    '''TestData batches (in any column order) get back their own rows'''
+    first, second = _inputs(5, 1), _inputs(7, 2)
+    second.names = ['service', 'food']  # Same values, so swapped inputs
+    sim = AsyncSimulator(_harness(), max_wait=0.05)
+
+    async def run_both():
+        return await asyncio.gather(sim.simulate(first), sim.simulate(second))
+    (out1, rules1), (out2, _) = asyncio.run(run_both())
+    want1, want_rules1 = _harness().simulate(first)
+    swapped = TestData(['food', 'service'], 7)
+    swapped.value = second.value[:, ::-1]
+    want2, _ = _harness().simulate(swapped)
+    tst.assert_allclose(out1.value, want1.value)
+    tst.assert_allclose(rules1.value, want_rules1.value)
+    tst.assert_allclose(out2.value, want2.value)
+    assert sim.batches == 1
+
+
+def test_max_batch():
+    '''A full batch is run straight away, without waiting'''
+    sim = AsyncSimulator(_harness('batch'), max_batch=10, max_wait=60)
+
+    async def run_full():
+        return await asyncio.wait_for(sim.simulate(_inputs(10)), 10)
+    output_data, _ = asyncio.run(run_full())
+    assert output_data.num_tests == 10
+    tst.assert_raises(ValueError, asyncio.run,
+                      sim.simulate(TestData(['food'], 1)))
+
+
+def test_batch_sizes():
+    '''No batch has more than max_batch rows, however many calls wait'''
+    harness = _harness('batch')
+    sizes = []
+    simulate_batch = harness.simulate_batch
+
+    def recorded(input_data):
+        sizes.append(input_data.num_tests)
+        return simulate_batch(input_data)
+    harness.simulate_batch = recorded
+    input_data = _inputs(100)
+    sim = AsyncSimulator(harness, max_batch=10, max_wait=0.05)
+
+    async def run_all():
+        return await asyncio.gather(*([
+            sim.simulate_one(dict(zip(input_data.names, row)))
+            for row in input_data.value[:60]] +
+            [sim.simulate(_inputs(3, 4)), sim.simulate(_inputs(25, 5))]))
+    results = asyncio.run(run_all())
+    assert max(sizes) <= 10, sizes
+    assert sum(sizes) == 60 + 3 + 25
+    want, _ = _harness('batch').simulate(input_data)
+    tst.assert_allclose([outputs['tip'] for outputs in results[:60]],
+                        want.value[:60, 0])
+    want, _ = _harness('batch').simulate(_inputs(25, 5))
+    assert results[-1][0].num_tests == 25
+    tst.assert_allclose(results[-1][0].value, want.value)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the generated standalone modules against the harness.
+'''
+
+from __future__ import division
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import numpy.testing as tst
+
+import fcl_codegen
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples')
+
+# Only run the first few rows of each FLD file, to keep this quick:
+_ROWS_PER_FILE = 10
+
+# Allowed difference from the harness, as a fraction of the output range:
+_TOLERANCE = 1e-9
+
+_ONE_RULE_FCL = '''
+    FUNCTION_BLOCK one_rule
+        VAR_INPUT x : REAL; END_VAR
+        VAR_OUTPUT y : REAL; END_VAR
+        FUZZIFY x
+            RANGE := (0 .. 10)
+            TERM low := Trapezoid 0 0 2 5
+        END_FUZZIFY
+        DEFUZZIFY y
+            RANGE := (0 .. 10)
+            TERM mid := Triangle 2 4 6
+            METHOD : {};
+        END_DEFUZZIFY
+        RULEBLOCK rules
+            RULE 1 : IF x IS low THEN y IS mid;
+        END_RULEBLOCK
+    END_FUNCTION_BLOCK
+'''
+
+
+def _example_files():
+    '''All the FCL files in the Examples directory (and its subdirs)'''
+    for dirpath, _, files in sorted(os.walk(_EXAMPLES_DIR)):
+        for filename in sorted(files):
+            if filename.endswith('.fcl'):
+                yield os.path.join(dirpath, filename)
+
+
+def _generate(harness, dirpath, name):
+    '''Write and import the module for the harness's controller'''
+    filename = os.path.join(dirpath, name + '.py')
+    fcl_codegen.write_module(harness.parser, filename)
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _check_same(harness, module, input_data):
+    '''The module gives the harness's outputs and rule activations'''
+    want, want_rules = harness.simulate(input_data)
+    got = module.evaluate(dict(zip(input_data.names, input_data.value.T)),
+                          rules=True)
+    ok = [row not in want.message for row in range(input_data.num_tests)]
+    for j, name in enumerate(want.names):
+        universe = harness.consequents[name].universe
+        tst.assert_allclose(got[name][ok], want.value[ok, j], rtol=0,
+                            atol=_TOLERANCE * np.ptp(universe))
+    for j, label in enumerate(want_rules.names):
+        tst.assert_allclose(got[label][ok], want_rules.value[ok, j],
+                            atol=1e-12)
+
+
+def test_examples():
+    '''Same results as the harness on the Examples corpus'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for num, fclfile in enumerate(_example_files()):
+            harness = SimulationHarness()
+            harness.read_fcl_file(fclfile)
+            module = _generate(harness, tmpdir, 'example{}'.format(num))
+            input_data, _, _ = harness.read_fld_file(
+                harness.make_fld_filename(fclfile))
+            input_data.value = input_data.value[:_ROWS_PER_FILE]
+            _check_same(harness, module, input_data)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_tsk_and_shapes():
+    '''TSK outputs, inputs out of range, and the shape of the results'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(os.path.join(_HERE, 'sugeno.fcl'))
+    shared = SimulationHarness()  # Two rules with the same TSK term
+    shared.read_fcl_file(os.path.join(_HERE, 'sugeno_shared.fcl'))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        module = _generate(harness, tmpdir, 'sugeno')
+        np.random.seed(1847)
+        input_data = harness.gen_sample_inputs(30)
+        input_data.value[0] = [-5, 20]  # Clipped to the universe
+        _check_same(harness, module, input_data)
+        _check_same(shared, _generate(shared, tmpdir, 'sugeno_shared'),
+                    input_data)
+        got = module.evaluate({'x': 3, 'y': [[1, 2], [3, 4]]})
+        assert got['z'].shape == (2, 2)
+        assert np.isscalar(module.evaluate({'x': 3, 'y': 4})['z'])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_no_rules_fire():
+    '''Where no rule fires the output is NaN, whatever the method'''
+    input_data = TestData(['x'], 3)
+    input_data.value[:, 0] = [1, 3, 8]  # Nothing fires for 8
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for num, method in enumerate(('COG', 'COA', 'MOM', 'LM', 'RM')):
+            parser = FCLParser()
+            parser.function_block(_ONE_RULE_FCL.format(method))
+            harness = SimulationHarness()
+            harness.use_parser(parser)
+            module = _generate(harness, tmpdir, 'one_rule{}'.format(num))
+            got = module.evaluate({'x': input_data.value[:, 0]})['y']
+            assert np.isnan(got[2]), method
+            want, _ = harness.simulate(input_data)
+            tst.assert_allclose(got[:2], want.value[:2, 0], err_msg=method)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_standalone():
+    '''The generated module runs without skfuzzy or the parser'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    input_data = TestData(['service', 'food'], 1)
+    input_data.value[0] = [3, 8]
+    want = harness.simulate(input_data)[0].value[0, 0]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fcl_codegen.write_module(harness.parser,
+                                 os.path.join(tmpdir, 'tipper_fis.py'))
+        script = ('import sys\n'
+                  'for name in ["skfuzzy", "networkx", "fcl_parser"]:\n'
+                  '    sys.modules[name] = None  # So importing fails\n'
+                  'import tipper_fis\n'
+                  'print(tipper_fis.evaluate({"service": 3, "food": 8})'
+                  '["tip"])\n')
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         cwd=tmpdir)
+        tst.assert_allclose(float(output), want)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+'''
+    Check running several function blocks, wired together by name.
+'''
+
+from __future__ import division
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_parser import ParsingError
+from fcl_pipeline import FCLPipeline, read_function_blocks
+import sparsemf
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_PIPELINE_FILE = os.path.join(_HERE, 'pipeline.fcl')
+
+# The first block sets only "a" for 4 < x < 5, and nothing for x > 5:
+_MISSING_FCL = '''
+FUNCTION_BLOCK first
+VAR_INPUT x : REAL; END_VAR
+VAR_OUTPUT a : REAL; b : REAL; END_VAR
+FUZZIFY x
+    RANGE := (0 .. 10) WITH 0.1
+    TERM low := Triangle 0 0 5
+    TERM mid := Triangle 0 2 4
+END_FUZZIFY
+DEFUZZIFY a
+    RANGE := (0 .. 10) WITH 0.1
+    TERM on := Triangle 0 5 10
+    METHOD : COG;
+END_DEFUZZIFY
+DEFUZZIFY b
+    RANGE := (0 .. 10) WITH 0.1
+    TERM on := Triangle 0 5 10
+    METHOD : COG;
+END_DEFUZZIFY
+RULEBLOCK
+    RULE 1: IF x IS low THEN a IS on;
+    RULE 2: IF x IS mid THEN b IS on;
+END_RULEBLOCK
+END_FUNCTION_BLOCK
+
+FUNCTION_BLOCK second
+VAR_INPUT a : REAL; END_VAR
+VAR_OUTPUT c : REAL; END_VAR
+FUZZIFY a
+    RANGE := (0 .. 10) WITH 0.1
+    TERM any := Trapezoid 0 0 10 10
+END_FUZZIFY
+DEFUZZIFY c
+    RANGE := (0 .. 10) WITH 0.1
+    TERM on := Triangle 0 5 10
+    METHOD : COG;
+END_DEFUZZIFY
+RULEBLOCK
+    RULE 1: IF a IS any THEN c IS on;
+END_RULEBLOCK
+END_FUNCTION_BLOCK
+'''
+
+
+def _run_block(parser, columns, num_tests):
+    '''Run one block with its own harness, adding its outputs to columns'''
+    harness = SimulationHarness(engine='batch')
+    harness.use_parser(parser)
+    input_data = TestData(harness.antecedents.keys(), num_tests)
+    for j, vname in enumerate(input_data.names):
+        input_data.value[:, j] = columns[vname]
+    output_data, rule_data = harness.simulate_batch(input_data)
+    columns.update(zip(output_data.names, output_data.value.T))
+    return rule_data
+
+
+def test_wiring():
+    '''The blocks are sorted into levels by what they depend on'''
+    pipeline = FCLPipeline().read_fcl_file(_PIPELINE_FILE)
+    assert pipeline.levels == [['dimmer', 'tipper'], ['inverse'], ['mood']]
+    assert pipeline.input_names == ['Ambient', 'service', 'food']
+    assert pipeline.sources['mood'] == {'InversePower': 'inverse',
+                                        'tip': 'tipper'}
+    assert pipeline.rule_names[:4] == ['dimmer.1', 'dimmer.2', 'dimmer.3',
+                                       'tipper.1']
+
+
+def test_same_as_blocks():
+    '''Same results as running each block in turn, whatever the chunks'''
+    np.random.seed(1847)
+    input_data = TestData(['Ambient', 'service', 'food'], 50)
+    input_data.value = np.random.rand(50, 3) * [1, 10, 10]
+    columns = dict(zip(input_data.names, input_data.value.T))
+    want_rules = {}
+    for parser in read_function_blocks(_PIPELINE_FILE):
+        rule_data = _run_block(parser, columns, input_data.num_tests)
+        want_rules.update(('{}.{}'.format(parser.fb_name, label), values)
+                          for label, values in zip(rule_data.names,
+                                                   rule_data.value.T))
+    for chunk_rows, workers in [(1000, 1), (7, 4)]:
+        pipeline = FCLPipeline(chunk_rows=chunk_rows, workers=workers)
+        pipeline.read_fcl_file(_PIPELINE_FILE)
+        output_data, rule_data = pipeline.simulate_batch(input_data)
+        for j, vname in enumerate(output_data.names):
+            tst.assert_allclose(output_data.value[:, j], columns[vname])
+        for j, label in enumerate(rule_data.names):
+            tst.assert_allclose(rule_data.value[:, j], want_rules[label])
+
+
+def test_bad_wiring():
+    '''Outputs set twice, or blocks that depend on each other'''
+    with open(_PIPELINE_FILE) as fileh:
+        text = fileh.read()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dimmer = text[text.index('FUNCTION_BLOCK dimmer'):
+                      text.index('FUNCTION_BLOCK inverse')]
+        for bad_text in [text + dimmer.replace('dimmer', 'dimmer2'),
+                         text.replace('Ambient', 'InversePower')]:
+            fclfile = os.path.join(tmpdir, 'bad.fcl')
+            with open(fclfile, 'w') as fileh:
+                fileh.write(bad_text)
+            tst.assert_raises(ParsingError,
+                              FCLPipeline().read_fcl_file, fclfile)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_missing_outputs():
+    '''Only the outputs that weren't set are NaN, and passed on as such'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fclfile = os.path.join(tmpdir, 'missing.fcl')
+        with open(fclfile, 'w') as fileh:
+            fileh.write(_MISSING_FCL)
+        pipeline = FCLPipeline(engine='sampled').read_fcl_file(fclfile)
+    finally:
+        shutil.rmtree(tmpdir)
+    input_data = TestData(['x'], 3)
+    input_data.value[:, 0] = [2, 4.5, 7]
+    output_data, _ = pipeline.simulate_batch(input_data)
+    assert output_data.names == ['a', 'b', 'c']
+    tst.assert_(np.all(np.isfinite(output_data.value[0])))
+    tst.assert_equal(np.isnan(output_data.value[1:]),
+                     [[False, True, False], [True, True, True]])
+    tst.assert_equal(output_data.message,
+                     {1: '\t- no output for "b" (no rules fired)',
+                      2: '\t- no output for "a", "b", "c" (no rules fired)'})
+
+
+def test_parser_args():
+    '''The parser options (memory budget, sparse terms) reach each block'''
+    tst.assert_raises(ParsingError,
+                      FCLPipeline(memory_budget=1000).read_fcl_file,
+                      _PIPELINE_FILE)
+    sparse = FCLPipeline(engine='sparse').read_fcl_file(_PIPELINE_FILE)
+    for harness in sparse.stages.values():
+        for var in harness.consequents.values():
+            assert all(isinstance(term, sparsemf.SparseTerm)
+                       for term in var.terms.values()), var.label
+    np.random.seed(1848)
+    input_data = TestData(['Ambient', 'service', 'food'], 20)
+    input_data.value = np.random.rand(20, 3) * [1, 10, 10]
+    want, _ = FCLPipeline(engine='sampled').read_fcl_file(_PIPELINE_FILE) \
+        .simulate_batch(input_data)
+    got, _ = sparse.simulate_batch(input_data)
+    tst.assert_allclose(got.value, want.value)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the inference server: batching, reloading, and the HTTP interface.
+'''
+
+from __future__ import division
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from http.client import HTTPConnection
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_server import InferenceServer
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+
+def _inputs(num_rows, seed=1066):
+    values = np.random.RandomState(seed).uniform(0, 10, (num_rows, 2))
+    return [{'service': s, 'food': f} for (s, f) in values]
+
+
+def _want_tips(rows):
+    '''The tips from the usual (sampled, one row at a time) simulation'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_TIPPER_FILE)
+    input_data = TestData(['service', 'food'], len(rows))
+    input_data.value[:] = [[row['service'], row['food']] for row in rows]
+    output_data, _ = harness.simulate(input_data)
+    return output_data.value[:, 0]
+
+
+def test_concurrent_requests_batched():
+    '''Requests from different threads are batched, and get their outputs'''
+    server = InferenceServer([_TIPPER_FILE], max_wait=0.05)
+    rows = _inputs(20)
+    got = [None] * len(rows)
+
+    def ask(i):
+        got[i] = server.evaluate('tipper', rows[i])['tip']
+    threads = [threading.Thread(target=ask, args=(i,))
+               for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.close()
+    tst.assert_allclose(got, _want_tips(rows), atol=0.01)
+    stats = server.stats()['tipper']
+    assert stats['requests'] == 20 and stats['rows'] == 20
+    assert stats['batches'] < 20
+    assert stats['latency_p50'] > 0
+
+
+def test_bad_request_alone():
+    '''A request with a missing input fails, without spoiling the others'''
+    server = InferenceServer([_TIPPER_FILE])
+    tst.assert_raises(ValueError, server.evaluate, 'tipper', {'food': 2})
+    tst.assert_raises(KeyError, server.evaluate, 'no_such', {'food': 2})
+    assert server.evaluate('tipper', _inputs(1)[0])['tip'] is not None
+    server.close()
+    assert server.stats()['tipper']['errors'] == 1
+
+
+def test_hot_reload():
+    '''Changed files are re-read, and new files in the dir are found'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fclfile = os.path.join(tmpdir, 'tipper.fcl')
+        shutil.copy(_TIPPER_FILE, fclfile)
+        server = InferenceServer([tmpdir])
+        row = {'service': 9, 'food': 9}
+        before = server.evaluate('tipper', row)['tip']
+        with open(_TIPPER_FILE) as fileh:
+            text = fileh.read()
+        with open(fclfile, 'w') as fileh:  # Shift the output range
+            fileh.write(text.replace('RANGE := (0.000 .. 30.000)',
+                                     'RANGE := (0.000 .. 60.000)'))
+        os.utime(fclfile, (time.time() + 5, time.time() + 5))
+        assert server.evaluate('tipper', row)['tip'] != before
+        shutil.copy(_TIPPER_FILE, os.path.join(tmpdir, 'other.fcl'))
+        tst.assert_allclose(server.evaluate('other', row)['tip'], before)
+        server.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_new_controller_once():
+    '''Threads asking for a new controller all get the same one'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        server = InferenceServer([tmpdir])
+        shutil.copy(_TIPPER_FILE, os.path.join(tmpdir, 'tipper.fcl'))
+        got = [None] * 10
+
+        def ask(i):
+            got[i] = server.controller('tipper')
+        threads = [threading.Thread(target=ask, args=(i,))
+                   for i in range(len(got))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(controller is got[0] for controller in got)
+        assert server.evaluate('tipper', _inputs(1)[0])['tip'] is not None
+        server.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_unknown_rescan_limited():
+    '''After a miss, we don't look for new files again for a while'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        server = InferenceServer([tmpdir], rescan_interval=60)
+        tst.assert_raises(KeyError, server.controller, 'tipper')
+        shutil.copy(_TIPPER_FILE, os.path.join(tmpdir, 'tipper.fcl'))
+        tst.assert_raises(KeyError, server.controller, 'tipper')
+        server.rescan_interval = 0
+        assert server.controller('tipper').name == 'tipper'
+        server.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_broken_reload():
+    '''A broken edit keeps the old version, until the file is fixed'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fclfile = os.path.join(tmpdir, 'tipper.fcl')
+        shutil.copy(_TIPPER_FILE, fclfile)
+        server = InferenceServer([tmpdir])
+        row = {'service': 9, 'food': 9}
+        before = server.evaluate('tipper', row)['tip']
+        with open(fclfile, 'w') as fileh:
+            fileh.write('FUNCTION_BLOCK tipper\nVAR_INPUT oops')
+        os.utime(fclfile, (time.time() + 5, time.time() + 5))
+        tst.assert_allclose(server.evaluate('tipper', row)['tip'], before)
+        assert server.controller('tipper').load_error is not None
+        with open(_TIPPER_FILE) as fileh:
+            text = fileh.read()
+        with open(fclfile, 'w') as fileh:  # Fixed, with a new output range
+            fileh.write(text.replace('RANGE := (0.000 .. 30.000)',
+                                     'RANGE := (0.000 .. 60.000)'))
+        os.utime(fclfile, (time.time() + 10, time.time() + 10))
+        assert server.evaluate('tipper', row)['tip'] != before
+        assert server.controller('tipper').load_error is None
+        server.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_broken_file_in_dir():
+    '''A file that can't be read doesn't stop the others being found'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmpdir, 'broken.fcl'), 'w') as fileh:
+            fileh.write('FUNCTION_BLOCK broken\nVAR_INPUT oops')
+        shutil.copy(_TIPPER_FILE, os.path.join(tmpdir, 'tipper.fcl'))
+        server = InferenceServer([tmpdir], rescan_interval=60)
+        assert list(server.batchers) == ['tipper']
+        tst.assert_raises(KeyError, server.controller, 'broken')
+        assert server._last_miss is not None  # So we don't rescan yet
+        shutil.copy(_TIPPER_FILE, os.path.join(tmpdir, 'other.fcl'))
+        tst.assert_raises(KeyError, server.controller, 'other')
+        server.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _post(conn, path, obj):
+    conn.request('POST', path, json.dumps(obj),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+def test_http():
+    '''Ask for outputs over HTTP on a local port'''
+    server = InferenceServer([_TIPPER_FILE])
+    http_server = server.make_http_server(0)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.start()
+    try:
+        conn = HTTPConnection('localhost', http_server.server_address[1])
+        rows = _inputs(5)
+        status, reply = _post(conn, '/tipper', rows)
+        assert status == 200
+        tst.assert_allclose([r['tip'] for r in reply], _want_tips(rows),
+                            atol=0.01)
+        assert _post(conn, '/tipper', {'food': 1})[0] == 400
+        assert _post(conn, '/unknown', rows)[0] == 404
+        conn.request('GET', '/')
+        reply = json.loads(conn.getresponse().read().decode('utf-8'))
+        assert reply['tipper']['outputs'] == ['tip']
+        conn.close()
+    finally:
+        server.close()
+        http_server.server_close()
+        thread.join()
+
+
+def test_unix_socket():
+    '''Ask for outputs over HTTP on a Unix socket'''
+    if not hasattr(socket, 'AF_UNIX'):
+        return
+    tmpdir = tempfile.mkdtemp()
+    sockpath = os.path.join(tmpdir, 'fcl.sock')
+    server = InferenceServer([_TIPPER_FILE])
+    http_server = server.make_http_server(sockpath)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.start()
+    try:
+        conn = HTTPConnection('localhost')
+        conn.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.sock.connect(sockpath)
+        status, reply = _post(conn, '/tipper', _inputs(1)[0])
+        assert status == 200 and reply['tip'] is not None
+        conn.close()
+    finally:
+        server.close()
+        http_server.server_close()
+        thread.join()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
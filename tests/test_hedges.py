@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+'''
+    Check that fused chains of hedges behave like applying them one by one.
+'''
+
+from __future__ import division
+import itertools
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy.membership as skmemb
+import skfuzzy.control as ctrl
+
+import hedges
+from fcl_parser import FCLParser
+
+
+def _sequential(hedge_funcs, mf):
+    '''Apply each hedge in turn, starting at the last one'''
+    for func in hedge_funcs[::-1]:
+        mf = func(mf)
+    return mf
+
+
+def test_fused_same_as_sequential():
+    '''Every chain of up to three hedges gives the same result when fused'''
+    x = np.arange(0, 100)
+    mf = skmemb.gaussmf(x, 50, 15)
+    all_funcs = list(hedges._IEEE_HEDGES.values())
+    for length in (1, 2, 3):
+        for chain in itertools.product(all_funcs, repeat=length):
+            chain = list(chain)
+            want = _sequential(chain, mf)
+            got = hedges.fuse_hedges(chain)(mf)
+            tst.assert_allclose(got, want, atol=1e-12,
+                                err_msg=str([f.__name__ for f in chain]))
+
+
+def test_power_hedges_folded():
+    '''A run of power hedges becomes a single power'''
+    chain = [hedges.very, hedges.extremely, hedges.somewhat]
+    assert hedges.plan_hedges(chain) == [('power', 3.0)]
+    # These cancel out completely:
+    chain = [hedges.is_not, hedges.very, hedges.somewhat, hedges.is_not]
+    assert hedges.plan_hedges(chain) == []
+
+
+def test_fused_leaves_original():
+    '''The mf passed in is not changed by the fused function'''
+    mf = np.linspace(0, 1, 11)
+    hedges.fuse_hedges([hedges.is_not, hedges.very])(mf)
+    tst.assert_allclose(mf, np.linspace(0, 1, 11))
+
+
+def _hedge_parser():
+    '''A parser with one input and one output variable'''
+    p = FCLParser()
+    p.fuzzify_block('''
+        FUZZIFY temp
+            RANGE := (0 .. 100) WITH 1
+            TERM hot := Triangle 50 100 100
+        END_FUZZIFY
+    ''')
+    p.defuzzify_block('''
+        DEFUZZIFY fan
+            RANGE := (0 .. 10) WITH 1
+            TERM fast := Triangle 5 10 10
+        END_DEFUZZIFY
+    ''')
+    return p
+
+
+def test_consequent_hedges():
+    '''Hedged consequent terms are mfs that match the sequential version'''
+    p = _hedge_parser()
+    p.rule('IF temp IS hot THEN fan IS very extremely somewhat fast')
+    want = _sequential([hedges.very, hedges.extremely, hedges.somewhat],
+                       p['fan']['fast'].mf)
+    tst.assert_allclose(p['fan']['_very_extremely_somewhat_fast'].mf, want)
+
+
+def test_antecedent_hedges_on_degrees():
+    '''Pointwise hedges in an antecedent don't add terms to the variable'''
+    p = _hedge_parser()
+    rule = p.rule('IF temp IS not very hot THEN fan IS fast')
+    assert list(p['temp'].terms) == ['hot']
+    assert isinstance(rule.antecedent, hedges.HedgedClause)
+    # A non-pointwise hedge still needs an mf, but only for that part:
+    rule = p.rule('IF temp IS very slightly hot THEN fan IS fast')
+    assert list(p['temp'].terms) == ['hot', '_slightly_hot']
+    assert rule.antecedent.hedge_names == ['very']
+
+
+def test_antecedent_hedges_simulate():
+    '''The hedge is applied to the degree of the input's membership'''
+    p = _hedge_parser()
+    p.rule('IF temp IS very hot THEN fan IS fast')
+    sim = ctrl.ControlSystemSimulation(ctrl.ControlSystem(p.rules))
+    sim.input['temp'] = 80
+    sim.compute()
+    rule = list(p.rules)[0]
+    tst.assert_allclose(rule.aggregate_firing[sim], 0.6 ** 2)
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the response surfaces: built over a grid, then interpolated.
+'''
+
+from __future__ import division
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as tst
+
+import lut
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+
+def _harness():
+    harness = SimulationHarness(engine='batch')
+    harness.read_fcl_file(_TIPPER_FILE)
+    return harness
+
+
+def test_grid_points_exact():
+    '''At the grid points we get exactly what the harness gives'''
+    harness = _harness()
+    surface = lut.build_surface(harness, points=[11, 6], rules=True,
+                                workers=2)
+    assert surface.outputs['tip'].shape == (11, 6)
+    assert harness.pool is None  # The pool was only for the build
+    service, food = np.meshgrid(*surface.axes, indexing='ij')
+    input_data = TestData(surface.input_names, service.size)
+    input_data.value = np.stack([service.ravel(), food.ravel()], axis=1)
+    want_out, want_rules = harness.simulate_batch(input_data)
+    got = surface.evaluate(dict(zip(input_data.names, input_data.value.T)),
+                           rules=True)
+    tst.assert_allclose(got['tip'], want_out.value[:, 0])
+    for j, label in enumerate(want_rules.names):
+        tst.assert_allclose(got[label], want_rules.value[:, j])
+
+
+def test_interpolation():
+    '''Between grid points, interpolate (and clip to the grid)'''
+    axes = [np.array([0., 1., 3.]), np.array([0., 10.])]
+    values = np.add.outer(axes[0] * 2, axes[1])  # Linear, so exact
+    surface = lut.ResponseSurface(['x', 'y'], axes, [('z', values)])
+    got = surface.evaluate({'x': [0.5, 2, 5, -1], 'y': [5, 2.5, 10, 0]})
+    tst.assert_allclose(got['z'], [6, 6.5, 16, 0])
+
+
+def test_error_and_save():
+    '''The error is checked, and saved surfaces are memory-mapped'''
+    harness = _harness()
+    surface = lut.build_surface(harness, points=41, workers=1)
+    error = surface.check_error(harness, num_samples=200, seed=7)
+    assert 0 < error['tip'] < 1.5
+    tmpdir = tempfile.mkdtemp()
+    try:
+        surface.save(tmpdir)
+        loaded = lut.ResponseSurface.load(tmpdir)
+        assert isinstance(loaded.outputs['tip'], np.memmap)
+        assert loaded.max_error['tip'] == error['tip']
+        inputs = {'service': [1.5, 7.25], 'food': [9.1, 0.3]}
+        tst.assert_allclose(loaded.evaluate(inputs)['tip'],
+                            surface.evaluate(inputs)['tip'])
+        del loaded  # Release the memory maps before removing the files
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the memory reports, and that a parser keeps to its budget.
+'''
+
+import os
+
+import numpy.testing as tst
+
+import memreport
+from fcl_parser import FCLParser, ParsingError
+from simulate import SimulationHarness
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FCL = os.path.join(_HERE, 'tipper.fcl')
+
+
+def _hedged_parser(**parser_args):
+    '''A parser with a hedged consequent term'''
+    parser = FCLParser(**parser_args)
+    parser.fuzzify_block('''
+        FUZZIFY temp
+            RANGE := (0 .. 100) WITH 1
+            TERM hot := Triangle 50 100 100
+        END_FUZZIFY
+    ''')
+    parser.defuzzify_block('''
+        DEFUZZIFY fan
+            RANGE := (0 .. 10) WITH 0.01
+            TERM fast := Triangle 5 10 10
+        END_DEFUZZIFY
+    ''')
+    parser.rule_block('''
+        RULEBLOCK
+            RULE 1: IF temp IS hot THEN fan IS very fast;
+        END_RULEBLOCK
+    ''')
+    return parser
+
+
+def test_categories():
+    '''Each array and rule is counted, in the right category'''
+    parser = _hedged_parser()
+    report = memreport.memory_report(parser)
+    totals = report.totals
+    tst.assert_equal(list(totals), list(memreport._CATEGORIES))
+    tst.assert_equal(sum(totals.values()), report.total)
+    tst.assert_(totals['universes'] > (101 + 1001) * 8)
+    tst.assert_(totals['terms'] > (101 + 1001) * 8)
+    tst.assert_(totals['hedged terms'] > 1001 * 8)
+    tst.assert_(totals['rules'] > 0)
+    names = [name for category, name, _ in report.items
+             if category == 'hedged terms']
+    tst.assert_equal(names, ['fan._very_fast'])
+
+
+def test_top():
+    '''The biggest items come first'''
+    report = memreport.memory_report(_hedged_parser())
+    top = report.top(3)
+    tst.assert_equal(len(top), 3)
+    sizes = [size for _, _, size in top]
+    tst.assert_equal(sizes, sorted(sizes, reverse=True))
+    tst.assert_equal(sizes[0], max(size for _, _, size in report.items))
+    tst.assert_('Largest items:' in str(report))
+    tst.assert_equal(report.as_dict(2)['total'], report.total)
+    tst.assert_equal(len(report.as_dict(2)['top']), 2)
+
+
+def test_simulation_state():
+    '''What skfuzzy keeps for each set of inputs is counted'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_TIPPER_FCL)
+    before = memreport.memory_report(harness.parser)
+    harness.simulate(harness.gen_sample_inputs(20))
+    after = memreport.memory_report(harness.parser)
+    tst.assert_(after.totals['simulation state'] >
+                before.totals['simulation state'])
+    tst.assert_equal(after.totals['terms'], before.totals['terms'])
+    no_state = memreport.memory_report(harness.parser, with_state=False)
+    tst.assert_equal(no_state.totals['simulation state'], 0)
+
+
+def test_budget():
+    '''Going over budget is an error, as soon as a variable would do so'''
+    size = memreport.memory_report(_hedged_parser(), with_state=False).total
+    _hedged_parser(memory_budget=size)
+    try:
+        _hedged_parser(memory_budget=size // 2)
+        tst.assert_(False, 'Should be over budget')
+    except ParsingError as error:
+        tst.assert_equal(error.error_kind, 'memory error')
+        tst.assert_('"fan"' in str(error))
+    # The harness passes the budget to its parser:
+    harness = SimulationHarness(memory_budget=1000)
+    tst.assert_raises(ParsingError, harness.read_fcl_file, _TIPPER_FCL)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
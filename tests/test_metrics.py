@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the engine's counters: what they count, per row, whether the
+    rows are run one at a time or as a batch, and how they are exported.
+'''
+
+import json
+import os
+import tempfile
+
+import numpy as np
+import numpy.testing as tst
+
+import metrics
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_MULTIPLE_FCL = os.path.join(_HERE, 'multiple.fcl')
+
+
+def _counted(batch=False, indexed=False, num_tests=15):
+    '''Simulate multiple.fcl with metrics on; return the registry'''
+    harness = SimulationHarness(engine='batch' if batch else 'sampled',
+                                indexed=indexed)
+    harness.read_fcl_file(_MULTIPLE_FCL)
+    np.random.seed(1485)
+    input_data = harness.gen_sample_inputs(num_tests)
+    registry = metrics.enable()
+    try:
+        if batch:
+            harness.simulate_batch(input_data)
+        else:
+            harness.simulate(input_data)
+    finally:
+        metrics.disable()
+    return registry
+
+
+def _by_op(registry):
+    '''The norm calls for each operator (whatever the function)'''
+    calls = {}
+    for key, count in registry.counters['norm_calls_total'].items():
+        calls[dict(key)['op']] = calls.get(dict(key)['op'], 0) + count
+    return calls
+
+
+def test_off_by_default():
+    '''Nothing is counted unless metrics are enabled'''
+    registry = _counted()
+    assert metrics.active is None
+    harness = SimulationHarness()
+    harness.read_fcl_file(_MULTIPLE_FCL)
+    harness.simulate(harness.gen_sample_inputs(5))
+    tst.assert_equal(registry.get('rows_total'), 15)
+
+
+def test_rule_counts():
+    '''Each rule and input term is counted once per row'''
+    for batch in (False, True):
+        registry = _counted(batch)
+        tst.assert_equal(registry.get('rows_total'), 15)
+        tst.assert_equal(registry.get('rules_evaluated_total'), 7 * 15)
+        tst.assert_equal(registry.get('rules_skipped_total'), 0)
+        tst.assert_equal(registry.get('terms_fuzzified_total'), 10 * 15)
+        # Rules 1-6 have an AND each, rule 123 has three ANDs and two ORs:
+        calls = _by_op(registry)
+        tst.assert_equal(calls['and'], 9 * 15)
+        tst.assert_equal(calls['or'], 2 * 15)
+        tst.assert_(0 < calls['accu'] < 7 * 15)
+        tst.assert_(0 < registry.get('rules_zero_total') < 7 * 15)
+        tst.assert_(registry.rows_per_second() > 0)
+
+
+def test_skipped_rules():
+    '''With a rule index, every rule is either evaluated or skipped'''
+    registry = _counted(indexed=True)
+    evaluated = registry.get('rules_evaluated_total')
+    skipped = registry.get('rules_skipped_total')
+    tst.assert_equal(evaluated + skipped, 7 * 15)
+    tst.assert_(skipped > 0)
+
+
+def test_defuzz_failures():
+    '''A row where no rules fire is counted as a failure, in any engine'''
+    input_data = TestData(['x1', 'x2'], 2)
+    input_data.value = np.array([[2.05, 2.05], [0.6, 0.9]])
+    for engine in ('sampled', 'batch'):
+        harness = SimulationHarness(engine=engine)
+        harness.read_fcl_file(_MULTIPLE_FCL)
+        registry = metrics.enable()
+        try:
+            run = harness.simulate_batch if engine == 'batch' \
+                else harness.simulate
+            output_data, _ = run(input_data)
+        finally:
+            metrics.disable()
+        tst.assert_equal(len(output_data.message), 1)
+        tst.assert_equal(registry.get('rows_failed_total'), 1)
+        tst.assert_equal(registry.get('defuzz_failures_total'), 1)
+
+
+def test_controller_label():
+    '''Every count is labelled with the controller it came from'''
+    registry = _counted()
+    for name, counter in registry.counters.items():
+        for key in counter:
+            tst.assert_equal(dict(key).get('controller'), 'multiple', name)
+    tst.assert_equal(registry.get('rows_total', controller='multiple'), 15)
+    tst.assert_equal(registry.get('rules_evaluated_total',
+                                  controller='multiple'), 7 * 15)
+
+
+def test_hedges_counted():
+    '''Hedges are counted when making hedged mfs, and when simulating'''
+    registry = metrics.enable()
+    try:
+        parser = FCLParser()
+        parser.fuzzify_block('''
+            FUZZIFY temp
+                RANGE := (0 .. 100) WITH 1
+                TERM hot := Triangle 50 100 100
+            END_FUZZIFY''')
+        parser.defuzzify_block('''
+            DEFUZZIFY fan
+                RANGE := (0 .. 10) WITH 1
+                TERM fast := Triangle 5 10 10
+            END_DEFUZZIFY''')
+        parser.rule_block('''
+            RULEBLOCK
+                RULE 1: IF temp IS very hot THEN fan IS fast;
+                RULE 2: IF temp IS hot THEN fan IS somewhat fast;
+            END_RULEBLOCK''')
+        tst.assert_equal(registry.get('hedge_applications_total',
+                                      stage='parse',
+                                      controller=metrics._NO_CONTROLLER), 1)
+        harness = SimulationHarness()
+        harness.use_parser(parser)
+        input_data = TestData(['temp'], 4)
+        input_data.value[:, 0] = [60, 70, 80, 90]
+        harness.simulate(input_data)
+    finally:
+        metrics.disable()
+    tst.assert_equal(registry.get('hedge_applications_total',
+                                  stage='simulate',
+                                  controller=metrics._NO_CONTROLLER), 4)
+
+
+def test_export():
+    '''The counts can be saved as Prometheus text and as JSON'''
+    registry = _counted()
+    text = registry.prometheus_text()
+    tst.assert_('# TYPE fcl_rules_evaluated_total counter' in text)
+    tst.assert_('\nfcl_rows_total{controller="multiple"} 15\n' in text)
+    tst.assert_('fcl_norm_calls_total{controller="multiple",func="' in text)
+    tst.assert_('\nfcl_rules_skipped_total 0\n' in text)
+    dirname = tempfile.mkdtemp()
+    try:
+        registry.save_prometheus(os.path.join(dirname, 'fcl.prom'))
+        with open(os.path.join(dirname, 'fcl.prom')) as fileh:
+            tst.assert_equal(fileh.read(), text)
+        registry.save_json(os.path.join(dirname, 'fcl.json'))
+        with open(os.path.join(dirname, 'fcl.json')) as fileh:
+            snapshot = json.load(fileh)
+    finally:
+        for filename in os.listdir(dirname):
+            os.remove(os.path.join(dirname, filename))
+        os.rmdir(dirname)
+    tst.assert_equal(snapshot['rules_evaluated_total'],
+                     [{'controller': 'multiple', 'value': 7 * 15}])
+    tst.assert_equal(sum(entry['value'] for entry in
+                         snapshot['norm_calls_total']
+                         if entry['op'] == 'and'), 9 * 15)
+    registry.reset()
+    tst.assert_equal(registry.get('rows_total'), 0)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
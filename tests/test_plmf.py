@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the exact (breakpoint) defuzzification against closed forms
+    and against sampling the universe very finely.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy
+
+import plmf
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples')
+
+_OUTPUT_BLOCK = '''
+    DEFUZZIFY out
+        RANGE := (0 .. 20) WITH 0.001
+        TERM low := Trapezoid 0 0 3 6
+        TERM mid := Triangle 4 8 12
+        TERM bump := Rectangle 9 10
+        TERM high := (10, 0) (14, 0.6) (16, 1) (18, 0.2)
+        TERM up := Ramp 15 19
+    END_DEFUZZIFY
+'''
+
+_ONE_RULE_FCL = '''
+    FUNCTION_BLOCK one_rule
+        VAR_INPUT x : REAL; END_VAR
+        VAR_OUTPUT y : REAL; END_VAR
+        FUZZIFY x
+            RANGE := (0 .. 10)
+            TERM low := Trapezoid 0 0 2 5
+        END_FUZZIFY
+        DEFUZZIFY y
+            RANGE := (0 .. 10)
+            TERM mid := Triangle 2 4 6
+            METHOD : COG;
+        END_DEFUZZIFY
+        RULEBLOCK rules
+            RULE 1 : IF x IS low THEN y IS mid;
+        END_RULEBLOCK
+    END_FUNCTION_BLOCK
+'''
+
+
+def test_closed_forms():
+    '''Some values we can work out by hand'''
+    xs, ys = plmf.restrict(np.array([2., 5, 11]), np.array([0., 1, 0]),
+                           0, 20)
+    tst.assert_allclose(plmf.centroid(xs, ys), (2 + 5 + 11) / 3)
+    xs, ys = plmf.cut(xs, ys, 0.5)
+    tst.assert_allclose([plmf.som(xs, ys), plmf.lom(xs, ys)], [3.5, 8])
+    tst.assert_allclose(plmf.mom(xs, ys), (3.5 + 8) / 2)
+    # Symmetric, so the bisector is in the middle:
+    xs, ys = plmf.restrict(np.array([1., 3, 7, 9]), np.array([0., 1, 1, 0]),
+                           0, 10)
+    tst.assert_allclose(plmf.bisector(xs, ys), 5)
+
+
+def test_exact_same_as_fine_sampling():
+    '''All the methods agree with skfuzzy on a fine universe'''
+    p = FCLParser()
+    out = p.defuzzify_block(_OUTPUT_BLOCK)
+    terms = plmf.pl_terms(out, p.translate_mf)
+    rng = np.random.RandomState(1855)
+    for _ in range(20):
+        cuts = {name: rng.choice([None, rng.uniform(0.05, 1)])
+                for name in terms}
+        if all(level is None for level in cuts.values()):
+            continue
+        output_mf = np.zeros_like(out.universe)
+        for name, level in cuts.items():
+            if level is not None:
+                output_mf = np.fmax(output_mf,
+                                    np.fmin(out[name].mf, level))
+        for method in plmf._PL_DEFUZZ:
+            want = skfuzzy.defuzz(out.universe, output_mf, method)
+            got = plmf.defuzz_cuts(out, terms, cuts, method)
+            tst.assert_allclose(got, want, atol=0.005,
+                                err_msg='{} {}'.format(method, cuts))
+
+
+def test_non_linear_terms_not_exact():
+    '''A consequent with a Gaussian term can't be done exactly'''
+    p = FCLParser()
+    out = p.defuzzify_block('''
+        DEFUZZIFY out
+            RANGE := (0 .. 10)
+            TERM low := Triangle 0 0 5
+            TERM high := Gaussian 10 2
+        END_DEFUZZIFY
+    ''')
+    assert plmf.pl_terms(out, p.translate_mf) is None
+
+
+def test_exact_engine_examples():
+    '''The exact engine is still within the FLD accuracy'''
+    fclfile = os.path.join(_EXAMPLES_DIR, 'jFuzzyLogic', 'qualify.fcl')
+    harness = SimulationHarness(engine='exact')
+    harness.read_fcl_file(fclfile)
+    input_data, output_want, _ = \
+        harness.read_fld_file(harness.make_fld_filename(fclfile))
+    input_data.value = input_data.value[:10]
+    output_want.value = output_want.value[:10]
+    output_got, _ = harness.simulate(input_data)
+    for col, vname in enumerate(output_want.names):
+        universe = harness.consequents[vname].universe
+        atol = harness.percent_accuracy / 100 * np.ptp(universe)
+        tst.assert_allclose(output_got.value[:, col],
+                            output_want.value[:, col], atol=atol)
+
+
+def test_exact_batch_no_rules_fire():
+    '''A row where no rule fires is NaN, and the other rows still work'''
+    parser = FCLParser()
+    parser.function_block(_ONE_RULE_FCL)
+    input_data = TestData(['x'], 3)
+    input_data.value[:, 0] = [1, 2, 8]
+    harness = SimulationHarness(engine='exact')
+    harness.use_parser(parser)
+    for run in (harness.simulate, harness.simulate_batch):
+        output_data, _ = run(input_data)
+        tst.assert_allclose(output_data.value[:, 0], [4, 4, np.nan])
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+    Check that evaluating a membership function at points gives the same
+    values as the universe-based version at the universe's points.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+import scipy.interpolate as interp
+
+import extramf
+import pointmf
+from fcl_parser import FCLParser
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+
+# Some parameters for every registered mf, over the universe below:
+_SAMPLE_PARAMS = {
+    'triangular':        [2, 5, 8],
+    'rightlinear':       [3, 7],
+    'leftlinear':        [3, 7],
+    'pi':                [1, 3, 6, 9],
+    'gaussian':          [5, 1.5],
+    'rightgaussian':     [5, 1.5],
+    'leftgaussian':      [5, 1.5],
+    'trapezoid':         [1, 3, 6, 9],
+    's':                 [2, 8],
+    'z':                 [2, 8],
+    'rectangular':       [3, 7],
+    'singleton':         [4],
+    'pointset':          [(2, 0), (4, 1), (6, 0.5)],
+    'trian':             [2, 5, 8],
+    'trape':             [1, 3, 6, 9],
+    'gauss':             [5, 1.5],
+    'gauss2':            [3, 1, 7, 1],
+    'gbell':             [2, 3, 5],
+    'sigm':              [2, 5],
+    'bell':              [5, 2, 3],
+    'concave':           [3, 7],
+    'cosine':            [5, 4],
+    'gaussianproduct':   [3, 1, 7, 1],
+    'pishape':           [1, 3, 6, 9],
+    'pointlist':         [(2, 0), (4, 1), (6, 0.5)],
+    'ramp':              [3, 7],
+    'rectangle':         [3, 7],
+    'sigmoid':           [5, 2],
+    'sigmoiddifference': [3, 2, 7, 2],
+    'sigmoidproduct':    [3, 2, 7, -2],
+    'spike':             [5, 2],
+    'sshape':            [2, 8],
+    'triangle':          [2, 5, 8],
+    'zshape':            [2, 8],
+}
+
+
+def test_point_mfs_match_universe():
+    '''Every registered mf gives the same values both ways'''
+    p = FCLParser()
+    universe = np.arange(0, 10.05, 0.1)
+    assert set(p.known_point_mfs) == set(p.known_mfs)
+    for name in sorted(p.known_mfs):
+        params = _SAMPLE_PARAMS[name]
+        want = p._make_mf(universe, name, params)
+        point_func, split_params = p.translate_point_mf(name)
+        if split_params:
+            got = point_func(universe, *params)
+        else:
+            if name in ('pointset', 'pointlist'):  # Extend as parser does
+                params = extramf.extend_pointset(
+                    params, universe[0], universe[-1])
+            got = point_func(universe, params)
+        tst.assert_allclose(got, want, atol=1e-9, err_msg=name)
+
+
+def test_point_mfs_any_shape():
+    '''The point versions keep the shape of their input'''
+    p = FCLParser()
+    x = np.linspace(0, 10, 12).reshape(3, 4)
+    for name in ('triangle', 'gbell', 'singleton', 'pointlist'):
+        point_func, split_params = p.translate_point_mf(name)
+        params = _SAMPLE_PARAMS[name]
+        got = point_func(x, *params) if split_params else point_func(x, params)
+        assert got.shape == (3, 4), name
+    point_func, _ = p.translate_point_mf('gauss')
+    assert np.shape(point_func(5.0, 5, 1)) == ()
+
+
+def test_pointset_linear_path():
+    '''The linear point-set agrees with scipy's linear interpolation'''
+    x = np.arange(0, 10.05, 0.05)
+    pointset = [(6, 0.5), (2, 0), (4, 1), (8, 0.2)]  # Unsorted on purpose
+    px, py = extramf.pointset_arrays(
+        extramf.extend_pointset(pointset, x[0], x[-1]))
+    want = interp.interp1d(px, py)(x)
+    tst.assert_allclose(extramf.pointsetmf(x, pointset), want, atol=1e-12)
+
+
+def test_pointset_interpolators_cached():
+    '''The same points give back the same interpolator object'''
+    px, py = extramf.pointset_arrays([(0, 0), (3, 1), (5, 0.4), (9, 0)])
+    for method in ('linear', 'lagrange', 'spline', 'cubic'):
+        first = extramf.pointset_interpolator(px, py, method)
+        again = extramf.pointset_interpolator(px.copy(), py.copy(), method)
+        assert first is again, method
+        x = np.linspace(0, 9, 50)
+        tst.assert_allclose(extramf.pointsetmf(x, list(zip(px, py)), method),
+                            np.clip(first(x), 0, 1))
+    # Outside the points, the point version leads in at 0 and trails off:
+    point_func = pointmf.pointsetmf
+    got = point_func([-1, 10, 4.5], [(0, 0.3), (9, 0.7)], 'cubic')
+    tst.assert_allclose(got[:2], [0, 0.7])
+
+
+def test_parser_fuzzify():
+    '''Fuzzifying crisp values agrees with the term arrays'''
+    p = FCLParser()
+    p.read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    for fvar in p.fuzzy_variables:
+        for term_name, memb in p.fuzzify(fvar.label, fvar.universe).items():
+            tst.assert_allclose(memb, fvar[term_name].mf, atol=1e-9)
+    # Points between the universe values are also fine:
+    got = p.fuzzify('service', [2.5, 7.25])
+    assert list(got) == list(p['service'].terms)
+    assert all(memb.shape == (2,) for memb in got.values())
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+    Check that a single-precision (float32) parser gives the same answers
+    as the default double-precision one, to within the harness accuracy.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, _DEFAULT_PERCENT_ACCURACY
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples')
+
+# Only run the first few rows of each FLD file, to keep this quick:
+_ROWS_PER_FILE = 10
+
+
+def _example_files():
+    '''All the FCL files in the Examples directory (and its subdirs)'''
+    for dirpath, _, files in sorted(os.walk(_EXAMPLES_DIR)):
+        for filename in sorted(files):
+            if filename.endswith('.fcl'):
+                yield os.path.join(dirpath, filename)
+
+
+def test_float32_arrays():
+    '''Universes and term arrays are stored at the requested precision'''
+    infile = os.path.join(_HERE, 'tipper.fcl')
+    p64 = FCLParser().read_fcl_file(infile)
+    p32 = FCLParser(dtype=np.float32).read_fcl_file(infile)
+    for var64, var32 in zip(p64.fuzzy_variables, p32.fuzzy_variables):
+        assert var64.universe.dtype == np.float64
+        assert var32.universe.dtype == np.float32
+        assert var32.universe.nbytes * 2 == var64.universe.nbytes
+        for term64, term32 in zip(var64.terms.values(), var32.terms.values()):
+            assert term32.mf.dtype == np.float32
+            tst.assert_allclose(term32.mf, term64.mf, atol=1e-6)
+
+
+def test_float32_hedges():
+    '''Hedged terms are also stored at the requested precision'''
+    p = FCLParser(dtype=np.float32)
+    p.read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    p.rule('IF service IS slightly excellent THEN tip IS very generous')
+    assert p['service']['_slightly_excellent'].mf.dtype == np.float32
+    assert p['tip']['_very_generous'].mf.dtype == np.float32
+
+
+def test_float32_examples():
+    '''The outputs stay within the usual accuracy on the Examples corpus'''
+    for fclfile in _example_files():
+        h64 = SimulationHarness()
+        h32 = SimulationHarness(dtype=np.float32)
+        h64.read_fcl_file(fclfile)
+        h32.read_fcl_file(fclfile)
+        input_data, _, _ = h64.read_fld_file(h64.make_fld_filename(fclfile))
+        input_data.value = input_data.value[:_ROWS_PER_FILE]
+        want, _ = h64.simulate(input_data)
+        got, _ = h32.simulate(input_data)
+        # Percentage error, but relative to the range for near-zero outputs:
+        rtol = _DEFAULT_PERCENT_ACCURACY / 100.0
+        for col, vname in enumerate(want.names):
+            universe = h64.consequents[vname].universe
+            atol = rtol * (universe.max() - universe.min())
+            ok_rows = [row for row in range(input_data.num_tests)
+                       if row not in want.message]
+            tst.assert_allclose(got.value[ok_rows, col],
+                                want.value[ok_rows, col],
+                                rtol=rtol, atol=atol,
+                                err_msg='{}: {}'.format(fclfile, vname))
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the profiles: that profiling doesn't change the results, that
+    the stages, rule blocks and consequents are all timed, and that
+    profiles can be saved, loaded and merged.
+'''
+
+import os
+import tempfile
+
+import numpy as np
+import numpy.testing as tst
+
+import profiling
+from fcl_pipeline import FCLPipeline
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_MULTIPLE_FCL = os.path.join(_HERE, 'multiple.fcl')
+_PIPELINE_FCL = os.path.join(_HERE, 'pipeline.fcl')
+
+
+def _run(profiled, batch, engine='sampled', num_tests=20):
+    '''Simulate multiple.fcl; return the profile (if any) and results'''
+    harness = SimulationHarness(engine=engine)
+    harness.read_fcl_file(_MULTIPLE_FCL)
+    profile = harness.enable_profiling() if profiled else None
+    np.random.seed(1066)
+    input_data = harness.gen_sample_inputs(num_tests)
+    run = harness.simulate_batch if batch else harness.simulate
+    output_data, rule_data = run(input_data)
+    return profile, output_data, rule_data
+
+
+def test_same_results():
+    '''Profiling doesn't change the outputs or rule activations'''
+    for batch, engine in [(False, 'sampled'), (True, 'batch')]:
+        _, want_out, want_rules = _run(False, batch, engine)
+        _, got_out, got_rules = _run(True, batch, engine)
+        tst.assert_array_equal(got_out.value, want_out.value)
+        tst.assert_array_equal(got_rules.value, want_rules.value)
+
+
+def test_everything_timed():
+    '''Each stage, rule block and consequent is timed'''
+    profile, _, _ = _run(True, False, num_tests=10)
+    stages = profile.records['stages']
+    tst.assert_equal(list(stages), list(profiling._STAGES))
+    tst.assert_equal(stages['load inputs'][2], 10)
+    tst.assert_equal(stages['aggregation'][2], 10 * 7)  # 7 rules
+    tst.assert_equal(sorted(profile.records['rule_blocks']),
+                     [profiling._NO_RULE_BLOCK, 'extra'])
+    tst.assert_equal(profile.records['rule_blocks']['extra'][2], 10)
+    tst.assert_equal(list(profile.records['consequents']), ['y'])
+    for kind in profiling._KINDS:
+        for name, (wall, cpu, calls) in profile.records[kind].items():
+            tst.assert_(wall >= 0 and cpu >= 0, (kind, name))
+    lines = profile.table().splitlines()
+    tst.assert_(lines[0].startswith('stages'))
+    tst.assert_(any(line.startswith('extra ') for line in lines))
+
+
+def test_batch_timed():
+    '''A batch run is profiled as one call of each stage'''
+    profile, _, _ = _run(True, True, engine='batch')
+    stages = profile.records['stages']
+    tst.assert_equal(stages['load inputs'][2], 1)
+    tst.assert_equal(stages['fuzzification'][2], 1)
+    tst.assert_equal(profile.records['consequents']['y'][2], 1)
+
+
+def test_save_load_merge():
+    '''A saved profile loads back the same, and merging adds them up'''
+    first, _, _ = _run(True, False, num_tests=5)
+    second, _, _ = _run(True, True, engine='batch')
+    fileh, filename = tempfile.mkstemp(suffix='.json')
+    os.close(fileh)
+    try:
+        first.save(filename)
+        loaded = profiling.Profile.load(filename)
+    finally:
+        os.remove(filename)
+    tst.assert_equal(loaded.as_dict(), first.as_dict())
+    merged = profiling.Profile().merge(loaded).merge(second)
+    for kind in profiling._KINDS:
+        for name, record in merged.records[kind].items():
+            want = [sum(profile.records[kind].get(name, [0, 0, 0])[i]
+                        for profile in (first, second)) for i in range(3)]
+            tst.assert_allclose(record, want)
+
+
+def test_pipeline_shares_profile():
+    '''All the blocks of a pipeline add to the one profile'''
+    pipeline = FCLPipeline(workers=2, chunk_rows=8)
+    pipeline.read_fcl_file(_PIPELINE_FCL)
+    profile = pipeline.enable_profiling()
+    np.random.seed(1847)
+    input_data = TestData(pipeline.input_names, 20)
+    input_data.value = np.random.rand(20, 3) * [1, 10, 10]
+    pipeline.simulate_batch(input_data)
+    consequents = profile.records['consequents']
+    tst.assert_equal(sorted(consequents), sorted(pipeline.output_names))
+    for name in consequents:  # One call for each block on each chunk
+        tst.assert_equal(consequents[name][2], 3)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the result cache: rounding the inputs, evicting old results,
+    and its use by the harness.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+from resultcache import ResultCache
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+
+def test_quantise():
+    '''One step for all inputs, or a step for each'''
+    values = [[1.234, 5.678], [1.236, 5.674]]
+    cache = ResultCache(precision=0.01)
+    tst.assert_allclose(cache.quantise(['a', 'b'], values),
+                        [[1.23, 5.68], [1.24, 5.67]])
+    cache = ResultCache(precision={'b': 0.5})
+    tst.assert_allclose(cache.quantise(['a', 'b'], values),
+                        [[1.234, 5.5], [1.236, 5.5]])
+
+
+def test_lru():
+    '''Drop the least recently used result'''
+    cache = ResultCache(maxsize=2, policy='lru')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # Drops b
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.as_dict()['evictions'] == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lfu():
+    '''Drop the least frequently used (and then least recently used)'''
+    cache = ResultCache(maxsize=3, policy='lfu')
+    for key in 'abc':
+        cache.put(key, key)
+    for key in 'aacb':
+        cache.get(key)
+    cache.put('d', 'd')  # b and c used once each, so drop c
+    assert cache.get('c') is None
+    cache.put('e', 'e')  # d not used, so drop it
+    assert sorted(cache._results) == ['a', 'b', 'e']
+    cache.clear()
+    assert len(cache) == 0 and cache.get('a') is None
+
+
+def test_harness():
+    '''Same results as simulating the rounded inputs, and fewer runs'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_TIPPER_FILE)
+    np.random.seed(1847)
+    input_data = harness.gen_sample_inputs(20)
+    input_data.value = np.tile(input_data.value, (3, 1))  # Repeat each row
+    cache = harness.make_result_cache(maxsize=100, precision=0.1)
+    for run in [harness.simulate, harness.simulate_batch]:
+        got_out, got_rules = run(input_data)
+        want_data = TestData(input_data.names, input_data.num_tests)
+        want_data.value = np.round(input_data.value / 0.1) * 0.1
+        harness.result_cache = None
+        want_out, want_rules = run(want_data)
+        harness.result_cache = cache
+        tst.assert_allclose(got_out.value, want_out.value)
+        tst.assert_allclose(got_rules.value, want_rules.value)
+    # First run: 20 misses then 40 hits; second run: all hits
+    assert (cache.misses, cache.hits) == (20, 100)
+    assert len(cache) == 20
+    harness.read_fcl_file(_TIPPER_FILE)  # A new controller clears the cache
+    assert harness.result_cache is cache and len(cache) == 0
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the rule index: the intervals, the live rules, and that using
+    it gives exactly the same results as evaluating all the rules.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import ruleindex
+from fcl_parser import FCLParser
+from simulate import SimulationHarness
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples', 'jFuzzyLogic')
+
+_TIPPER_FCL = '''
+FUNCTION_BLOCK tipper
+VAR_INPUT service: REAL; food: REAL; END_VAR
+VAR_OUTPUT tip: REAL; END_VAR
+FUZZIFY service
+  RANGE := (0.000 .. 10.000);
+  TERM poor := Trapezoid 0 0 2 4;
+  TERM good := Triangle 3 5 7;
+  TERM excellent := Trapezoid 6 8 10 10;
+END_FUZZIFY
+FUZZIFY food
+  RANGE := (0.000 .. 10.000);
+  TERM rancid := Trapezoid 0 0 1 3;
+  TERM delicious := Trapezoid 7 9 10 10;
+END_FUZZIFY
+DEFUZZIFY tip
+  RANGE := (0.000 .. 30.000);
+  TERM cheap := Triangle 0 5 10;
+  TERM average := Triangle 10 15 20;
+  TERM generous := Triangle 20 25 30;
+  METHOD : COG;
+  ACCU : MAX;
+END_DEFUZZIFY
+RULEBLOCK
+  AND : MIN;
+  OR : MAX;
+  RULE 1 : if service is poor and food is rancid then tip is cheap;
+  RULE 2 : if service is good then tip is average;
+  RULE 3 : if service is excellent or food is delicious then tip is generous;
+  RULE 4 : if service is good and not food is rancid then tip is average;
+END_RULEBLOCK
+END_FUNCTION_BLOCK
+'''
+
+
+def _index():
+    parser = FCLParser()
+    parser.function_block(_TIPPER_FCL)
+    harness = SimulationHarness(indexed=True)
+    harness.use_parser(parser)
+    return harness.rule_index
+
+
+def test_intervals():
+    '''Each input's universe is cut at the ends of its terms' supports'''
+    index = _index()
+    tst.assert_allclose(index.starts['service'], [0, 3, 4, 6, 7])
+    tst.assert_allclose(index.starts['food'], [0, 3, 7])
+    live = index.live_mask({'service': [1, 3, 4, 6.5, 10],
+                            'food': [2, 5, 5, 8, 10]})
+    # Rule 3 ORs two inputs, so can't be ruled out by either alone:
+    tst.assert_equal(live, [[True, False, True, False],
+                            [False, True, True, True],
+                            [False, True, True, True],
+                            [False, True, True, True],
+                            [False, False, True, False]])
+    assert index.live_rules({'service': 5, 'food': 9}) == {'2', '3', '4'}
+
+
+def test_not_skipped():
+    '''Rules are always live if we can't be sure they don't fire'''
+    index = _index()
+    assert index.tables['food'][:, 3].all()  # NOT rancid
+    assert not ruleindex._and_keeps_zero(lambda a, b: np.fmax(a, b))
+    assert not ruleindex._adds_zero(lambda a, b: a + b + 0.1)
+    live = index.live_mask({'service': np.nan, 'food': 5})
+    assert live.all()
+
+
+def test_same_results():
+    '''Exactly the same outputs and activations, with fewer rules run'''
+    for name in ['robot', 'qurat']:
+        fclfile = os.path.join(_EXAMPLES_DIR, name + '.fcl')
+        for engine in ['sampled', 'batch']:
+            for run in ['simulate', 'simulate_batch']:
+                want_harness, harness = [SimulationHarness(engine=engine,
+                                                           indexed=indexed)
+                                         for indexed in (False, True)]
+                want_harness.read_fcl_file(fclfile)
+                harness.read_fcl_file(fclfile)
+                input_data, _, _ = harness.read_fld_file(
+                    harness.make_fld_filename(fclfile))
+                input_data.value = input_data.value[:20]
+                want = getattr(want_harness, run)(input_data)
+                got = getattr(harness, run)(input_data)
+                for want_data, got_data in zip(want, got):
+                    tst.assert_array_equal(got_data.value, want_data.value)
+                    assert got_data.message == want_data.message
+        live = harness.rule_index.live_mask(
+            dict(zip(input_data.names, input_data.value.T)))
+        assert live.mean() < 0.3
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+'''
+    Check finding (and removing) the dead, duplicate and subsumed rules.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import ruleprune
+from fcl_parser import FCLParser
+from simulate import SimulationHarness
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples', 'jFuzzyLogic')
+
+# The tipper's variables, with the rules to be checked added at the end:
+_TIPPER_FCL = '''
+FUNCTION_BLOCK tipper
+VAR_INPUT service: REAL; food: REAL; END_VAR
+VAR_OUTPUT tip: REAL; END_VAR
+FUZZIFY service
+  RANGE := (0.000 .. 10.000);
+  TERM poor := Trapezoid 0 0 2 4;
+  TERM good := Triangle 3 5 7;
+  TERM excellent := Trapezoid 6 8 10 10;
+END_FUZZIFY
+FUZZIFY food
+  RANGE := (0.000 .. 10.000);
+  TERM rancid := Trapezoid 0 0 1 3;
+  TERM delicious := Trapezoid 7 9 10 10;
+END_FUZZIFY
+DEFUZZIFY tip
+  RANGE := (0.000 .. 30.000);
+  TERM cheap := Triangle 0 5 10;
+  TERM average := Triangle 10 15 20;
+  TERM generous := Triangle 20 25 30;
+  METHOD : COG;
+  ACCU : {accu};
+END_DEFUZZIFY
+RULEBLOCK
+  AND : MIN;
+  OR : MAX;
+  RULE 1 : if service is poor or food is rancid then tip is cheap;
+  RULE 2 : if service is good then tip is average;
+  RULE 3 : if service is excellent or food is delicious then tip is generous;
+  {rules}
+END_RULEBLOCK
+END_FUNCTION_BLOCK
+'''
+
+
+def _parser(rules, accu='MAX'):
+    parser = FCLParser()
+    parser.function_block(_TIPPER_FCL.replace('{accu}', accu)
+                          .replace('{rules}', rules))
+    return parser
+
+
+def test_dead_rules():
+    '''Rules that can never fire, even using the segments of one input'''
+    parser = _parser('''
+        RULE 4 : if food is rancid and food is delicious then tip is cheap;
+        RULE 5 : if service is poor and not service is poor
+                 then tip is average;
+        RULE 6 : if food is rancid and service is good then tip is cheap;
+    ''')
+    assert ruleprune.max_firing(parser.all_rules['4']) == 0
+    assert 0 < ruleprune.max_firing(parser.all_rules['5']) <= 0.5
+    report = ruleprune.check_rules(parser)
+    assert list(report.dead) == ['4']
+    assert report.removable == ['4', '6']  # 6 is subsumed by 1
+
+
+def test_duplicate_and_subsumed():
+    '''Same rules (up to order) and weaker rules, with the same consequents'''
+    parser = _parser('''
+        RULE 4 : if food is rancid or service is poor then tip is cheap;
+        RULE 5 : if service is good and food is delicious
+                 then tip is average;
+        RULE 6 : if service is excellent then tip is generous WITH 0.5;
+        RULE 7 : if service is excellent then tip is average;
+    ''')
+    report = ruleprune.check_rules(parser)
+    assert report.duplicate == {'4': '1'}
+    assert report.subsumed == {'5': '2', '6': '3'}
+    assert not report.kept and not report.dead
+    ruleprune.prune_rules(parser, report)
+    assert [rule.label for rule in parser.rules] == ['1', '2', '3', '7']
+
+
+def test_not_removed():
+    '''Keep rules needed by the simulation, or when not using max'''
+    parser = _parser('''
+        RULE 4 : if service is good and food is delicious
+                 then tip is average;
+    ''', accu='BSUM')
+    assert not ruleprune.check_rules(parser).removable
+    parser = _parser('''
+        RULE 4 : if food is rancid and food is delicious then tip is cheap;
+    ''')
+    parser.remove_rule('1')
+    parser.remove_rule('3')  # So rule 4 is the only one using food
+    report = ruleprune.check_rules(parser)
+    assert list(report.dead) == ['4'] and not report.removable
+    assert 'food' in report.kept['4']
+
+
+def test_prune_harness():
+    '''Pruning doesn't change the outputs, and a replay flags unfired rules'''
+    fclfile = os.path.join(_EXAMPLES_DIR, 'qurat.fcl')
+    harness = SimulationHarness()
+    harness.read_fcl_file(fclfile)
+    input_data, _, _ = harness.read_fld_file(
+        harness.make_fld_filename(fclfile))
+    input_data.value = input_data.value[:20]
+    want, _ = harness.simulate(input_data)
+    report = ruleprune.prune_harness(harness)
+    assert len(report.removable) == 8
+    assert len(harness.all_rules) == report.num_rules - 8
+    got, _ = harness.simulate(input_data)
+    tst.assert_allclose(got.value, want.value)
+    harness = SimulationHarness()
+    harness.read_fcl_file(os.path.join(_EXAMPLES_DIR, 'qualify.fcl'))
+    report = ruleprune.prune_harness(
+        harness, os.path.join(_EXAMPLES_DIR, 'qualify.fld'))
+    assert report.unfired == ['No1.1', 'No1.10']
+    assert not report.removable
+    assert np.all([label in harness.all_rules for label in report.unfired])
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
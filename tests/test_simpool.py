@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the pool of simulators: reuse, reset, and use from many threads.
+'''
+
+from __future__ import division
+import os
+import threading
+from queue import Empty
+
+import numpy as np
+import numpy.testing as tst
+
+from simpool import SimulatorPool
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_TIPPER_FILE = os.path.join(_HERE, 'tipper.fcl')
+
+
+def _harness():
+    harness = SimulationHarness()
+    harness.read_fcl_file(_TIPPER_FILE)
+    return harness
+
+
+def _inputs(num_rows, seed=1690):
+    input_data = TestData(['food', 'service'], num_rows)
+    input_data.value = np.random.RandomState(seed).uniform(0, 10,
+                                                           (num_rows, 2))
+    return input_data
+
+
+def test_checkout_and_return():
+    '''Simulators are reused, and are cleared when returned'''
+    pool = SimulatorPool(_harness().control_system, size=2)
+    assert pool.available == 2
+    with pool.simulator() as sim:
+        assert pool.available == 1
+        sim.input['food'] = np.array([2.0, 8.0])  # Array inputs
+        sim.input['service'] = np.array([3.0, 9.0])
+        sim.compute()
+        assert sim.output['tip'].shape == (2,)
+    assert pool.available == 2
+    again = pool.checkout()
+    assert again is sim and not sim._array_inputs and not sim.output
+    other = pool.checkout()
+    tst.assert_raises(Empty, pool.checkout, 0.01)
+    pool.checkin(other)
+    pool.checkin(again)
+
+
+def test_own_control_system():
+    '''Each simulator has its own copy, sharing the arrays'''
+    harness = _harness()
+    pool = SimulatorPool(harness.control_system, size=2)
+    first, second = pool.checkout(), pool.checkout()
+    assert first.ctrl is not second.ctrl
+    tip1 = next(iter(first.ctrl.consequents))
+    tip2 = next(iter(second.ctrl.consequents))
+    assert tip1 is not tip2 and tip1.universe is tip2.universe
+
+
+def test_threads_same_as_serial():
+    '''Several threads using one harness's pool get the right answers'''
+    input_data = _inputs(40)
+    want, _ = _harness().simulate_batch(input_data)
+    harness = _harness()
+    harness.make_simulator_pool(4)
+    results = [None] * 8
+
+    def work(i):
+        part = TestData(input_data.names, 5)
+        part.value = input_data.value[5*i:5*i+5]
+        simulate = harness.simulate_batch if i % 2 else harness.simulate
+        results[i] = simulate(part)[0].value
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tst.assert_allclose(np.vstack(results), want.value)
+    assert harness.pool.available == 4
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
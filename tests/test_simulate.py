@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+    Check how the harness reports test cases where some outputs are not
+    set, whether the rows are run one at a time or as a batch, and that
+    each thread gets its own timings.
+'''
+
+import threading
+
+import numpy as np
+import numpy.testing as tst
+
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+# Two outputs; no rules fire for x > 5, and only "a" is set for 4 < x < 5:
+_TWO_OUTPUTS = '''
+FUNCTION_BLOCK two_outputs
+FUZZIFY x
+    RANGE := (0 .. 10) WITH 0.1
+    TERM low := Triangle 0 0 5
+    TERM mid := Triangle 0 2 4
+END_FUZZIFY
+DEFUZZIFY a
+    RANGE := (0 .. 10) WITH 0.1
+    TERM on := Triangle 0 5 10
+    METHOD : COG;
+END_DEFUZZIFY
+DEFUZZIFY b
+    RANGE := (0 .. 10) WITH 0.1
+    TERM on := Triangle 0 5 10
+    METHOD : COG;
+END_DEFUZZIFY
+RULEBLOCK
+    RULE 1: IF x IS low THEN a IS on;
+    RULE 2: IF x IS mid THEN b IS on;
+END_RULEBLOCK
+END_FUNCTION_BLOCK
+'''
+
+
+def _harness(engine):
+    parser = FCLParser()
+    parser.function_block(_TWO_OUTPUTS)
+    harness = SimulationHarness(engine=engine)
+    harness.use_parser(parser)
+    return harness
+
+
+def _inputs():
+    input_data = TestData(['x'], 3)
+    input_data.value[:, 0] = [2, 4.5, 7]
+    return input_data
+
+
+def test_missing_outputs():
+    '''All the missing outputs are NaN, and named in one message'''
+    for engine in ('sampled', 'batch'):
+        for batch in (False, True):
+            harness = _harness(engine)
+            run = harness.simulate_batch if batch else harness.simulate
+            output_data, rule_data = run(_inputs())
+            tst.assert_(np.all(np.isfinite(output_data.value[0])))
+            tst.assert_(np.isfinite(output_data.value[1, 0]))
+            tst.assert_(np.isnan(output_data.value[1, 1]))
+            tst.assert_(np.all(np.isnan(output_data.value[2])))
+            tst.assert_equal(sorted(output_data.message), [1, 2])
+            tst.assert_equal(output_data.message[1],
+                             '\t- no output for "b" (no rules fired)')
+            tst.assert_equal(output_data.message[2],
+                             '\t- no output for "a", "b" (no rules fired)')
+            # No rules are collected for the failed rows:
+            tst.assert_(np.all(rule_data.value[0] > 0))
+            tst.assert_(np.all(rule_data.value[1:] == 0))
+
+
+def test_timings_per_thread():
+    '''A run in another thread doesn't change this thread's timings'''
+    harness = _harness('batch')
+    harness.make_simulator_pool(2)
+    harness.simulate(_inputs())
+    mine = dict(harness.timings)
+    theirs = {}
+
+    def run():
+        harness.simulate_batch(_inputs())
+        theirs.update(harness.timings)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    tst.assert_equal(dict(harness.timings), mine)
+    tst.assert_(theirs['activation'] > 0)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+'''
+    Check that the sparse (support-only) terms give the same answers
+    as the usual full-universe arrays.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy.control as ctrl
+
+import extramf
+import memreport
+import sparsemf
+from fcl_parser import FCLParser
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+
+_ONE_RULE_FCL = '''
+    FUNCTION_BLOCK one_rule
+        VAR_INPUT x : REAL; END_VAR
+        VAR_OUTPUT y : REAL; END_VAR
+        FUZZIFY x
+            RANGE := (0 .. 10)
+            TERM low := Trapezoid 0 0 2 5
+        END_FUZZIFY
+        DEFUZZIFY y
+            RANGE := (0 .. 10)
+            TERM mid := Triangle 2 4 6
+            METHOD : {};
+        END_DEFUZZIFY
+        RULEBLOCK rules
+            RULE 1 : IF x IS low THEN y IS mid;
+        END_RULEBLOCK
+    END_FUNCTION_BLOCK
+'''
+
+
+def test_sparse_same_as_dense():
+    '''Trimming to the support doesn't lose anything'''
+    p = FCLParser()
+    universe = np.arange(0, 100, 0.1)
+    for fname, params in [('triangle', [20, 25, 30]),
+                          ('trapezoid', [0, 0, 5, 10]),
+                          ('rectangle', [40, 42]),
+                          ('gaussian', [50, 3]),
+                          ('singleton', [33.33]),
+                          ('pointlist', [(60, 0), (61, 1), (62, 0)])]:
+        want = p._make_mf(universe, fname, params)
+        mf_func, split_params = p.translate_mf(fname)
+        sparse = sparsemf.sparse_mf(universe, mf_func, params, split_params)
+        tst.assert_allclose(sparse.to_dense(), want, err_msg=fname)
+        if fname != 'gaussian':  # Which is never quite zero
+            assert len(sparse.values) < len(universe) // 2, fname
+
+
+def test_singleton_nearest_point():
+    '''The sparse singleton picks the same point as extramf does'''
+    universe = np.arange(0, 10, 0.5)
+    for xpt in [-1, 0, 0.25, 0.3, 4.74, 4.75, 9.5, 12]:
+        sparse = sparsemf.singleton(universe, xpt)
+        tst.assert_array_equal(sparse.to_dense(),
+                               extramf.singletonmf(universe, xpt))
+        assert len(sparse.values) <= 3
+
+
+def test_accumulate():
+    '''Accumulating the slices gives the same as the full arrays'''
+    universe = np.arange(0, 100, 1.0)
+    mfs = [extramf.rectanglemf(universe, 10, 20) * 0.4,
+           extramf.rectanglemf(universe, 15, 30) * 0.7,
+           extramf.rectanglemf(universe, 80, 90)]
+    sparse = [sparsemf.SparseMF.from_dense(mf) for mf in mfs]
+    for or_func in (np.fmax, lambda a, b: np.fmin(1, a + b)):
+        want = or_func(or_func(mfs[0], mfs[1]), mfs[2])
+        got = sparsemf.accumulate(sparse, or_func).to_dense()
+        tst.assert_allclose(got, want)
+
+
+def test_defuzz_simulation():
+    '''Defuzzifying from the slices matches skfuzzy, for every method'''
+    p = FCLParser()
+    p.read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    tip = p['tip']
+    sparse = sparsemf.sparse_terms(tip, p.translate_mf)
+    for method in ('centroid', 'bisector', 'mom', 'som', 'lom'):
+        tip.defuzzify_method = method
+        sim = ctrl.ControlSystemSimulation(ctrl.ControlSystem(p.rules))
+        for service, food in [(2, 3), (5.5, 9), (9.8, 7.1)]:
+            sim.input['service'] = service
+            sim.input['food'] = food
+            sim.compute()
+            got = sparsemf.defuzz_simulation(sim, tip, sparse)
+            tst.assert_allclose(got, sim.output['tip'], err_msg=method)
+
+
+def test_sparse_parser():
+    '''A sparse parser keeps the output terms (only) as their supports'''
+    p = FCLParser(sparse=True).read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    dense = FCLParser().read_fcl_file(os.path.join(_HERE, 'tipper.fcl'))
+    for term in p['tip'].terms.values():
+        assert isinstance(term, sparsemf.SparseTerm), term.label
+        tst.assert_allclose(term.mf, dense['tip'][term.label].mf)
+    for term in p['service'].terms.values():
+        assert not isinstance(term, sparsemf.SparseTerm), term.label
+    tst.assert_(memreport.memory_report(p).totals['terms'] <
+                memreport.memory_report(dense).totals['terms'])
+
+
+def test_sparse_engine():
+    '''The sparse engine gives the same outputs as sampling'''
+    for fclfile in ('tipper.fcl', 'multiple.fcl'):
+        fclfile = os.path.join(_HERE, fclfile)
+        results = []
+        for engine in ('sampled', 'sparse'):
+            harness = SimulationHarness(engine=engine)
+            harness.read_fcl_file(fclfile)
+            np.random.seed(31)
+            input_data = harness.gen_sample_inputs(20)
+            for run in (harness.simulate, harness.simulate_batch):
+                output_data, _ = run(input_data)
+                results.append(output_data.value)
+        for got in results[1:]:
+            tst.assert_allclose(got, results[0], err_msg=fclfile)
+
+
+def test_no_rules_fire():
+    '''Where no rule fires, the engines all give NaN, for every method'''
+    input_data = TestData(['x'], 3)
+    input_data.value[:, 0] = [1, 3, 8]  # Nothing fires for 8
+    for method in ('COG', 'COA', 'MOM', 'LM', 'RM'):
+        parser = FCLParser()
+        parser.function_block(_ONE_RULE_FCL.format(method))
+        results = []
+        for engine in ('exact', 'batch', 'sparse'):
+            harness = SimulationHarness(engine=engine)
+            harness.use_parser(parser)
+            for run in (harness.simulate, harness.simulate_batch):
+                output_data, _ = run(input_data)
+                results.append(output_data.value[:, 0])
+        for got in results:
+            assert np.isnan(got[2]), method
+            tst.assert_allclose(got[:2], results[0][:2], atol=0.01,
+                                err_msg=method)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
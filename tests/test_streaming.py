@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the streaming simulator gives the same results as simulating
+    each step from scratch, while re-firing fewer rules.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+from simulate import SimulationHarness, TestData
+from streaming import StreamingSimulator, simulate_stream
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_EXAMPLES_DIR = os.path.join(_HERE, '..', 'Examples')
+
+
+def _harness(fclfile, engine='sampled'):
+    harness = SimulationHarness(engine=engine)
+    harness.read_fcl_file(fclfile)
+    return harness
+
+
+def _random_walk(harness, num_steps):
+    '''Inputs where just one changes at each step'''
+    input_data = harness.gen_sample_inputs(num_steps)
+    for row in range(1, num_steps):
+        keep = np.arange(input_data.value.shape[1]) != row % 2
+        input_data.value[row, keep] = input_data.value[row - 1, keep]
+    return input_data
+
+
+def _check_stream(fclfile, engine='sampled', num_steps=12):
+    '''Streaming gives the same as a fresh simulation for each step'''
+    harness = _harness(fclfile, engine)
+    np.random.seed(1847)
+    input_data = _random_walk(harness, num_steps)
+    got_out, got_rules, num_fired = simulate_stream(harness, input_data)
+    for row in range(num_steps):
+        step_data = TestData(input_data.names, 1)
+        step_data.value = input_data.value[row:row+1]
+        want_out, want_rules = _harness(fclfile, engine).simulate(step_data)
+        tst.assert_array_equal(got_out.value[row], want_out.value[0])
+        tst.assert_array_equal(got_rules.value[row], want_rules.value[0])
+        assert (row in got_out.message) == (0 in want_out.message)
+    return num_fired
+
+
+def test_examples():
+    '''Mamdani, chained rules, and the batch engine'''
+    mamdani = os.path.join(_EXAMPLES_DIR, 'jFuzzyLogic', 'qurat.fcl')
+    num_fired = _check_stream(mamdani)
+    assert num_fired[0] == 17 and num_fired[1:].mean() < 17
+    _check_stream(mamdani, engine='batch')
+    _check_stream(os.path.join(_EXAMPLES_DIR, 'fuzzylite-mamdani',
+                               'SimpleDimmerChained.fcl'))
+
+
+def test_tsk():
+    '''TSK outputs use the inputs directly, so are always re-done'''
+    _check_stream(os.path.join(_HERE, 'sugeno.fcl'))
+
+
+def test_step():
+    '''Only the rules using the changed inputs are re-fired'''
+    harness = _harness(os.path.join(_HERE, 'tipper.fcl'))
+    simulator = StreamingSimulator(harness.control_system)
+    first = simulator.step({'service': 3, 'food': 8})
+    assert simulator.last_fired == ['1', '2', '3']
+    assert simulator.step({}) == first and simulator.last_fired == []
+    simulator.step({'service': 3})  # Unchanged, so nothing to do
+    assert simulator.last_fired == []
+    simulator.step({'food': 2})
+    assert simulator.last_fired == ['1', '3']  # Rule 2 doesn't use food
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
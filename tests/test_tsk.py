@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the Takagi-Sugeno-Kang (TSK) output terms: functions of the inputs.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy.membership as skmemb
+
+from fcl_parser import FCLParser, ParsingError
+from simulate import SimulationHarness, TestData
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_SUGENO_FILE = os.path.join(_HERE, 'sugeno.fcl')
+_SHARED_FILE = os.path.join(_HERE, 'sugeno_shared.fcl')
+
+
+def _two_input_parser():
+    '''A parser with inputs x and y already defined'''
+    p = FCLParser()
+    for varname in ('x', 'y'):
+        p.fuzzify_block('''
+            FUZZIFY {}
+                RANGE := (0 .. 10)
+                TERM low := Triangle 0 0 10
+            END_FUZZIFY
+        '''.format(varname))
+    return p
+
+
+def test_parse_functions():
+    '''The different ways of writing linear functions'''
+    p = _two_input_parser()
+    z = p.defuzzify_block('''
+        DEFUZZIFY z
+            RANGE := (0 .. 100)
+            TERM a := 2*x + 3*y + 1;
+            TERM b := x*0.5 - y -2;
+            TERM c := Linear 1 2 3;
+            TERM d := -x;
+            TERM e := 7;
+        END_DEFUZZIFY
+    ''')
+    inputs = {'x': 2.0, 'y': 5.0}
+    tst.assert_allclose([z[name].function(inputs) for name in 'abcd'],
+                        [20, -6, 15, -2])
+    assert z['e'].mf_def == ('singleton', [7])  # Still a singleton
+    assert z.weighted_method == 'wtaver'
+
+
+def test_function_errors():
+    '''Functions only in outputs, of inputs, with a weighted method'''
+    bad_blocks = [
+        'FUZZIFY w RANGE := (0 .. 1) TERM t := 2*x END_FUZZIFY',
+        'DEFUZZIFY z RANGE := (0 .. 1) TERM t := 2*q END_DEFUZZIFY',
+        'DEFUZZIFY z RANGE := (0 .. 1) TERM t := Linear 1 2 END_DEFUZZIFY',
+        'DEFUZZIFY z RANGE := (0 .. 1) TERM t := x METHOD : COG '
+        'END_DEFUZZIFY',
+    ]
+    for block in bad_blocks:
+        p = _two_input_parser()
+        tst.assert_raises(ParsingError, p.function_block,
+                          'FUNCTION_BLOCK ' + block + ' END_FUNCTION_BLOCK')
+
+
+def test_misspelled_mf():
+    '''An unknown mf name is not taken to be a linear function'''
+    p = _two_input_parser()
+    with tst.assert_raises(ParsingError) as context:
+        p.defuzzify_block('DEFUZZIFY z RANGE := (0 .. 1) '
+                          'TERM a := trinagle; END_DEFUZZIFY')
+    tst.assert_('"trinagle"' in str(context.exception))
+    z = p.defuzzify_block('DEFUZZIFY z RANGE := (0 .. 1) '
+                          'TERM a := x; TERM b := y + 1; END_DEFUZZIFY')
+    tst.assert_allclose([z[name].function({'x': 3, 'y': 5}) for name in 'ab'],
+                        [3, 6])
+
+
+def test_sugeno_output():
+    '''The output is the weighted average of the function values'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_SUGENO_FILE)
+    input_data = TestData(['x', 'y'], 20)
+    input_data.value = np.random.RandomState(1985).uniform(0, 10, (20, 2))
+    output_data, _ = harness.simulate(input_data)
+    x, y = input_data.value[:, 0], input_data.value[:, 1]
+    x_low = skmemb.trapmf(x, [0, 0, 2, 8])
+    x_high = skmemb.trapmf(x, [2, 8, 10, 10])
+    y_low, y_high = 1 - y / 10, y / 10
+    weights = np.stack([np.fmin(x_low, y_low), x_high,
+                        np.fmin(y_high, x_low)], axis=1)
+    positions = np.stack([np.full_like(x, 5), 2*x + 3*y + 1, 10 - x - y],
+                         axis=1)
+    want = (weights * positions).sum(axis=1) / weights.sum(axis=1)
+    tst.assert_allclose(output_data.value[:, 0], want)
+
+
+def test_batch_same_as_rows():
+    '''Simulating all rows at once gives the same outputs and rules'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_SUGENO_FILE)
+    input_data = TestData(['x', 'y'], 50)
+    input_data.value = np.random.RandomState(2018).uniform(0, 10, (50, 2))
+    rows_out, rows_rules = harness.simulate(input_data)
+    batch_out, batch_rules = harness.simulate_batch(input_data)
+    tst.assert_allclose(batch_out.value, rows_out.value)
+    tst.assert_allclose(batch_rules.value, rows_rules.value)
+
+
+def test_shared_term():
+    '''Each rule counts in full, even when rules share a term'''
+    harness = SimulationHarness()
+    harness.read_fcl_file(_SHARED_FILE)
+    input_data = TestData(['x', 'y'], 20)
+    input_data.value = np.random.RandomState(1973).uniform(0, 10, (20, 2))
+    x, y = input_data.value[:, 0], input_data.value[:, 1]
+    weights = np.stack([1 - x / 10, 0.5 * (1 - y / 10), x / 10], axis=1)
+    positions = np.stack([2*x + y + 1, 2*x + y + 1, np.full_like(x, 5)],
+                         axis=1)
+    want = (weights * positions).sum(axis=1) / weights.sum(axis=1)
+    for run in (harness.simulate, harness.simulate_batch):
+        output_data, _ = run(input_data)
+        tst.assert_allclose(output_data.value[:, 0], want)
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
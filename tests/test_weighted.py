@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+    Check the weighted-average and weighted-sum (COGS/COGSS)
+    defuzzification, including the singleton fast path.
+'''
+
+from __future__ import division
+import os
+
+import numpy as np
+import numpy.testing as tst
+
+import skfuzzy.control as ctrl
+
+import weighted
+from fcl_parser import FCLParser
+from fcl_simulation import FCLSimulation
+from simulate import SimulationHarness
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+_QOS_DIR = os.path.join(_HERE, '..', 'Examples', 'jFuzzyLogic', 'QoS')
+
+
+def test_weighted_sums():
+    '''Weights can be one set, or a batch of them'''
+    positions = np.array([0, 2.5, 5])
+    weights = np.array([[0.2, 0.0, 0.6], [1, 1, 1]])
+    tst.assert_allclose(weighted.weighted_sum(weights, positions), [3, 7.5])
+    tst.assert_allclose(weighted.weighted_average(weights, positions),
+                        [3.75, 2.5])
+    tst.assert_allclose(weighted.weighted_average(weights[0], positions),
+                        3.75)
+
+
+def test_cogs_names():
+    '''The FCL method names map to our weighted methods'''
+    p = FCLParser()
+    assert p.translate_defuzz('COGS') == 'wtaver'
+    assert p.translate_defuzz('cogss') == 'wtsum'
+    assert p.translate_defuzz('WeightedAverage') == 'wtaver'
+
+
+def test_singleton_positions():
+    '''Singleton positions come straight from the definitions'''
+    p = FCLParser()
+    out = p.defuzzify_block('''
+        DEFUZZIFY out
+            RANGE := (0 .. 10) WITH 0.3
+            TERM low := 1.1
+            TERM high := 8.25
+            TERM mid := Triangle 4 5 6
+            METHOD : COGS
+        END_DEFUZZIFY
+    ''')
+    positions = weighted.term_positions(out, p.translate_mf)
+    tst.assert_allclose(positions[:2], [1.1, 8.25])  # Not on the universe
+    tst.assert_allclose(positions[2], 5, atol=0.01)
+
+
+def test_singleton_examples():
+    '''The jFuzzyLogic singleton outputs are matched (very) closely'''
+    fclfile = os.path.join(_QOS_DIR, 'SingletonQoSFewRules.fcl')
+    harness = SimulationHarness()
+    harness.read_fcl_file(fclfile)
+    input_data, output_want, _ = \
+        harness.read_fld_file(harness.make_fld_filename(fclfile))
+    output_got, _ = harness.simulate(input_data)
+    tst.assert_allclose(output_got.value, output_want.value,
+                        rtol=1e-6, atol=1e-12)
+
+
+def test_plain_skfuzzy():
+    '''A COGS output still works with a plain skfuzzy simulation'''
+    fclfile = os.path.join(_QOS_DIR, 'SingletonQoSFewRules.fcl')
+    p = FCLParser().read_fcl_file(fclfile)
+    out = p['service_quality']
+    assert out.weighted_method == 'wtaver'
+    assert out.defuzzify_method == 'centroid'
+    sim = ctrl.ControlSystemSimulation(ctrl.ControlSystem(p.rules))
+    sim.inputs({'clarity': 0.5, 'commitment': 0.2, 'influence': 4})
+    sim.compute()
+    tst.assert_(np.isfinite(sim.output['service_quality']))
+
+
+def test_batch_same_as_rows():
+    '''Array inputs give the same as simulating one row at a time'''
+    fclfile = os.path.join(_QOS_DIR, 'SingletonQoSFewRules.fcl')
+    p = FCLParser().read_fcl_file(fclfile)
+    system = ctrl.ControlSystem(p.rules)
+    inputs = {'clarity': [-1, 0.5, 2], 'commitment': [3, 0.2, 1.5],
+              'influence': [0, 4, 2.5]}
+    batch_sim = FCLSimulation(system, names=p)
+    batch_sim.inputs({k: np.array(v) for k, v in inputs.items()})
+    batch_sim.compute()
+    for row in range(3):
+        sim = FCLSimulation(system, names=p)
+        sim.inputs({k: v[row] for k, v in inputs.items()})
+        sim.compute()
+        tst.assert_allclose(batch_sim.output['service_quality'][row],
+                            sim.output['service_quality'])
+
+
+if __name__ == '__main__':
+    tst.run_module_suite()
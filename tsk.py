@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    Takagi-Sugeno-Kang (TSK) consequents, where an output term is a linear
+    function of the input variables rather than a fuzzy set, e.g.
+        TERM t := 2*x + 3*y + 1;
+    or, as in fuzzylite, with one coefficient per input then a constant:
+        TERM t := Linear 2 3 1;
+
+    The output is the weighted average (or sum) over the rules of the
+    values of their output terms, each weighted by the rule's activation
+    (its firing strength times its weight); see weighted.py.  Unlike COGS
+    with singletons, the term activations are not accumulated first, so
+    two rules with the same output term both count in full, whatever the
+    output's ACCU method.  (A constant term is just a singleton, so needs
+    nothing special.)
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LinearFunction(object):
+    '''
+        A constant plus a sum of coefficient*variable; the coefficients
+        are held in a dict mapping variable names to values.
+    '''
+    def __init__(self, coeffs=None, constant=0):
+        self.coeffs = OrderedDict(coeffs if coeffs else [])
+        self.constant = constant
+
+    def add(self, varname, coeff):
+        '''Add coeff*varname (or just coeff, if varname is None)'''
+        if varname is None:
+            self.constant += coeff
+        else:
+            self.coeffs[varname] = self.coeffs.get(varname, 0) + coeff
+
+    @property
+    def variables(self):
+        '''The names of the (input) variables used in this function'''
+        return list(self.coeffs.keys())
+
+    def __call__(self, inputs):
+        '''
+            Evaluate the function given a dict of variable names to values;
+            the values can be arrays (of the same shape), for a batch.
+        '''
+        result = self.constant
+        for varname, coeff in self.coeffs.items():
+            result = result + coeff * np.asarray(inputs[varname])
+        return result
+
+    def __repr__(self):
+        parts = ['{}*{}'.format(coeff, varname)
+                 for varname, coeff in self.coeffs.items()]
+        if self.constant or not parts:
+            parts.append('{}'.format(self.constant))
+        return ' + '.join(parts)
+
+
+def is_function_term(term):
+    '''Is this term a (TSK) function of the inputs?'''
+    return getattr(term, 'function', None) is not None
+
+
+def has_function_terms(fuzzyvar):
+    '''Does this variable have any (TSK) function terms?'''
+    return any(is_function_term(term) for term in fuzzyvar.terms.values())
+
+
+def function_positions(fuzzyvar, fixed_positions, inputs, shape=()):
+    '''
+        The position of each term, for each input: fixed positions for
+        the ordinary terms, and the function values for the TSK terms.
+        Returns an array of shape (shape + (terms,)).
+    '''
+    positions = []
+    for term, fixed in zip(fuzzyvar.terms.values(), fixed_positions):
+        value = term.function(inputs) if is_function_term(term) else fixed
+        positions.append(np.broadcast_to(value, shape))
+    return np.stack(positions, axis=-1)
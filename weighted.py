@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+    Weighted-average and weighted-sum defuzzification (FCL's COGS and
+    COGSS), where each term of an output stands for a single position,
+    weighted by that term's activation.
+
+    For a singleton term the position is just the singleton value, so when
+    all the terms are singletons we never look at the universe at all, and
+    the output is a dot product of the activations with the positions.
+    Any other term is represented by the centroid of its membership function.
+    TSK terms (see tsk.py) have a position that depends on the inputs,
+    and a TSK output is weighted by each rule's activation instead.
+
+    skfuzzy doesn't know these methods, so the parser leaves an output's
+    defuzzify_method as 'centroid' (so that a plain skfuzzy simulation
+    still works) and records the weighted method in weighted_method.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import skfuzzy
+
+import extramf
+import tsk
+
+
+def weighted_method(fuzzyvar):
+    '''The variable's weighted method, if it has one (otherwise None)'''
+    return getattr(fuzzyvar, 'weighted_method', None)
+
+
+def term_position(term, translate_mf=None):
+    '''The single point that stands for this term (NaN if a TSK term)'''
+    if tsk.is_function_term(term):
+        return np.nan
+    mf_def = getattr(term, 'mf_def', None)
+    if translate_mf and mf_def:
+        fname, params = mf_def
+        mf_func, _ = translate_mf(fname)
+        if mf_func is extramf.singletonmf:
+            return float(params[0])
+    return skfuzzy.defuzz(term.parent.universe, term.mf, 'centroid')
+
+
+def term_positions(fuzzyvar, translate_mf=None):
+    '''The positions for all the terms of a variable, as an array'''
+    return np.array([term_position(term, translate_mf)
+                     for term in fuzzyvar.terms.values()], dtype=np.float64)
+
+
+def weighted_sum(weights, positions):
+    '''
+        The sum of the positions, weighted by the term activations.
+        The weights can be a batch, i.e. have shape (..., terms); the
+        positions are either one per term, or one per term per input.
+    '''
+    if np.ndim(positions) == 1:
+        return np.dot(weights, positions)
+    return np.einsum('...t,...t->...', weights, positions)
+
+
+def weighted_average(weights, positions):
+    '''As for weighted_sum, but divided by the total weight'''
+    return weighted_sum(weights, positions) / np.sum(weights, axis=-1)
+
+
+# Keyed by our own method names (see _FCL_DEFUZZ in fcl_symbols):
+_WEIGHTED_DEFUZZ = OrderedDict([
+    ('wtaver', weighted_average),
+    ('wtsum',  weighted_sum),
+])